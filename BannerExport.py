@@ -0,0 +1,194 @@
+import os
+import csv
+import json
+import struct
+
+import numpy
+import BannerIcon
+
+from PIL import Image
+
+# Exports the icons and titles of many ROMs at once. Only each ROM's header fields and
+# its banner are read, so a whole collection can be gone through without loading any
+# ROM; the banners are decoded and the icons written in a process pool.
+
+ROM_EXTENSIONS = ('.nds', '.dsi', '.srl')
+
+HEADER_SIZE = 0x6C
+BANNER_OFFSET_POSITION = 0x68
+
+# Banner sizes by version; unknown versions are read as the original layout.
+BANNER_SIZES = {0x0001: 0x840, 0x0002: 0x940, 0x0003: 0xA40, BannerIcon.ANIMATED_VERSION: 0x23C0}
+
+MANIFEST_FIELDS = ('file', 'name', 'gameCode', 'icon', 'frames') + tuple(language.lower() for language in BannerIcon.TITLE_LANGUAGES) + ('error',)
+
+def FindROMs(paths):
+    # Files are taken as given; directories are searched for ROM files, in sorted order.
+    romFiles = []
+
+    for path in paths:
+        if not os.path.isdir(path):
+            romFiles.append(path)
+            continue
+
+        for dirPath, dirNames, fileNames in os.walk(path):
+            dirNames.sort()
+            romFiles.extend(os.path.join(dirPath, fileName) for fileName in sorted(fileNames)
+                            if fileName.lower().endswith(ROM_EXTENSIONS))
+
+    return romFiles
+
+
+def IconFileNames(romFiles):
+    # One PNG per ROM, named after it; ROMs with the same name in different directories get
+    # numbered, compared case-insensitively for the sake of the filesystems that do that.
+    used = set()
+    iconFileNames = []
+
+    for romFile in romFiles:
+        base = os.path.splitext(os.path.basename(romFile))[0]
+        iconFileName = base + '.png'
+        number = 2
+
+        while iconFileName.lower() in used:
+            iconFileName = base + '_' + str(number) + '.png'
+            number += 1
+
+        used.add(iconFileName.lower())
+        iconFileNames.append(iconFileName)
+
+    return iconFileNames
+
+
+def ReadHeaderAndBanner(fileName):
+    """
+    Reads the internal name, the game code and the banner of a ROM file without reading the
+    rest of it. The banner is None for ROMs without one. Raises OSError if the file can't
+    be read and ValueError if it's too short to be a ROM.
+    """
+    with open(fileName, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError('Not a DS ROM: the header is truncated')
+
+        name = header[0:12].decode('ascii', 'replace').rstrip('\0')
+        gameCode = header[12:16].decode('ascii', 'replace').rstrip('\0')
+        bannerOffset, = struct.unpack_from('<I', header, BANNER_OFFSET_POSITION)
+
+        if not bannerOffset:
+            return name, gameCode, None
+
+        f.seek(bannerOffset)
+        banner = f.read(2)
+        banner += f.read(BANNER_SIZES.get(int.from_bytes(banner, 'little'), BANNER_SIZES[0x0001]) - len(banner))
+
+    if len(banner) < BannerIcon.TITLES_OFFSET + len(BannerIcon.TITLE_LANGUAGES) * BannerIcon.TITLE_SIZE:
+        raise ValueError('The banner is truncated')
+
+    return name, gameCode, banner
+
+
+def SaveIcon(fileName, frames, durations):
+    # Animated icons are saved as animated PNGs, with durations in milliseconds.
+    images = [Image.fromarray(frame, 'RGBA') for frame in frames]
+
+    if len(images) == 1:
+        images[0].save(fileName, 'PNG')
+    else:
+        images[0].save(fileName, 'PNG', save_all=True, append_images=images[1:], loop=0,
+                       duration=[round(duration * 1000 / 60) for duration in durations])
+
+
+def ExportBanner(romFile, iconPath, animated):
+    # Runs in the pool. Returns the ROM's manifest record, with the error that stopped it,
+    # if any, rather than raising.
+    record = dict.fromkeys(MANIFEST_FIELDS, '')
+    record['file'] = romFile
+    record['frames'] = 0
+
+    try:
+        name, gameCode, banner = ReadHeaderAndBanner(romFile)
+        record['name'] = name
+        record['gameCode'] = gameCode
+
+        if banner is not None:
+            for language, title in zip(BannerIcon.TITLE_LANGUAGES, BannerIcon.DecodeTitles(banner)):
+                record[language.lower()] = title
+
+            if animated:
+                frames, durations = BannerIcon.DecodeAnimatedIcon(banner)
+            else:
+                frames, durations = BannerIcon.DecodeIcon(banner)[numpy.newaxis], [0]
+
+            SaveIcon(iconPath, frames, durations)
+            record['frames'] = len(frames)
+            record['icon'] = iconPath
+    except (OSError, ValueError) as e:
+        record['error'] = str(e)
+
+    return record
+
+
+def ExportBanners(task):
+    return [ExportBanner(*entry) for entry in task]
+
+
+class BannerExporter:
+
+    batchSize = 32
+
+    def __init__(self, romFiles, outputDirectory, animated=False, maxWorkers=None):
+        self.romFiles = romFiles
+        self.outputDirectory = outputDirectory
+        self.animated = animated
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.records = []
+
+    def MakeTasks(self):
+        entries = [(romFile, os.path.join(self.outputDirectory, iconFileName), self.animated)
+                   for romFile, iconFileName in zip(self.romFiles, IconFileNames(self.romFiles))]
+        return [entries[i:i + self.batchSize] for i in range(0, len(entries), self.batchSize)]
+
+    def Run(self):
+        os.makedirs(self.outputDirectory, exist_ok=True)
+        tasks = self.MakeTasks()
+
+        # Starting worker processes costs more than a single batch does on its own.
+        if len(tasks) <= 1 or self.maxWorkers == 1:
+            self.records = [record for task in tasks for record in ExportBanners(task)]
+            return
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(self.maxWorkers, len(tasks)), mp_context=multiprocessing.get_context('spawn')) as pool:
+            self.records = [record for records in pool.map(ExportBanners, tasks) for record in records]
+
+    def FailedRecords(self):
+        return [record for record in self.records if record['error']]
+
+    def SaveManifest(self, fileName):
+        # One record per ROM, in the order given; JSON or CSV depending on the extension.
+        # Icon paths are relative to the manifest.
+        manifestDirectory = os.path.dirname(os.path.abspath(fileName))
+        records = []
+
+        for record in self.records:
+            record = dict(record)
+            if record['icon']:
+                record['icon'] = os.path.relpath(os.path.abspath(record['icon']), manifestDirectory).replace(os.sep, '/')
+            records.append(record)
+
+        if fileName.lower().endswith('.csv'):
+            with open(fileName, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, MANIFEST_FIELDS)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(fileName, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=1)
+
+    def Summary(self):
+        failed = len(self.FailedRecords())
+        exported = sum(1 for record in self.records if record['icon'])
+        return str(exported) + ' icons exported from ' + str(len(self.records)) + ' ROMs, ' + str(failed) + ' failed.'
@@ -0,0 +1,117 @@
+import numpy
+
+# Decodes the icon and titles of a ROM's banner into plain arrays and strings, without
+# going through ndspy's per-color and per-tile conversions.
+#
+# Icons are 32x32 I4 bitmaps, stored as 4x4 tiles of 8x8 pixels with two pixels per byte
+# (low nibble first), and 16-color BGR555 palettes whose color 0 is transparent. DSi
+# banners (version 0x0103) add 8 bitmaps, 8 palettes and a 64-entry animation sequence.
+
+ICON_SIZE = 32
+TILE_SIZE = 8
+BITMAP_SIZE = ICON_SIZE * ICON_SIZE // 2
+PALETTE_SIZE = 16 * 2
+
+ICON_BITMAP_OFFSET = 0x20
+ICON_PALETTE_OFFSET = 0x220
+TITLES_OFFSET = 0x240
+TITLE_SIZE = 0x100
+TITLE_LANGUAGES = ('Japanese', 'English', 'French', 'German', 'Italian', 'Spanish')
+
+ANIMATED_VERSION = 0x0103
+ANIMATED_FRAME_COUNT = 8
+ANIMATED_BITMAPS_OFFSET = 0x1240
+ANIMATED_PALETTES_OFFSET = 0x2240
+ANIMATION_SEQUENCE_OFFSET = 0x2340
+ANIMATION_SEQUENCE_LENGTH = 64
+
+
+def DecodePalettes(data, count=1):
+    """
+    Decodes count consecutive BGR555 palettes into a (count, 16, 4) RGBA array, with each
+    palette's first color fully transparent.
+    """
+    colors = numpy.frombuffer(data, dtype='<u2', count=count * 16).reshape(count, 16)
+
+    rgba = numpy.empty((count, 16, 4), dtype=numpy.uint8)
+    for channel, shift in enumerate((0, 5, 10)):
+        # Expanded to 8 bits the way ndspy.color does it.
+        value = (colors >> shift) & 0x1F
+        rgba[..., channel] = value << 3 | value >> 2
+
+    rgba[..., 3] = 255
+    rgba[:, 0, 3] = 0
+    return rgba
+
+
+def DecodeBitmaps(data, count=1):
+    """
+    Decodes count consecutive tiled I4 icon bitmaps into a (count, 32, 32) array of
+    palette indices.
+    """
+    packed = numpy.frombuffer(data, dtype=numpy.uint8, count=count * BITMAP_SIZE)
+
+    indices = numpy.empty(packed.size * 2, dtype=numpy.uint8)
+    indices[0::2] = packed & 0x0F
+    indices[1::2] = packed >> 4
+
+    tilesPerRow = ICON_SIZE // TILE_SIZE
+    tiles = indices.reshape(count, tilesPerRow, tilesPerRow, TILE_SIZE, TILE_SIZE)
+    return tiles.transpose(0, 1, 3, 2, 4).reshape(count, ICON_SIZE, ICON_SIZE)
+
+
+def DecodeIcon(iconBanner):
+    # Returns the static icon as a (32, 32, 4) RGBA array.
+    data = memoryview(iconBanner)
+    palette = DecodePalettes(data[ICON_PALETTE_OFFSET:ICON_PALETTE_OFFSET + PALETTE_SIZE])[0]
+    return palette[DecodeBitmaps(data[ICON_BITMAP_OFFSET:ICON_BITMAP_OFFSET + BITMAP_SIZE])[0]]
+
+
+def IsAnimated(iconBanner):
+    end = ANIMATION_SEQUENCE_OFFSET + ANIMATION_SEQUENCE_LENGTH * 2
+    return len(iconBanner) >= end and int.from_bytes(iconBanner[0:2], 'little') == ANIMATED_VERSION
+
+
+def DecodeAnimatedIcon(iconBanner):
+    """
+    Returns the frames of a DSi banner's animated icon as an (n, 32, 32, 4) RGBA array,
+    in the order the animation sequence shows them, along with a list of how long each
+    frame is shown for in 60ths of a second. Banners without an animation give their
+    static icon as a single frame with a duration of 0.
+    """
+    if not IsAnimated(iconBanner):
+        return DecodeIcon(iconBanner)[numpy.newaxis], [0]
+
+    data = memoryview(iconBanner)
+    bitmaps = DecodeBitmaps(data[ANIMATED_BITMAPS_OFFSET:], ANIMATED_FRAME_COUNT)
+    palettes = DecodePalettes(data[ANIMATED_PALETTES_OFFSET:], ANIMATED_FRAME_COUNT)
+
+    sequence = numpy.frombuffer(data[ANIMATION_SEQUENCE_OFFSET:], dtype='<u2', count=ANIMATION_SEQUENCE_LENGTH)
+    # The sequence ends at its first zero entry.
+    end = numpy.flatnonzero(sequence == 0)
+    sequence = sequence[:end[0] if len(end) else len(sequence)]
+
+    if not len(sequence):
+        return DecodeIcon(iconBanner)[numpy.newaxis], [0]
+
+    bitmapIDs = (sequence >> 8) & 7
+    paletteIDs = (sequence >> 11) & 7
+    frames = palettes[paletteIDs[:, numpy.newaxis, numpy.newaxis], bitmaps[bitmapIDs]]
+
+    flipH = (sequence >> 14) & 1 == 1
+    flipV = (sequence >> 15) & 1 == 1
+    frames[flipH] = frames[flipH, :, ::-1]
+    frames[flipV] = frames[flipV, ::-1]
+
+    return frames, [int(duration) for duration in sequence & 0xFF]
+
+
+def DecodeTitles(iconBanner):
+    # Returns the titles in the order of TITLE_LANGUAGES.
+    titles = []
+
+    for i in range(len(TITLE_LANGUAGES)):
+        start = TITLES_OFFSET + i * TITLE_SIZE
+        titles.append(bytes(iconBanner[start:start + TITLE_SIZE]).decode('utf-16-le', 'replace').split('\0')[0])
+
+    return titles
@@ -0,0 +1,86 @@
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from ExtractionEngine import MANIFEST_NAME
+
+class ImportCancelled(Exception):
+    pass
+
+
+class ImportFolder:
+
+    # A host directory tree to be imported. Files are [name, path, data] lists whose data is
+    # filled in by ImportReader; folders are (name, ImportFolder) pairs like ndspy's.
+
+    def __init__(self):
+        self.files = []
+        self.folders = []
+
+    @classmethod
+    def FromPaths(cls, paths):
+        # Dropped or chosen directories become folders of their own; files go in directly.
+        root = cls()
+
+        for path in paths:
+            path = os.path.normpath(path)
+            if os.path.isdir(path):
+                root.folders.append((os.path.basename(path), cls.Scan(path)))
+            elif os.path.isfile(path):
+                root.files.append([os.path.basename(path), path, None])
+
+        return root
+
+    @classmethod
+    def Scan(cls, dirPath):
+        folder = cls()
+
+        for entry in sorted(os.scandir(dirPath), key=lambda entry: entry.name):
+            if entry.is_dir():
+                folder.folders.append((entry.name, cls.Scan(entry.path)))
+            elif entry.is_file() and entry.name != MANIFEST_NAME:
+                # An incremental extraction's manifest isn't one of the extracted files.
+                folder.files.append([entry.name, entry.path, None])
+
+        return folder
+
+    def AllFiles(self):
+        yield from self.files
+        for _folderName, childFolder in self.folders:
+            yield from childFolder.AllFiles()
+
+    def AllFolders(self):
+        # Preorder, which is also the order new folders take their IDs in.
+        yield self
+        for _folderName, childFolder in self.folders:
+            yield from childFolder.AllFolders()
+
+
+class ImportReader:
+
+    def __init__(self, root, reporter=None, maxWorkers=None):
+        self.root = root
+        self.reporter = reporter
+        self.maxWorkers = maxWorkers or min(32, (os.cpu_count() or 1) * 4)
+        self.cancelEvent = threading.Event()
+
+    def Cancel(self):
+        self.cancelEvent.set()
+
+    def ReadFile(self, entry):
+        if self.cancelEvent.is_set():
+            return
+
+        with open(entry[1], 'rb') as f:
+            entry[2] = f.read()
+
+        if self.reporter is not None:
+            self.reporter.Advance(1, len(entry[2]))
+
+    def Run(self):
+        with ThreadPoolExecutor(self.maxWorkers) as pool:
+            for future in [pool.submit(self.ReadFile, entry) for entry in self.root.AllFiles()]:
+                future.result()
+
+        if self.cancelEvent.is_set():
+            raise ImportCancelled
@@ -0,0 +1,43 @@
+from ExtractionEngine import HashData
+
+class BlobStore:
+
+    # File data by content. Each distinct content is held once, however many file IDs have
+    # it, and counted so that it's dropped once the last of them is replaced or removed.
+    # Only bytes are shared; other data is passed through as it is.
+
+    def __init__(self):
+        self.blobs = {}
+        self.digests = {}
+
+    def Add(self, data):
+        # Returns what to store for a file: the copy of data that's already held, if any.
+        if type(data) is not bytes:
+            return data
+
+        digest = self.Digest(data)
+        blob = self.blobs.get(digest)
+
+        if blob is None:
+            blob = self.blobs[digest] = [data, 0]
+            self.digests[id(data)] = digest
+
+        blob[1] += 1
+        return blob[0]
+
+    def Release(self, data):
+        # Held data is alive, so nothing else can have its id.
+        digest = self.digests.get(id(data))
+        if digest is None:
+            return
+
+        blob = self.blobs[digest]
+        blob[1] -= 1
+        if not blob[1]:
+            del self.blobs[digest]
+            del self.digests[id(data)]
+
+    def Digest(self, data):
+        # Data that's held is only hashed once.
+        digest = self.digests.get(id(data))
+        return digest if digest is not None else HashData(data)
@@ -0,0 +1,149 @@
+import threading
+import OverlayDecoder
+
+from concurrent.futures import ThreadPoolExecutor
+from ndspy import Processor
+
+class CodeLoader:
+
+    # Owns the parsed main code files and overlays of the open ROM and re-parses them on a
+    # shared pool after edits. Loads are keyed by (processor, main); starting a load for a
+    # key supersedes the one pending for it, and a result is only applied once it is waited
+    # for, on the thread that asked for the code.
+
+    def __init__(self, maxWorkers=4):
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='CodeLoader')
+        self.decoder = OverlayDecoder.OverlayDecoder()
+        self.lock = threading.Lock()
+        self.mainFiles = {Processor.ARM9: None, Processor.ARM7: None}
+        self.overlays = {Processor.ARM9: None, Processor.ARM7: None}
+        self.modifiedOverlays = {}
+        self.pending = {}
+
+    def SetCode(self, arm9File, arm7File, overlays9, overlays7):
+        self.Clear()
+        self.mainFiles = {Processor.ARM9: arm9File, Processor.ARM7: arm7File}
+        self.overlays = {Processor.ARM9: overlays9, Processor.ARM7: overlays7}
+
+    def Clear(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        for future, _overlayIDs in pending.values():
+            future.cancel()
+
+        self.modifiedOverlays = {}
+        self.mainFiles = {Processor.ARM9: None, Processor.ARM7: None}
+        self.overlays = {Processor.ARM9: None, Processor.ARM7: None}
+
+    def MainFile(self, processor):
+        self.Wait(processor, True)
+        return self.mainFiles[processor]
+
+    def Overlays(self, processor):
+        self.Wait(processor, False)
+        return self.overlays[processor]
+
+    def OverlayObjects(self, processor):
+        # The overlays as they are, for when their data isn't needed and a load still
+        # decoding it shouldn't be waited for.
+        return self.overlays[processor]
+
+    def SetOverlays(self, processor, overlays):
+        self.Wait(processor, False)
+        self.overlays[processor] = overlays
+
+    def ReplaceOverlayData(self, overlay, data):
+        # Gives an overlay new decoded data; its file is only rebuilt by WriteBackOverlays.
+        self.Wait(Processor.ARM9, False)
+        self.Wait(Processor.ARM7, False)
+
+        overlay.data = bytearray(data)
+        self.modifiedOverlays[id(overlay)] = overlay
+
+    def WriteBackOverlays(self, rom):
+        # Compresses the overlays whose data was replaced and puts them in the ROM's files, the
+        # way Overlay.save() would. Returns whether any were written, in which case the
+        # overlay tables need saving. Overlay file IDs must be current.
+        current = {id(ov) for processor in (Processor.ARM9, Processor.ARM7) for ov in self.Overlays(processor).values()}
+        modified = [ov for key, ov in self.modifiedOverlays.items() if key in current]
+        self.modifiedOverlays = {}
+
+        encoded = self.decoder.Encode([(ov.fileID, ov.data, ov.compressed) for ov in modified])
+
+        for ov, fileData in zip(modified, encoded):
+            ov.ramSize = len(ov.data)
+            ov.compressedSize = len(fileData)
+            rom.files[ov.fileID] = fileData
+
+        return bool(modified)
+
+    def LoadOverlays(self, rom, processor, decode=True):
+        # Parses a whole overlay table; safe to call from the ROM loading thread.
+        if processor == Processor.ARM9:
+            return self.decoder.LoadOverlays(rom.arm9OverlayTable, rom.files, decode)
+        return self.decoder.LoadOverlays(rom.arm7OverlayTable, rom.files, decode)
+
+    def LoadInBackground(self, rom, overlays9, overlays7):
+        # Takes over undecoded overlays and parses all the code on the pool; anything asking
+        # for code in the meantime waits for its part.
+        self.SetCode(None, None, overlays9, overlays7)
+
+        for processor in (Processor.ARM9, Processor.ARM7):
+            self.ReloadMain(rom, processor)
+            self.ReloadOverlays(rom, processor)
+
+    def Submit(self, key, function, overlayIDs=None):
+        with self.lock:
+            superseded = self.pending.get(key)
+            self.pending[key] = (self.executor.submit(function), overlayIDs)
+
+        if superseded is not None:
+            superseded[0].cancel()
+
+    def ReloadMain(self, rom, processor):
+        import ndspy.code
+
+        # The code is read here rather than on the pool, so later edits can't race the parse.
+        if processor == Processor.ARM9:
+            args = (rom.arm9, rom.arm9RamAddress, rom.arm9CodeSettingsPointerAddress)
+        else:
+            args = (rom.arm7, rom.arm7RamAddress, rom.arm7CodeSettingsPointerAddress)
+
+        self.Submit((processor, True), lambda: ndspy.code.MainCodeFile(*args))
+
+    def ReloadOverlays(self, rom, processor, overlayIDs=None):
+        # Re-parses the given overlays (all of them by default) from their files. The overlay
+        # objects are kept and only get new data, so references to them stay valid. Overlay
+        # file IDs must be current.
+        overlays = self.overlays[processor]
+        if overlayIDs is None:
+            overlayIDs = set(overlays)
+
+        with self.lock:
+            superseded = self.pending.get((processor, False))
+            if superseded is not None:
+                # The superseded load is dropped, so this one covers its overlays too.
+                overlayIDs = set(overlayIDs) | superseded[1]
+
+        reloaded = [overlays[ovID] for ovID in overlayIDs if ovID in overlays]
+        entries = [(ov.fileID, rom.files[ov.fileID], ov.compressed) for ov in reloaded]
+
+        self.Submit((processor, False), lambda: list(zip(reloaded, self.decoder.Decode(entries))), set(overlayIDs))
+
+    def Wait(self, processor, main):
+        key = (processor, main)
+
+        with self.lock:
+            pending = self.pending.pop(key, None)
+
+        if pending is None:
+            return
+
+        result = pending[0].result()
+
+        if main:
+            self.mainFiles[processor] = result
+        else:
+            for ov, data in result:
+                ov.data = data
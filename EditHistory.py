@@ -0,0 +1,633 @@
+import tempfile
+import LazyROM
+
+from ndspy import Processor
+
+# ROM attributes that edits can replace, besides the files.
+ROM_ATTRIBUTES = ('arm9', 'arm7', 'arm9PostData', 'arm9OverlayTable', 'arm7OverlayTable')
+
+class SpilledData:
+
+    # File data that was moved out of memory into the history's spill file.
+
+    __slots__ = ('offset', 'size')
+
+    def __init__(self, offset, size):
+        self.offset = offset
+        self.size = size
+
+
+class EditStep:
+
+    # One undoable edit, as the changes it made in the order it made them: splices of the
+    # file list (references to the data, never copies) and of folders' file and folder
+    # lists, replaced overlay tables and overlay data, and the file ID index's own log of
+    # what it did. Replaced ROM attributes are kept as their values before and after, and
+    # the edit as it was journaled, if it was, so that redoing it can be journaled the same.
+    # journaled is whether the journal has the step, so that undoing it can be journaled as
+    # undoing it.
+
+    def __init__(self, label, attributes, entry):
+        self.label = label
+        self.entry = entry
+        self.journaled = entry is not None
+        self.attributes = attributes
+        self.changes = []
+        self.index = []
+
+
+def FileEntries(rom):
+    # What each file ID holds: a mapped range or data for lazily loaded ROMs, data otherwise.
+    return rom.files.entries if LazyROM.IsLazy(rom) else rom.files
+
+
+def SetFileEntries(rom, start, end, entries):
+    if LazyROM.IsLazy(rom):
+        rom.files.SetEntries(start, end, entries)
+    else:
+        rom.files[start : end] = entries
+
+
+def DecodedFrom(session):
+    # {id(overlay): the file entry it was decoded from}
+    code = session.codeLoader
+
+    # Loads still pending would otherwise apply their data over what's put back.
+    for processor in (Processor.ARM9, Processor.ARM7):
+        code.Wait(processor, True)
+        code.Wait(processor, False)
+
+    entries = FileEntries(session.rom)
+    decodedFrom = {}
+
+    if code.OverlayObjects(Processor.ARM9) is not None:
+        for processor in (Processor.ARM9, Processor.ARM7):
+            for ov in code.OverlayObjects(processor).values():
+                fileID = session.OverlayFileID(ov)
+                decodedFrom[id(ov)] = entries[fileID] if fileID < len(entries) else None
+
+    return decodedFrom
+
+
+def Reload(session, decodedFrom):
+    # {processor: overlay IDs} of the unmodified overlays whose files aren't the ones their
+    # data was decoded from.
+    code = session.codeLoader
+    entries = FileEntries(session.rom)
+    reload = {}
+
+    if code.OverlayObjects(Processor.ARM9) is not None:
+        for processor in (Processor.ARM9, Processor.ARM7):
+            reload[processor] = set()
+            for overlayID, ov in code.OverlayObjects(processor).items():
+                fileID = session.OverlayFileID(ov)
+                if id(ov) not in code.modifiedOverlays and fileID < len(entries) and decodedFrom.get(id(ov)) is not entries[fileID]:
+                    reload[processor].add(overlayID)
+
+    return reload
+
+
+class ChangeList:
+
+    # The changes undoing or redoing a step makes, in terms another session of the same ROM
+    # can make them in: folders by their positions in the tree, overlays by their IDs and
+    # files by their data. Folders and overlays that aren't in the ROM are numbered as they
+    # leave it, or described in full the first time they're needed if they never were in
+    # it. Everything is made of lists, strings, numbers and bytes, so it can be journaled.
+    # Changes that redo a step have its label, for the edit they're made as to have.
+
+    def __init__(self, changes=None, label=None):
+        self.changes = [] if changes is None else changes
+        self.label = label
+        self.numbers = {}
+        self.objects = []
+        self.parents = {}
+        self.lists = {}
+
+    def Attributes(self):
+        return {change[1] for change in self.changes if change[0] == 'attribute'}
+
+    def Number(self, value):
+        # Both sessions number the same objects in the same order.
+        if id(value) not in self.numbers:
+            self.numbers[id(value)] = len(self.objects)
+            self.objects.append(value)
+
+    # Recording, as EditHistory.Apply makes the changes
+
+    def Start(self, session):
+        self.root = session.rom.filenames
+        self.code = session.codeLoader
+        self.Know(self.root, None)
+
+    def Know(self, folder, parent):
+        # Keeps track of where the folders are, as folders don't know their parents.
+        if parent is not None:
+            self.parents[id(folder)] = parent
+        self.lists[id(folder.files)] = (folder, 'files')
+        self.lists[id(folder.folders)] = (folder, 'folders')
+
+        for _folderName, childFolder in folder.folders:
+            self.Know(childFolder, folder)
+
+    def Tree(self, folder):
+        return [folder.firstID, list(folder.files), [[folderName, self.Tree(childFolder)] for folderName, childFolder in folder.folders]]
+
+    def FolderReference(self, folder):
+        positions = []
+        while folder is not self.root and id(folder) in self.parents:
+            parent = self.parents[id(folder)]
+            positions.append(next(i for i, (_folderName, childFolder) in enumerate(parent.folders) if childFolder is folder))
+            folder = parent
+        positions.reverse()
+
+        if folder is self.root:
+            return ['root', positions]
+        elif id(folder) in self.numbers:
+            return ['object', self.numbers[id(folder)], positions]
+
+        self.Number(folder)
+        self.Know(folder, None)
+        return ['folder', self.numbers[id(folder)], self.Tree(folder), positions]
+
+    def OverlayReference(self, overlay, modified=()):
+        if id(overlay) in self.numbers:
+            return ['object', self.numbers[id(overlay)], []]
+
+        for processor in (Processor.ARM9, Processor.ARM7):
+            for overlayID, ov in self.code.OverlayObjects(processor).items():
+                if ov is overlay:
+                    return ['overlay', int(processor), overlayID]
+
+        # Only the data of modified overlays is needed; the others are decoded from their files.
+        self.Number(overlay)
+        table = [overlay.ramAddress, overlay.ramSize, overlay.bssSize, overlay.staticInitStart,
+                 overlay.staticInitEnd, overlay.fileID, overlay.compressedSize, overlay.flags]
+        return ['new overlay', self.numbers[id(overlay)], table, bytes(overlay.data) if id(overlay) in modified else None]
+
+    def Reference(self, segment):
+        import ndspy.fnt
+
+        if isinstance(segment, ndspy.fnt.Folder):
+            return self.FolderReference(segment)
+        return self.OverlayReference(segment)
+
+    def Files(self, rom, start, oldCount, count):
+        # After the change, as that's when the data is where it can be read.
+        self.changes.append(['files', start, oldCount, [bytes(rom.files[i]) for i in range(start, start + count)]])
+
+    def Items(self, items, start, oldCount, newItems):
+        folder, attribute = self.lists[id(items)]
+        reference = self.FolderReference(folder)
+
+        if attribute == 'files':
+            self.changes.append(['items', reference, attribute, start, oldCount, list(newItems)])
+            return
+
+        newFolders = [[folderName, self.FolderReference(childFolder)] for folderName, childFolder in newItems]
+        self.changes.append(['items', reference, attribute, start, oldCount, newFolders])
+
+        kept = {id(childFolder) for _folderName, childFolder in newItems}
+        for _folderName, childFolder in items[start : start + oldCount]:
+            if id(childFolder) not in kept:
+                self.Number(childFolder)
+                self.parents.pop(id(childFolder), None)
+        for _folderName, childFolder in newItems:
+            self.Know(childFolder, folder)
+
+    def Overlays(self, processor, overlays, modified):
+        current = self.code.OverlayObjects(processor)
+        entries = [[overlayID, self.OverlayReference(ov, modified)] for overlayID, ov in sorted(overlays.items())]
+        self.changes.append(['overlays', int(processor), entries])
+
+        kept = {id(ov) for ov in overlays.values()}
+        for _overlayID, ov in sorted(current.items()):
+            if id(ov) not in kept:
+                self.Number(ov)
+
+    def Index(self, log):
+        # What the file ID index did, as what it logged; where a segment was removed from
+        # is worked out again when it's removed.
+        for kind, segment, *args in log:
+            self.changes.append(['index', kind, self.Reference(segment)] + (args if kind != 'remove' else []))
+
+    def Attribute(self, name, value):
+        self.changes.append(['attribute', name, value])
+
+    def OverlayData(self, overlay, modified):
+        self.changes.append(['overlayData', self.OverlayReference(overlay), bytes(overlay.data), modified])
+
+    # Making the changes again, in another session
+
+    def Resolve(self, session, reference):
+        kind = reference[0]
+
+        if kind == 'overlay':
+            return session.OverlayObjects(Processor(reference[1]))[reference[2]]
+        elif kind == 'new overlay':
+            import ndspy.code
+
+            _kind, _number, (ramAddress, ramSize, bssSize, staticInitStart, staticInitEnd, fileID, compressedSize, flags), data = reference
+            # Built as uncompressed so ndspy doesn't decompress it, then given its real flags.
+            overlay = ndspy.code.Overlay(b'', ramAddress, ramSize, bssSize, staticInitStart, staticInitEnd, fileID, compressedSize, flags & ~1)
+            overlay.flags = flags
+            if data is not None:
+                overlay.data = bytearray(data)
+                session.codeLoader.modifiedOverlays[id(overlay)] = overlay
+            self.Number(overlay)
+            return overlay
+
+        if kind == 'root':
+            folder = session.rom.filenames
+        elif kind == 'object':
+            folder = self.objects[reference[1]]
+        else:
+            folder = self.Folder(reference[2])
+            self.Number(folder)
+
+        for position in reference[-1]:
+            folder = folder.folders[position][1]
+        return folder
+
+    def Folder(self, tree):
+        import ndspy.fnt
+
+        firstID, files, folders = tree
+        return ndspy.fnt.Folder([(folderName, self.Folder(childTree)) for folderName, childTree in folders], list(files), firstID)
+
+    def Make(self, session):
+        # Through the session, so that its history records the changes as an edit.
+        for change in self.changes:
+            kind = change[0]
+
+            if kind == 'files':
+                _kind, start, oldCount, data = change
+                session.SetFiles(start, start + oldCount, data)
+            elif kind == 'items':
+                _kind, reference, attribute, start, oldCount, newItems = change
+                items = getattr(self.Resolve(session, reference), attribute)
+                if attribute == 'folders':
+                    newItems = [(folderName, self.Resolve(session, childReference)) for folderName, childReference in newItems]
+                    kept = {id(childFolder) for _folderName, childFolder in newItems}
+                    for _folderName, childFolder in items[start : start + oldCount]:
+                        if id(childFolder) not in kept:
+                            self.Number(childFolder)
+                session.SetItems(items, start, start + oldCount, newItems)
+            elif kind == 'overlays':
+                _kind, processor, entries = change
+                processor = Processor(processor)
+                current = session.OverlayObjects(processor)
+                overlays = {overlayID: self.Resolve(session, reference) for overlayID, reference in entries}
+                kept = {id(ov) for ov in overlays.values()}
+                for _overlayID, ov in sorted(current.items()):
+                    if id(ov) not in kept:
+                        self.Number(ov)
+                session.SetOverlays(processor, overlays)
+            elif kind == 'index':
+                _kind, method, reference, *args = change
+                fileIDs = session.FileIDs()
+                method = {'add': fileIDs.AddFiles, 'append': fileIDs.AppendSegment,
+                          'remove': fileIDs.RemoveSegment, 'insert': fileIDs.InsertSegment}[method]
+                method(self.Resolve(session, reference), *args)
+            elif kind == 'attribute':
+                _kind, name, value = change
+                if name not in ROM_ATTRIBUTES:
+                    raise ValueError('Not a ROM attribute: ' + name)
+                setattr(session.rom, name, value)
+            elif kind == 'overlayData':
+                _kind, reference, data, modified = change
+                overlay = self.Resolve(session, reference)
+                session.ReplaceOverlayData(overlay, data)
+                if not modified:
+                    session.codeLoader.modifiedOverlays.pop(id(overlay), None)
+            else:
+                raise ValueError('Unknown change: ' + str(kind))
+
+
+class EditHistory:
+
+    """
+    Undo and redo for a ROMSession. Each edit is recorded as an EditStep holding only the
+    changes it made, which the session reports as it makes them, so recording costs the
+    size of the edit rather than of the ROM. Replaced and removed file data stays
+    referenced rather than copied; files still mapped from the ROM file cost nothing, and
+    data that's only kept for the history is moved to a temporary spill file, oldest
+    first, once it takes more than memoryLimit bytes, to be read back if its edit is
+    undone or redone.
+    """
+
+    memoryLimit = 256 * 1024 * 1024
+    maxSteps = 200
+
+    def __init__(self, memoryLimit=None):
+        if memoryLimit is not None:
+            self.memoryLimit = memoryLimit
+
+        self.steps = []
+        self.position = 0
+        self.step = None
+        self.indexLog = []
+        self.spillFile = None
+        self.spillSize = 0
+
+    def Close(self):
+        self.steps = []
+        self.position = 0
+        self.step = None
+        if self.spillFile is not None:
+            self.spillFile.close()
+            self.spillFile = None
+            self.spillSize = 0
+
+    def CanUndo(self):
+        return self.position > 0
+
+    def CanRedo(self):
+        return self.position < len(self.steps)
+
+    def UndoLabel(self):
+        return self.steps[self.position - 1].label if self.CanUndo() else None
+
+    def RedoLabel(self):
+        return self.steps[self.position].label if self.CanRedo() else None
+
+    def UndoStep(self):
+        return self.steps[self.position - 1] if self.CanUndo() else None
+
+    def RedoStep(self):
+        return self.steps[self.position] if self.CanRedo() else None
+
+    def SetJournaled(self, journaled):
+        for step in self.steps:
+            step.journaled = journaled
+
+    def Discard(self):
+        # Forgets the steps that could be redone.
+        del self.steps[self.position:]
+
+    # Recording
+
+    def Begin(self, session, label, entry=None):
+        self.step = EditStep(label, {name: getattr(session.rom, name) for name in ROM_ATTRIBUTES}, entry)
+        del self.indexLog[:]
+
+    def End(self, session):
+        step, self.step = self.step, None
+        step.index = self.indexLog[:]
+        del self.indexLog[:]
+
+        rom = session.rom
+        step.attributes = {name: {False: value, True: getattr(rom, name)} for name, value in step.attributes.items()
+                           if value is not getattr(rom, name) and value != getattr(rom, name)}
+
+        if not step.changes and not step.index and not step.attributes:
+            return
+
+        del self.steps[self.position:]
+        self.steps.append(step)
+        if len(self.steps) > self.maxSteps:
+            del self.steps[0]
+        self.position = len(self.steps)
+        self.LimitMemory(rom)
+
+    # The changes the session makes through the history while an edit is being recorded.
+
+    def SetFiles(self, rom, start, end, data):
+        # The new entries are read back, as lazily loaded ROMs store data in their own way.
+        entries = FileEntries(rom)
+        before = entries[start : end]
+        rom.files[start : end] = data
+
+        if self.step is not None:
+            self.step.changes.append(('files', start, before, entries[start : start + len(data)]))
+
+    def SetItems(self, items, start, end, newItems):
+        before = items[start : end]
+        items[start : end] = newItems
+
+        if self.step is not None:
+            self.step.changes.append(('items', items, start, before, list(newItems)))
+
+    def SetOverlays(self, code, processor, overlays):
+        # Which overlays were modified is kept, as saving forgets it for ones that are gone.
+        before = code.OverlayObjects(processor)
+        code.SetOverlays(processor, overlays)
+
+        if self.step is not None:
+            modified = {id(ov) for ov in before.values() if id(ov) in code.modifiedOverlays}
+            self.step.changes.append(('overlays', processor, before, overlays, modified))
+
+    def ReplaceOverlayData(self, session, overlay, data):
+        # Besides its data, whether an overlay was modified is put back, with the file entry
+        # that unmodified data was decoded from.
+        code = session.codeLoader
+        code.Wait(Processor.ARM9, False)
+        code.Wait(Processor.ARM7, False)
+
+        entry = FileEntries(session.rom)[session.OverlayFileID(overlay)]
+        before = (overlay.data, id(overlay) in code.modifiedOverlays, entry)
+        code.ReplaceOverlayData(overlay, data)
+
+        if self.step is not None:
+            self.step.changes.append(('overlayData', overlay, before, (overlay.data, True, entry)))
+
+    # Undoing and redoing
+
+    def Undo(self, session, changes=None):
+        # Puts the ROM back as it was before the last edit. Returns the step undone and what
+        # has to be decoded again, as Apply does.
+        self.position -= 1
+        step = self.steps[self.position]
+        return step, self.Apply(session, step, False, changes)
+
+    def Redo(self, session, changes=None):
+        step = self.steps[self.position]
+        self.position += 1
+        return step, self.Apply(session, step, True, changes)
+
+    def Apply(self, session, step, after, changes=None):
+        # Makes the step's changes again, or takes them back in the opposite order, recording
+        # them in a ChangeList if one is given. Returns {processor: overlay IDs} of the
+        # overlays whose files aren't the ones their data was decoded from; the session's
+        # path index is out of date until it's handled.
+        rom = session.rom
+        code = session.codeLoader
+        decodedFrom = DecodedFrom(session)
+        restored = []
+
+        if changes is not None:
+            changes.Start(session)
+
+        for change in (step.changes if after else reversed(step.changes)):
+            kind = change[0]
+
+            if kind == 'files':
+                _kind, start, before, afterEntries = change
+                old, new = (before, afterEntries) if after else (afterEntries, before)
+                SetFileEntries(rom, start, start + len(old), [self.Load(entry) for entry in new])
+                if changes is not None:
+                    changes.Files(rom, start, len(old), len(new))
+            elif kind == 'items':
+                _kind, items, start, before, afterItems = change
+                old, new = (before, afterItems) if after else (afterItems, before)
+                if changes is not None:
+                    changes.Items(items, start, len(old), new)
+                items[start : start + len(old)] = new
+            elif kind == 'overlays':
+                _kind, processor, before, afterOverlays, modified = change
+                if changes is not None:
+                    changes.Overlays(processor, afterOverlays if after else before, modified)
+                code.overlays[processor] = afterOverlays if after else before
+                for ov in code.overlays[processor].values():
+                    if id(ov) in modified and id(ov) not in decodedFrom:
+                        code.modifiedOverlays[id(ov)] = ov
+            elif kind == 'overlayData':
+                _kind, overlay, before, afterState = change
+                state = afterState if after else before
+                overlay.data = state[0]
+                restored.append((overlay, state))
+
+        if step.index:
+            # The index logs what it does, which isn't part of this step but is what the
+            # change list records.
+            index = session.FileIDs()
+            log, index.log = index.log, ([] if changes is not None else None)
+            try:
+                if after:
+                    for change in step.index:
+                        index.Repeat(change)
+                else:
+                    for change in reversed(step.index):
+                        index.Revert(change)
+                if changes is not None:
+                    changes.Index(index.log)
+            finally:
+                index.log = log
+
+        for name, values in step.attributes.items():
+            setattr(rom, name, values[after])
+            if changes is not None:
+                changes.Attribute(name, values[after])
+
+        # Unmodified data is only put back as such if its file is still the one it was
+        # decoded from; otherwise saving has to write it back.
+        entries = FileEntries(rom)
+        for overlay, (_data, modified, entry) in restored:
+            if modified or entries[session.OverlayFileID(overlay)] is not entry:
+                code.modifiedOverlays[id(overlay)] = overlay
+            else:
+                code.modifiedOverlays.pop(id(overlay), None)
+            if changes is not None:
+                changes.OverlayData(overlay, id(overlay) in code.modifiedOverlays)
+
+        reload = Reload(session, decodedFrom)
+        self.LimitMemory(rom)
+        return reload
+
+    # Memory
+
+    def EntryLists(self):
+        # Every list of file entries the history holds, oldest first.
+        for step in self.steps:
+            for change in step.changes:
+                if change[0] == 'files':
+                    yield change[2]
+                    yield change[3]
+
+    def Load(self, entry):
+        if not isinstance(entry, SpilledData):
+            return entry
+
+        self.spillFile.seek(entry.offset)
+        return self.spillFile.read(entry.size)
+
+    def Spill(self, data):
+        if self.spillFile is None:
+            self.spillFile = tempfile.TemporaryFile(prefix='ndspy-gui-undo-')
+
+        self.spillFile.seek(self.spillSize)
+        self.spillFile.write(data)
+        spilled = SpilledData(self.spillSize, len(data))
+        self.spillSize += len(data)
+        return spilled
+
+    def ReplaceEntries(self, replacements):
+        # Replaces entries throughout the history, by id for data and by value for ranges.
+        for middle in self.EntryLists():
+            for i, entry in enumerate(middle):
+                key = entry if isinstance(entry, tuple) else id(entry)
+                if key in replacements:
+                    middle[i] = replacements[key]
+
+    def LimitMemory(self, rom):
+        # Only data that the ROM itself no longer has counts, but which data that is is only
+        # worked out once the data held at all goes over the limit.
+        held = {}
+        for middle in self.EntryLists():
+            for entry in middle:
+                if not isinstance(entry, (tuple, SpilledData)):
+                    held.setdefault(id(entry), entry)
+
+        if sum(len(entry) for entry in held.values()) <= self.memoryLimit:
+            return
+
+        # A lazily loaded ROM's store holds exactly the bytes its files have.
+        if LazyROM.IsLazy(rom):
+            digests = rom.files.store.digests
+            held = {key: entry for key, entry in held.items() if type(entry) is not bytes or key not in digests}
+        else:
+            current = {id(entry) for entry in rom.files}
+            held = {key: entry for key, entry in held.items() if key not in current}
+
+        total = sum(len(entry) for entry in held.values())
+        if total <= self.memoryLimit:
+            return
+
+        # held is in the order of the steps, oldest first.
+        replacements = {}
+        for key, entry in held.items():
+            replacements[key] = self.Spill(entry)
+            total -= len(entry)
+            if total <= self.memoryLimit:
+                break
+
+        self.ReplaceEntries(replacements)
+
+        # Journal entries would keep spilled data in memory; redoing those steps is
+        # journaled by label instead.
+        for step in self.steps:
+            if step.entry is not None and any(id(blob) in replacements for blob in step.entry[1]):
+                step.entry = None
+
+    # Saving
+
+    def BeforeSave(self, rom):
+        # Ranges of the mapped ROM file that only the history refers to won't survive saving,
+        # which rewrites or replaces the file, so their data is spilled first.
+        if not LazyROM.IsLazy(rom) or not self.steps:
+            return None
+
+        files = rom.files
+        current = set(entry for entry in files.entries if isinstance(entry, tuple))
+        replacements = {}
+
+        for middle in self.EntryLists():
+            for entry in middle:
+                if isinstance(entry, tuple) and entry not in current and entry not in replacements:
+                    replacements[entry] = self.Spill(files.romView[entry[0] : entry[1]])
+
+        self.ReplaceEntries(replacements)
+        return list(files.entries)
+
+    def AfterSave(self, rom, entriesBefore):
+        # Points the history at where files are in the saved ROM file; data held for files
+        # that are now mapped from it is dropped.
+        if entriesBefore is None or not LazyROM.IsLazy(rom) or len(entriesBefore) != len(rom.files.entries):
+            return
+
+        replacements = {}
+        for old, new in zip(entriesBefore, rom.files.entries):
+            if isinstance(new, tuple):
+                replacements[old if isinstance(old, tuple) else id(old)] = new
+
+        self.ReplaceEntries(replacements)
@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+
+from ndspy import Processor
+
+JOURNAL_MAGIC = b'NDSJRNL\x00'
+JOURNAL_VERSION = 1
+
+# Each record is its body's length and CRC-32, then the body: the JSON document's length,
+# the document, and the file data it refers to, back to back.
+RECORD_HEADER = struct.Struct('<II')
+LENGTH = struct.Struct('<I')
+
+def JournalFileName(romFileName):
+    return romFileName + '.journal'
+
+
+def ROMKey(romFileName):
+    # The version of the ROM file the edits were made to. The path is left out, so that a
+    # ROM moved along with its journal can still be recovered.
+    import ROMIndexCache
+
+    key = ROMIndexCache.ROMIndex.Key(romFileName)
+    del key['path']
+    return key
+
+
+# Edit arguments. Folders are saved as their paths and overlays as their IDs, as they were
+# when the edit was made, and file data goes after the document rather than in it.
+
+def Encode(session, value, blobs):
+    import ndspy.fnt
+    import BatchImport
+    import EditHistory
+    import ReplacementEngine
+
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    elif isinstance(value, Processor):
+        return {'processor': int(value)}
+    elif isinstance(value, int):
+        return value
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        blobs.append(value)
+        return {'data': len(blobs) - 1}
+    elif isinstance(value, ndspy.fnt.Folder):
+        names = []
+        while value is not session.rom.filenames:
+            names.append(session.paths.FolderName(value))
+            value = session.paths.ParentFolder(value)
+        return {'folder': names[::-1]}
+    elif isinstance(value, BatchImport.ImportFolder):
+        return {'import': EncodeImport(session, value, blobs)}
+    elif isinstance(value, ReplacementEngine.ReplacementEngine):
+        return {'replacement': [[fileID, attribute, EncodeOverlay(session, overlay), Encode(session, fileData, blobs)]
+                                for fileID, attribute, overlay, fileData in value.changes]}
+    elif isinstance(value, EditHistory.ChangeList):
+        return {'changes': EncodeChanges(value.changes, blobs), 'label': value.label}
+
+    raise TypeError('Edits can\'t be journaled with a ' + type(value).__name__)
+
+
+def EncodeImport(session, importFolder, blobs):
+    return [[[fileName, path, Encode(session, data, blobs)] for fileName, path, data in importFolder.files],
+            [[folderName, EncodeImport(session, childImport, blobs)] for folderName, childImport in importFolder.folders]]
+
+
+def EncodeChanges(value, blobs):
+    # ChangeLists are already lists of lists; only their data has to go after the document.
+    if isinstance(value, list):
+        return [EncodeChanges(item, blobs) for item in value]
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        blobs.append(value)
+        return {'data': len(blobs) - 1}
+    return value
+
+
+def EncodeOverlay(session, overlay):
+    if overlay is None:
+        return None
+
+    for processor in (Processor.ARM9, Processor.ARM7):
+        for overlayID, ov in session.OverlayObjects(processor).items():
+            if ov is overlay:
+                return [int(processor), overlayID]
+
+    raise ValueError('The overlay isn\'t in the ROM')
+
+
+def Decode(session, value, blobs):
+    if not isinstance(value, dict):
+        return value
+    elif 'processor' in value:
+        return Processor(value['processor'])
+    elif 'data' in value:
+        return blobs[value['data']]
+    elif 'folder' in value:
+        folder = session.rom.filenames
+        for folderName in value['folder']:
+            folder = session.paths.ChildFolder(folder, folderName)
+            if folder is None:
+                raise ValueError('A journaled folder doesn\'t exist')
+        return folder
+    elif 'import' in value:
+        return DecodeImport(session, value['import'], blobs)
+    elif 'replacement' in value:
+        import ReplacementEngine
+
+        engine = ReplacementEngine.ReplacementEngine(None)
+        engine.changes = [(fileID, attribute, DecodeOverlay(session, overlay), Decode(session, fileData, blobs))
+                          for fileID, attribute, overlay, fileData in value['replacement']]
+        return engine
+    elif 'changes' in value:
+        import EditHistory
+
+        return EditHistory.ChangeList(DecodeChanges(value['changes'], blobs), value.get('label'))
+
+    raise ValueError('Unknown journaled value')
+
+
+def DecodeImport(session, data, blobs):
+    import BatchImport
+
+    files, folders = data
+    importFolder = BatchImport.ImportFolder()
+    importFolder.files = [[fileName, path, Decode(session, fileData, blobs)] for fileName, path, fileData in files]
+    importFolder.folders = [(folderName, DecodeImport(session, childData, blobs)) for folderName, childData in folders]
+    return importFolder
+
+
+def DecodeChanges(value, blobs):
+    if isinstance(value, list):
+        return [DecodeChanges(item, blobs) for item in value]
+    elif isinstance(value, dict):
+        return blobs[value['data']]
+    return value
+
+
+def DecodeOverlay(session, overlay):
+    if overlay is None:
+        return None
+
+    processor, overlayID = overlay
+    return session.OverlayObjects(Processor(processor))[overlayID]
+
+
+class EditJournal:
+
+    """
+    An append-only log of the edits made to a ROM since it was last saved, kept next to it
+    so that they can be made again after a crash. Every edit is written and flushed as it's
+    made, so the journal survives the program dying; syncing it to disk, which is what
+    survives the system going down, is batched to at most once per syncInterval seconds.
+    A record that was cut off or damaged ends the journal, and is written over.
+    """
+
+    syncInterval = 1.0
+
+    def __init__(self, romFileName):
+        self.fileName = JournalFileName(romFileName)
+        self.key = ROMKey(romFileName)
+        self.file = None
+        self.lock = threading.Lock()
+        self.timer = None
+        self.lastSync = 0
+        self.unsynced = False
+
+    # Reading
+
+    def ReadHeader(self, f):
+        # Returns whether this journal is for this version of the ROM file.
+        if f.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+            return False
+
+        try:
+            length, = LENGTH.unpack(f.read(LENGTH.size))
+            header = json.loads(f.read(length).decode('utf-8'))
+        except (struct.error, ValueError):
+            return False
+
+        return isinstance(header, dict) and header.get('version') == JOURNAL_VERSION and header.get('key') == self.key
+
+    def ReadRecords(self, f):
+        # Yields (end offset, document, body) for each intact record.
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            length, crc = RECORD_HEADER.unpack(header)
+            body = f.read(length)
+            if len(body) < length or zlib.crc32(body) != crc:
+                return
+
+            try:
+                documentLength, = LENGTH.unpack_from(body)
+                document = json.loads(bytes(body[LENGTH.size : LENGTH.size + documentLength]).decode('utf-8'))
+            except (struct.error, ValueError):
+                return
+
+            yield f.tell(), document, memoryview(body)[LENGTH.size + documentLength:]
+
+    def Records(self):
+        # Yields (end offset, document, file data) for each edit the journal holds, in order,
+        # if it's for this version of the ROM file.
+        try:
+            f = open(self.fileName, 'rb')
+        except FileNotFoundError:
+            return
+
+        with f:
+            if not self.ReadHeader(f):
+                return
+
+            for end, document, data in self.ReadRecords(f):
+                blobs = []
+                offset = 0
+                for size in document.get('sizes', []):
+                    blobs.append(bytes(data[offset : offset + size]))
+                    offset += size
+                yield end, document, blobs
+
+    def Scan(self):
+        # Returns how many edits there are to recover.
+        count = 0
+
+        try:
+            with open(self.fileName, 'rb') as f:
+                if self.ReadHeader(f):
+                    for _end, _document, _data in self.ReadRecords(f):
+                        count += 1
+        except FileNotFoundError:
+            pass
+
+        return count
+
+    def SetAside(self):
+        # Copies the journal to a file of its own, for when edits in it couldn't be recovered
+        # and are about to be written over. Returns the copy's name.
+        import shutil
+
+        fileName = self.fileName + '.unrecovered'
+        number = 1
+        while os.path.exists(fileName):
+            number += 1
+            fileName = self.fileName + '.unrecovered' + str(number)
+
+        shutil.copyfile(self.fileName, fileName)
+        return fileName
+
+    # Writing
+
+    def Open(self, end=None):
+        # Starts journaling. The edits up to end are kept and anything after them dropped;
+        # without end, the journal starts out empty.
+        if end is not None:
+            self.file = open(self.fileName, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            header = json.dumps({'version': JOURNAL_VERSION, 'key': self.key}).encode('utf-8')
+            self.file = open(self.fileName, 'wb')
+            self.file.write(JOURNAL_MAGIC + LENGTH.pack(len(header)) + header)
+
+        self.file.flush()
+        self.unsynced = True
+        self.Sync()
+
+    def Append(self, document, blobs):
+        document = dict(document, sizes=[len(blob) for blob in blobs])
+        documentData = json.dumps(document).encode('utf-8')
+        pieces = [LENGTH.pack(len(documentData)), documentData] + blobs
+
+        crc = 0
+        for piece in pieces:
+            crc = zlib.crc32(piece, crc)
+
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(sum(len(piece) for piece in pieces), crc))
+            for piece in pieces:
+                self.file.write(piece)
+            self.file.flush()
+            self.unsynced = True
+
+            wait = self.lastSync + self.syncInterval - time.monotonic()
+            if wait > 0:
+                if self.timer is None:
+                    self.timer = threading.Timer(wait, self.Sync)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+
+        self.Sync()
+
+    def Sync(self):
+        with self.lock:
+            self.timer = None
+            if self.file is None or not self.unsynced:
+                return
+
+            os.fsync(self.file.fileno())
+            self.unsynced = False
+            self.lastSync = time.monotonic()
+
+    def Close(self):
+        # Only once the edits have been saved or given up on; the journal is removed.
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+            try:
+                os.remove(self.fileName)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,248 @@
+import os
+import json
+import hashlib
+import threading
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = '.ndspy-gui-manifest.json'
+
+class ExtractionCancelled(Exception):
+    pass
+
+
+def HashData(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def MainCodeFileName(processor):
+    return 'ARM' + str(int(processor)) + '.bin'
+
+
+def OverlayFileName(processor, overlayID):
+    return 'Overlay' + str(int(processor)) + '_' + str(overlayID)
+
+
+class ExtractionPlan:
+
+    # Everything an extraction will create, worked out before anything is written: the
+    # directories in creation order and each output file with the data that goes into it.
+
+    def __init__(self, root):
+        self.root = root
+        self.directories = []
+        self.files = []
+        self.byteCount = 0
+
+    def AddDirectory(self, path):
+        self.directories.append(path)
+
+    def AddFile(self, path, data, fileID=None):
+        self.files.append((path, data, fileID))
+        self.byteCount += len(data)
+
+    def AddFolder(self, rom, folder, dirPath):
+        self.AddDirectory(dirPath)
+
+        for i, fileName in enumerate(folder.files):
+            fileID = folder.firstID + i
+            self.AddFile(os.path.join(dirPath, fileName), rom.files[fileID], fileID)
+
+        for folderName, childFolder in folder.folders:
+            self.AddFolder(rom, childFolder, os.path.join(dirPath, folderName))
+
+    def AddCodeFolder(self, processor, mainData, overlays, dirPath):
+        self.AddDirectory(dirPath)
+        self.AddFile(os.path.join(dirPath, MainCodeFileName(processor)), mainData)
+
+        for i, ov in overlays.items():
+            self.AddFile(os.path.join(dirPath, OverlayFileName(processor, i)), ov.data, ov.fileID)
+
+
+class ExtractionManifest:
+
+    # Records what the last incremental extraction into a directory wrote: for each output
+    # path, the file ID it came from, its size, a hash of its content and the mtime it was
+    # left with. Kept in the output directory itself.
+
+    def __init__(self, root, entries=None):
+        self.root = root
+        self.entries = entries or {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def Load(cls, root):
+        try:
+            with open(os.path.join(root, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                entries = json.load(f)['files']
+        except (OSError, ValueError, KeyError, TypeError):
+            entries = {}
+
+        return cls(root, entries)
+
+    def Key(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def Get(self, path):
+        with self.lock:
+            return self.entries.get(self.Key(path))
+
+    def Set(self, path, fileID, size, digest, mtime):
+        with self.lock:
+            self.entries[self.Key(path)] = {'fileID': fileID, 'size': size, 'hash': digest, 'mtime': mtime}
+
+    def Prune(self, paths):
+        keys = {self.Key(path) for path in paths}
+
+        with self.lock:
+            self.entries = {key: entry for key, entry in self.entries.items() if key in keys}
+
+    def Save(self):
+        fileName = os.path.join(self.root, MANIFEST_NAME)
+
+        with self.lock:
+            with open(fileName + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'files': self.entries}, f, indent=1, sort_keys=True)
+
+        os.replace(fileName + '.tmp', fileName)
+
+
+class ExtractionEngine:
+
+    largeFileSize = 1024 * 1024
+    batchSize = 64
+
+    def __init__(self, plan, reporter=None, maxWorkers=None, incremental=False):
+        self.plan = plan
+        self.reporter = reporter
+        self.maxWorkers = maxWorkers or min(32, (os.cpu_count() or 1) * 4)
+        self.incremental = incremental
+        self.manifest = None
+        self.cancelEvent = threading.Event()
+        self.countLock = threading.Lock()
+        self.writtenCount = 0
+        self.unchangedCount = 0
+
+    def Cancel(self):
+        self.cancelEvent.set()
+
+    def MakeTasks(self):
+        # Large files get a task each; small ones are written in batches. The two kinds are
+        # interleaved so that big writes run alongside the bulk of small file creates instead
+        # of all landing on the pool at once.
+        large = []
+        small = []
+        batch = []
+
+        for entry in self.plan.files:
+            if len(entry[1]) >= self.largeFileSize:
+                large.append([entry])
+            else:
+                batch.append(entry)
+                if len(batch) >= self.batchSize:
+                    small.append(batch)
+                    batch = []
+
+        if batch:
+            small.append(batch)
+
+        large.sort(key=lambda task: len(task[0][1]), reverse=True)
+        return [task for pair in itertools.zip_longest(large, small) for task in pair if task is not None]
+
+    def IsUnchanged(self, path, digest, size):
+        # A file whose size and mtime still match the manifest is trusted to hold what was
+        # written last time; anything else of the right size is hashed from disk.
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+        if st.st_size != size:
+            return False
+
+        entry = self.manifest.Get(path)
+        if entry is not None and entry.get('size') == size and entry.get('mtime') == st.st_mtime_ns:
+            return entry.get('hash') == digest
+
+        with open(path, 'rb') as f:
+            return HashData(f.read()) == digest
+
+    def WriteFile(self, path, data, fileID):
+        if not self.incremental:
+            with open(path, 'wb') as f:
+                f.write(data)
+            return True
+
+        digest = HashData(data)
+        unchanged = self.IsUnchanged(path, digest, len(data))
+
+        if not unchanged:
+            with open(path, 'wb') as f:
+                f.write(data)
+
+        self.manifest.Set(path, fileID, len(data), digest, os.stat(path).st_mtime_ns)
+        return not unchanged
+
+    def WriteFiles(self, task):
+        try:
+            for path, data, fileID in task:
+                if self.cancelEvent.is_set():
+                    return
+
+                written = self.WriteFile(path, data, fileID)
+
+                with self.countLock:
+                    if written:
+                        self.writtenCount += 1
+                    else:
+                        self.unchangedCount += 1
+
+                if self.reporter is not None:
+                    self.reporter.Advance(1, len(data))
+        except Exception:
+            self.cancelEvent.set()
+            raise
+
+    def Summary(self):
+        if not self.incremental:
+            return str(self.writtenCount) + ' files written.'
+
+        return str(self.writtenCount) + ' files written, ' + str(self.unchangedCount) + ' unchanged.'
+
+    def Run(self):
+        for path in self.plan.directories:
+            os.makedirs(path, exist_ok=True)
+
+        if self.incremental:
+            os.makedirs(self.plan.root, exist_ok=True)
+            self.manifest = ExtractionManifest.Load(self.plan.root)
+
+        # Only a couple of tasks per worker are queued at a time, so a cancel takes effect
+        # without waiting for the whole plan to drain through the pool.
+        slots = threading.BoundedSemaphore(self.maxWorkers * 2)
+        futures = []
+
+        with ThreadPoolExecutor(self.maxWorkers) as pool:
+            for task in self.MakeTasks():
+                slots.acquire()
+
+                if self.cancelEvent.is_set():
+                    slots.release()
+                    break
+
+                future = pool.submit(self.WriteFiles, task)
+                future.add_done_callback(lambda _future: slots.release())
+                futures.append(future)
+
+        if self.incremental:
+            # An interrupted run still records the files it got through.
+            if not self.cancelEvent.is_set():
+                self.manifest.Prune(path for path, _data, _fileID in self.plan.files)
+            self.manifest.Save()
+
+        for future in futures:
+            future.result()
+
+        if self.cancelEvent.is_set():
+            raise ExtractionCancelled
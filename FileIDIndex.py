@@ -0,0 +1,231 @@
+class FenwickTree:
+
+    def __init__(self, values=()):
+        self.tree = [0] + list(values)
+
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def Prefix(self, count):
+        # The sum of the first count values.
+        total = 0
+        while count > 0:
+            total += self.tree[count]
+            count -= count & -count
+        return total
+
+    def Search(self, value):
+        # The largest count whose Prefix is at most value; values must be non-negative.
+        position = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+
+        while step:
+            following = position + step
+            if following < len(self.tree) and self.tree[following] <= value:
+                position = following
+                value -= self.tree[following]
+            step >>= 1
+
+        return position
+
+    def Add(self, position, delta):
+        position += 1
+        while position < len(self.tree):
+            self.tree[position] += delta
+            position += position & -position
+
+    def Append(self, value):
+        i = len(self.tree)
+        self.tree.append(value + self.Prefix(i - 1) - self.Prefix(i - (i & -i)))
+
+
+class FileIDIndex:
+
+    # Every file ID belongs to a segment: the files of one FNT folder, or an overlay's file.
+    # Segments are kept in ID order with their file counts in a Fenwick tree, so the first ID
+    # of any segment is a prefix sum and adding or removing files only updates a count.
+    # Folder.firstID and Overlay.fileID go stale while edits are pending; Compact writes
+    # them back in one pass. With a log, every change is appended to it, so that an edit
+    # history can Revert and Repeat them.
+
+    def __init__(self, filenames, overlayDicts, fileCount):
+        found = []
+
+        def Walk(folder):
+            found.append((folder.firstID, len(folder.files), folder))
+            for _folderName, childFolder in folder.folders:
+                Walk(childFolder)
+
+        Walk(filenames)
+        for overlays in overlayDicts:
+            for ov in overlays.values():
+                found.append((ov.fileID, 1, ov))
+
+        # Empty folders go before anything else starting at the same ID, as that's where
+        # files added to them end up.
+        found.sort(key=lambda entry: (entry[0], entry[1] > 0))
+
+        # IDs that belong to no folder or overlay get a placeholder segment of their own.
+        self.segments = []
+        self.counts = []
+        position = 0
+
+        for start, count, segment in found:
+            if start > position:
+                self.segments.append(None)
+                self.counts.append(start - position)
+            elif start < position and count:
+                raise ValueError('File ID ' + str(start) + ' is used more than once')
+
+            self.segments.append(segment)
+            self.counts.append(count)
+            position = max(start, position) + count
+
+        if fileCount > position:
+            self.segments.append(None)
+            self.counts.append(fileCount - position)
+
+        self.ranks = {id(segment): rank for rank, segment in enumerate(self.segments) if segment is not None}
+        self.tree = FenwickTree(self.counts)
+        self.dirty = False
+        self.log = None
+
+    def FirstID(self, segment):
+        return self.tree.Prefix(self.ranks[id(segment)])
+
+    def Find(self, fileID):
+        # The segment a file ID falls in and its offset there; the segment is a Folder,
+        # an Overlay, or None for IDs that belong to neither.
+        rank = self.tree.Search(fileID)
+        if rank >= len(self.segments):
+            return None, None
+
+        return self.segments[rank], fileID - self.tree.Prefix(rank)
+
+    def AddFiles(self, segment, count):
+        rank = self.ranks[id(segment)]
+        self.counts[rank] += count
+        self.tree.Add(rank, count)
+        self.dirty = True
+
+        if self.log is not None:
+            self.log.append(('add', segment, count))
+
+    def RemoveFiles(self, segment, count):
+        self.AddFiles(segment, -count)
+
+    def AppendSegment(self, segment, count):
+        # New folders and overlays take the IDs after every existing file.
+        self.ranks[id(segment)] = len(self.segments)
+        self.segments.append(segment)
+        self.counts.append(count)
+        self.tree.Append(count)
+        self.dirty = True
+
+        if self.log is not None:
+            self.log.append(('append', segment, count))
+
+    def RemoveSegment(self, segment):
+        rank = self.ranks[id(segment)]
+
+        if self.log is not None:
+            # Where the segment was is logged as its first ID and how many empty segments
+            # started there before it, as ranks change when the index is compacted.
+            emptyBefore = 0
+            i = rank - 1
+            while i >= 0 and not self.counts[i]:
+                if self.segments[i] is not None:
+                    emptyBefore += 1
+                i -= 1
+            self.log.append(('remove', segment, self.tree.Prefix(rank), emptyBefore, self.counts[rank]))
+
+        del self.ranks[id(segment)]
+        self.tree.Add(rank, -self.counts[rank])
+        self.segments[rank] = None
+        self.counts[rank] = 0
+        self.dirty = True
+
+    def InsertSegment(self, segment, firstID, emptyBefore, count):
+        # Puts a removed segment back where RemoveSegment logged it was. Only undoing and
+        # making undone changes again do this, so the tree is simply rebuilt.
+        rank = self.tree.Search(firstID - 1) + 1 if firstID else 0
+        skipped = 0
+
+        while rank < len(self.segments) and not self.counts[rank] and (skipped < emptyBefore or self.segments[rank] is None):
+            if self.segments[rank] is not None:
+                skipped += 1
+            rank += 1
+
+        self.segments.insert(rank, segment)
+        self.counts.insert(rank, count)
+        self.ranks = {id(other): i for i, other in enumerate(self.segments) if other is not None}
+        self.tree = FenwickTree(self.counts)
+        self.dirty = True
+
+        if self.log is not None:
+            self.log.append(('insert', segment, firstID, emptyBefore, count))
+
+    def Revert(self, change):
+        # Undoes a logged change. Later changes have to be reverted first.
+        kind, segment = change[:2]
+
+        if kind == 'add':
+            self.AddFiles(segment, -change[2])
+        elif kind in ('append', 'insert'):
+            self.RemoveSegment(segment)
+        else:
+            self.InsertSegment(segment, *change[2:])
+
+    def Repeat(self, change):
+        kind, segment = change[:2]
+
+        if kind == 'add':
+            self.AddFiles(segment, change[2])
+        elif kind == 'append':
+            self.AppendSegment(segment, change[2])
+        elif kind == 'insert':
+            self.InsertSegment(segment, *change[2:])
+        else:
+            self.RemoveSegment(segment)
+
+    def RemoveFolder(self, folder):
+        for _folderName, childFolder in folder.folders:
+            self.RemoveFolder(childFolder)
+        self.RemoveSegment(folder)
+
+    def Compact(self):
+        # Writes the current IDs back into the folders and overlays. Returns whether
+        # anything had changed since the last time.
+        import ndspy.fnt
+
+        if not self.dirty:
+            return False
+
+        segments = []
+        counts = []
+        position = 0
+
+        for segment, count in zip(self.segments, self.counts):
+            if segment is None and not count:
+                continue
+
+            if isinstance(segment, ndspy.fnt.Folder):
+                segment.firstID = position
+            elif segment is not None:
+                segment.fileID = position
+
+            segments.append(segment)
+            counts.append(count)
+            position += count
+
+        self.segments = segments
+        self.counts = counts
+        self.ranks = {id(segment): rank for rank, segment in enumerate(segments) if segment is not None}
+        self.tree = FenwickTree(counts)
+        self.dirty = False
+        return True
@@ -1,70 +1,89 @@
 import sys
 import os
 import struct
-import ndspy.rom
-import ndspy.fnt
-import ndspy.color
-import ndspy.graphics2D
 import threading
-from enum import Enum 
-from enum import IntEnum
-
-from PyQt5 import Qt, QtCore, QtGui, QtWidgets
+import ROMLoader
+import ROMSession
+import FilesystemModel
+import ProgressReporter
+import BatchImport
+import ExtractionEngine
+import ReplacementEngine
+import CodeLoader
+import HexEditor
+import ROMSearch
+
+from PyQt5 import QtCore, QtGui, QtWidgets
 from ndspy import Processor
-from PIL import Image
-from PIL.ImageQt import ImageQt
-
-class NodeTypes(Enum):
-    rom = 1
-    filesystem = 2
-    directory = 3
-    arm9directory = 4
-    arm7directory = 5
-    main9 = 6
-    main7 = 7
-    overlay9 = 8
-    overlay7 = 9
-    file = 10
-
-class NodeData(IntEnum):
-    nodeType = 0
-    size = 1
-    path = 3
-    fileID = 4
-    ramAddress = 5
-    compressedSize = 6
-    folderFirstID = 7 
-    romName = 8
-    ramSize = 9
-    nodeName = 10
-    overlayID = 11
+from FilesystemModel import NodeTypes
+
+def CodeForNodeType(nodetype):
+    # The (processor, main) code loads a node depends on.
+    if nodetype == NodeTypes.overlay7:
+        return [(Processor.ARM7, False)]
+    elif nodetype == NodeTypes.overlay9:
+        return [(Processor.ARM9, False)]
+    elif nodetype == NodeTypes.main7:
+        return [(Processor.ARM7, True)]
+    elif nodetype == NodeTypes.main9:
+        return [(Processor.ARM9, True)]
+    elif nodetype == NodeTypes.arm7directory:
+        return [(Processor.ARM7, True), (Processor.ARM7, False)]
+    elif nodetype == NodeTypes.arm9directory:
+        return [(Processor.ARM9, True), (Processor.ARM9, False)]
+    elif nodetype == NodeTypes.rom:
+        return [(Processor.ARM7, True), (Processor.ARM9, True), (Processor.ARM7, False), (Processor.ARM9, False)]
+    return []
+
 
 class FilesystemEditorWidget(QtWidgets.QWidget):
 
+    progressReported = QtCore.pyqtSignal(object, str)
+    taskFinished = QtCore.pyqtSignal(object, object, object)
+    searchResultsFound = QtCore.pyqtSignal(list)
+
     def __init__(self, parent):
         super(FilesystemEditorWidget, self).__init__(parent)
         
         self.romEdited = False
+        self.lazyLoading = True
+        self.incrementalExtraction = False
+        self.deduplicateOnSave = False
+        self.historyMemoryLimit = None
         self.ROM = None
+        self.session = None
         self.currentNode = None
-        self.arm7File = None
-        self.arm9File = None
-        self.overlays7 = None
-        self.overlays9 = None
-
-        self.overlays9Thread = threading.Thread(target=self.LoadOverlay9Files)
-        self.overlays7Thread = threading.Thread(target=self.LoadOverlay7Files)
-        self.main9Thread = threading.Thread(target=self.LoadMain9File)
-        self.main7Thread = threading.Thread(target=self.LoadMain7File)
+        self.codeLoader = CodeLoader.CodeLoader()
+        self.loadThread = None
+        self.loadWorker = None
+        self.taskThread = None
+        self.taskCancel = None
+        self.taskCancelled = False
 
         self.progress = QtWidgets.QStatusBar()
         self.progress.maximumHeight = 20
 
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        self.progress.addPermanentWidget(self.progressBar)
+
+        self.cancelButton = QtWidgets.QPushButton('Cancel', self)
+        self.cancelButton.clicked.connect(self.HandleCancel)
+        self.cancelButton.hide()
+        self.progress.addPermanentWidget(self.cancelButton)
+
+        self.progressReported.connect(self.SetProgress)
+        self.taskFinished.connect(self.HandleTaskFinished)
+        self.progressReporter = ProgressReporter.ProgressReporter(self.progressReported.emit)
+
         self.tabs = QtWidgets.QTabWidget()
         self.tab1 = QtWidgets.QWidget()
         self.tab2 = QtWidgets.QWidget()
+        self.tab3 = QtWidgets.QWidget()
         self.tabs.addTab(self.tab1,'ROM Filesystem')
         self.tabs.addTab(self.tab2,'ROM Other')
+        self.tabs.addTab(self.tab3,'Search')
 
         # Tab 1
 
@@ -89,13 +108,19 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
         self.selectedFileText.setFont(QtGui.QFont('Times',weight=QtGui.QFont.Bold))
         self.selectedFileDetails = QtWidgets.QLabel('---------', self)
 
-        self.romFilesystemTreeView = QtWidgets.QTreeWidget()
-        self.romFilesystemTreeView.setHeaderHidden(True)
-        self.romFilesystemTreeView.setColumnCount(1)
+        self.romFilesystemModel = FilesystemModel.ROMFilesystemModel(self)
+
+        self.romFilesystemTreeView = QtWidgets.QTreeView()
+        self.romFilesystemTreeView.setModel(self.romFilesystemModel)
         self.romFilesystemTreeView.setHeaderHidden(True)
+        self.romFilesystemTreeView.setUniformRowHeights(True)
         self.romFilesystemTreeView.setIndentation(16)
-        self.romFilesystemTreeView.currentItemChanged.connect(self.HandleItemChange)
-        self.romFilesystemTreeView.itemActivated.connect(self.HandleItemActivated)
+        self.romFilesystemTreeView.selectionModel().currentChanged.connect(self.HandleItemChange)
+        self.romFilesystemTreeView.activated.connect(self.HandleItemActivated)
+
+        self.romFilesystemTreeView.setAcceptDrops(True)
+        self.romFilesystemTreeView.setDragDropMode(QtWidgets.QAbstractItemView.DropOnly)
+        self.romFilesystemTreeView.setDropIndicatorShown(True)
 
         self.romFilesystemTreeView.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.romFilesystemTreeView.customContextMenuRequested.connect(self.CreateContextMenu)
@@ -127,10 +152,11 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
         tab2Layout.addLayout(iconbuttonlayout, 0, 1)
         tab2Layout.addLayout(generalinfolayout, 0, 2)
         
+        self.bannerIcon = None
         self.bannerIconLabel = QtWidgets.QLabel(self)
-        pixmapBlank = QtGui.QPixmap(64, 64)
-        pixmapBlank.fill(QtGui.QColor('transparent'))
-        self.bannerIconLabel.setPixmap(pixmapBlank)
+        self.pixmapBlank = QtGui.QPixmap(64, 64)
+        self.pixmapBlank.fill(QtGui.QColor('transparent'))
+        self.bannerIconLabel.setPixmap(self.pixmapBlank)
 
         self.extractIconButton = QtWidgets.QPushButton('Extract icon...', self)
         self.extractIconButton.clicked.connect(self.HandleExtractIcon)
@@ -171,6 +197,50 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
 
         self.tab2.setLayout(tab2Layout)
 
+        # Tab 3
+
+        self.searchText = QtWidgets.QLineEdit(self)
+        self.searchText.setPlaceholderText('Hex bytes, text or a pointer; separate several hex or pointer patterns with commas')
+        self.searchText.returnPressed.connect(self.HandleSearch)
+
+        self.searchKind = QtWidgets.QComboBox(self)
+        for label, kind in (('Hex bytes', 'hex'), ('Text', 'text'), ('Pointer', 'pointer')):
+            self.searchKind.addItem(label, kind)
+
+        self.searchStart = QtWidgets.QLineEdit(self)
+        self.searchStart.setPlaceholderText('0')
+        self.searchEnd = QtWidgets.QLineEdit(self)
+        self.searchEnd.setPlaceholderText('end of file')
+
+        self.searchAlignment = QtWidgets.QSpinBox(self)
+        self.searchAlignment.setRange(1, 4096)
+
+        self.searchButton = QtWidgets.QPushButton('Search', self)
+        self.searchButton.clicked.connect(self.HandleSearch)
+
+        self.searchResultsTree = QtWidgets.QTreeWidget(self)
+        self.searchResultsTree.setHeaderLabels(['Location', 'Offset', 'Match'])
+        self.searchResultsTree.setRootIsDecorated(False)
+        self.searchResultsTree.setUniformRowHeights(True)
+        self.searchResultsTree.itemActivated.connect(self.HandleSearchResultActivated)
+        self.searchResultsFound.connect(self.AddSearchResults)
+
+        searchOptionsLayout = QtWidgets.QHBoxLayout()
+        searchOptionsLayout.addWidget(QtWidgets.QLabel('From offset:', self))
+        searchOptionsLayout.addWidget(self.searchStart)
+        searchOptionsLayout.addWidget(QtWidgets.QLabel('to:', self))
+        searchOptionsLayout.addWidget(self.searchEnd)
+        searchOptionsLayout.addWidget(QtWidgets.QLabel('Alignment:', self))
+        searchOptionsLayout.addWidget(self.searchAlignment)
+
+        tab3Layout = QtWidgets.QGridLayout()
+        tab3Layout.addWidget(self.searchText, 0, 0)
+        tab3Layout.addWidget(self.searchKind, 0, 1)
+        tab3Layout.addWidget(self.searchButton, 0, 2)
+        tab3Layout.addLayout(searchOptionsLayout, 1, 0, 1, 3)
+        tab3Layout.addWidget(self.searchResultsTree, 2, 0, 1, 3)
+        self.tab3.setLayout(tab3Layout)
+
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(self.tabs)
         layout.addWidget(self.progress)
@@ -179,461 +249,365 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
     def SetProgressText(self, text):
         self.progress.showMessage(text)
 
-    def LoadBannerAndTitles(self):
-        (_version, _CRC16, _CRC16_2, _CRC16_3, _CRC16_4, _reserved, 
-        iconBitmap, iconPalette, japanese, english, french, german, italian, spanish) = struct.unpack_from('<5h22s512s32s256s256s256s256s256s256s', self.ROM.iconBanner, 0)
-
-        self.tJapanese.setText(str(japanese, 'utf-8'))
-        self.tEnglish.setText(str(english, 'utf-8'))
-        self.tFrench.setText(str(french, 'utf-8'))
-        self.tGerman.setText(str(german, 'utf-8'))
-        self.tItalian.setText(str(italian, 'utf-8'))
-        self.tSpanish.setText(str(spanish, 'utf-8'))
-
-        colorInts = struct.unpack('<%dh' % 16, iconPalette)
-        colors = []
-
-        for i in range(len(iconPalette) // 2):
-            colors.append(ndspy.color.convert(colorInts[i], ndspy.color.ColorFormat.INT_16, ndspy.color.ColorFormat.TUPLE_RGB5A1))
-        
-        tiles = ndspy.graphics2D.loadImageTiles(iconBitmap, ndspy.graphics2D.ImageFormat.I4)
-        self.bannerIcon = ImageQt(ndspy.graphics2D.renderImageTilesAsImage(tiles, colors, 0, 4))
-        self.bannerIconLabel.setPixmap(QtGui.QPixmap.fromImage(self.bannerIcon).scaled(64,64))
-        
-    def LoadROM(self, fileName):
-        self.SetProgressText('Loading the ROM...')
-        self.ROM = ndspy.rom.NintendoDSRom.fromFile(fileName)
-        self.romFileName = fileName
-        self.romEdited = False
+    def SetProgress(self, percentage, text):
+        if percentage is None:
+            if not self.IsLoading():
+                self.progressBar.hide()
+        else:
+            self.progressBar.setValue(percentage)
+            self.progressBar.show()
 
-        self.romFilesystemTreeView.clear()
-        self.romTree = QtWidgets.QTreeWidgetItem()
-        romName = self.ROM.name.decode('utf-8')
-        self.romTree.setText(0, romName)
-        self.romTree.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.rom)
-        self.romTree.setData(NodeData.folderFirstID, QtCore.Qt.UserRole, 0)
-        self.romTree.setData(NodeData.path, QtCore.Qt.UserRole, '') 
-        self.romFilesystemTreeView.addTopLevelItem(self.romTree)
-
-        root = QtWidgets.QTreeWidgetItem()
-        root.setText(0, 'Filesystem')
-        root.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.filesystem)
-        root.setData(NodeData.folderFirstID, QtCore.Qt.UserRole, self.ROM.filenames.firstID)
-        root.setData(NodeData.path, QtCore.Qt.UserRole, '') 
-        self.romTree.addChild(root)
-
-        self.ReloadCode(True, Processor.ARM9)
-        self.ReloadCode(True, Processor.ARM7)
-        self.ReloadCode(False, Processor.ARM9)
-        self.ReloadCode(False, Processor.ARM7)
-
-        self.LoadROMDir(self.ROM.filenames, '', root)
-        self.LoadBannerAndTitles()
-        self.LoadOverlays(self.romTree)
-     
-        self.romTree.setExpanded(True)
-        self.SetProgressText('Done.')
+        self.SetProgressText(text)
+        self.progress.repaint()
 
+    def SetEditingEnabled(self, enabled):
+        for button in (self.extractButton, self.renameButton, self.addButton, self.removeButton, self.replaceButton, self.extractIconButton, self.searchButton):
+            button.setEnabled(enabled)
 
-    def ROMChanged(self):
-        self.romEdited = True
+    def IsLoading(self):
+        return self.loadWorker is not None
 
+    def IsBusy(self):
+        return self.IsLoading() or self.taskThread is not None
 
-    def Save(self):
-        self.ROM.saveToFile(self.romFileName)
-        self.romEdited = False
+    def RunTask(self, function, cancel, onFinished=None):
+        # Runs a long operation on a worker thread while the rest of the editor stays locked.
+        # The outcome comes back to the GUI thread through taskFinished.
+        self.taskCancel = cancel
+        self.taskCancelled = False
+        self.SetEditingEnabled(False)
+        self.cancelButton.show()
 
+        self.taskThread = threading.Thread(target=self.RunTaskThread, args=(function, onFinished))
+        self.taskThread.start()
 
-    def MakeOverlayNode(self, id, overlay, type):
-        ov = QtWidgets.QTreeWidgetItem()
-        ov.setText(0, 'Overlay ' + str(id))
-        ov.setData(NodeData.nodeType, QtCore.Qt.UserRole, type)
-        ov.setData(NodeData.overlayID, QtCore.Qt.UserRole, id)
-        ov.setData(NodeData.fileID, QtCore.Qt.UserRole, overlay.fileID)
-        ov.setData(NodeData.ramAddress, QtCore.Qt.UserRole, overlay.ramAddress)
-        ov.setData(NodeData.compressedSize, QtCore.Qt.UserRole, overlay.compressedSize)
-        ov.setData(NodeData.ramSize, QtCore.Qt.UserRole, overlay.ramSize)
-        return ov
-
-
-    def LoadOverlays(self, node):
-        self.SetProgressText('Loading the overlays...')
-
-        arm9OvsNode = QtWidgets.QTreeWidgetItem()
-        arm9OvsNode.setText(0, 'ARM9')
-        arm9OvsNode.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.arm9directory)
-        arm9OvsNode.setData(NodeData.nodeName, QtCore.Qt.UserRole, 'ARM9')
-        node.addChild(arm9OvsNode)
-    
-        arm7OvsNode = QtWidgets.QTreeWidgetItem()
-        arm7OvsNode.setText(0, 'ARM7')
-        arm7OvsNode.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.arm7directory)
-        arm7OvsNode.setData(NodeData.nodeName, QtCore.Qt.UserRole, 'ARM7')
-        node.addChild(arm7OvsNode)
-
-        self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM9)
-        arm9 = QtWidgets.QTreeWidgetItem()
-        arm9.setText(0, 'Main ARM9')
-        arm9.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.main9)
-        arm9.setData(NodeData.ramAddress, QtCore.Qt.UserRole, self.arm9File.ramAddress)
-        arm9.setData(NodeData.size, QtCore.Qt.UserRole, len(self.ROM.arm9))
-        
-        arm9OvsNode.addChild(arm9)
+    def RunTaskThread(self, function, onFinished):
+        error = None
 
-        self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM7)
-        arm7 = QtWidgets.QTreeWidgetItem()
-        arm7.setText(0, 'Main ARM7')
-        arm7.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.main7)
-        arm7.setData(NodeData.ramAddress, QtCore.Qt.UserRole, self.arm7File.ramAddress)
-        arm7.setData(NodeData.size, QtCore.Qt.UserRole, len(self.ROM.arm7))
-        arm7OvsNode.addChild(arm7)
+        try:
+            function()
+        except Exception as e:
+            error = e
 
-        self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM9)
-        for id, overlay in self.overlays9.items():
-            arm9OvsNode.addChild(self.MakeOverlayNode(id, overlay, NodeTypes.overlay9))  
+        self.taskFinished.emit(threading.current_thread(), onFinished, error)
 
-        self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM7)
-        for id, overlay in self.overlays7.items():          
-            arm7OvsNode.addChild(self.MakeOverlayNode(id, overlay, NodeTypes.overlay7)) 
+    def FinishTask(self):
+        self.taskThread.join()
+        self.taskThread = None
+        self.taskCancel = None
+        self.cancelButton.hide()
+        self.SetEditingEnabled(self.ROM is not None)
 
-    def LoadOverlay9Files(self):
-        self.overlays9 = self.ROM.loadArm9Overlays()
+    def StopTask(self):
+        if self.taskThread is None:
+            return
 
-    def LoadOverlay7Files(self):
-        self.overlays7 = self.ROM.loadArm7Overlays()
+        self.taskCancelled = True
+        self.taskCancel()
+        self.FinishTask()
 
-    def LoadMain9File(self):
-        self.arm9File = self.ROM.loadArm9()
+    def HandleTaskFinished(self, thread, onFinished, error):
+        # Results from a task that was already stopped are dropped.
+        if thread is not self.taskThread:
+            return
 
-    def LoadMain7File(self):
-        self.arm7File = self.ROM.loadArm7()
+        self.FinishTask()
 
-    def ReloadCode(self, main, processor):
-        if main:
-            if processor == Processor.ARM7:
-                try:
-                    self.main7Thread.join()
-                except RuntimeError:
-                    pass
-                self.main7Thread = threading.Thread(target=self.LoadMain7File)
-                self.main7Thread.start()
-            if processor == Processor.ARM9:
-                try:
-                    self.main9Thread.join()
-                except RuntimeError:
-                    pass
-                self.main9Thread = threading.Thread(target=self.LoadMain9File)
-                self.main9Thread.start() 
+        if error is None:
+            self.progressReporter.Finish()
+            if onFinished is not None:
+                onFinished()
+        elif self.taskCancelled:
+            self.progressReporter.Finish('Cancelled.')
         else:
-            if processor == Processor.ARM7:
-                try:
-                    self.overlays7Thread.join()
-                except RuntimeError:
-                    pass
-                self.overlays7Thread = threading.Thread(target=self.LoadOverlay7Files)
-                self.overlays7Thread.start()
-            if processor == Processor.ARM9:
-                try:
-                    self.overlays7Thread.join()
-                except RuntimeError:
-                    pass
-                self.overlays9Thread = threading.Thread(target=self.LoadOverlay9Files)
-                self.overlays9Thread.start()       
-
-    def WaitUntilCodeLoadThreadFinished(self, main, processor):     
-        if main:
-            if processor == Processor.ARM7:
-                try:
-                    self.main7Thread.join()
-                except RuntimeError:
-                    pass
-            if processor == Processor.ARM9:
-                try:
-                    self.main9Thread.join()
-                except RuntimeError:
-                    pass
-        else:
-            if processor == Processor.ARM7:
-                try:
-                    self.overlays7Thread.join()
-                except RuntimeError:
-                    pass
-            if processor == Processor.ARM9:
-                try:
-                    self.overlays9Thread.join()
-                except RuntimeError:
-                    pass
+            self.progressReporter.Finish('Failed.')
+            QtWidgets.QMessageBox.information(self, 'Error', str(error))
 
-    def ReloadCodeBasedOnNodeType(self, nodetype):
-        if nodetype == NodeTypes.overlay7:
-            self.ReloadCode(False, Processor.ARM7)
-        elif nodetype == NodeTypes.overlay9:
-            self.ReloadCode(False, Processor.ARM9)
-        elif nodetype == NodeTypes.main7:
-            self.ReloadCode(True, Processor.ARM7)
-        elif nodetype == NodeTypes.main9:
-            self.ReloadCode(True, Processor.ARM9)
-        elif nodetype == NodeTypes.arm7directory:
-            self.ReloadCode(True, Processor.ARM7)
-            self.ReloadCode(False, Processor.ARM7) 
-        elif nodetype == NodeTypes.arm9directory:
-            self.ReloadCode(True, Processor.ARM9)
-            self.ReloadCode(False, Processor.ARM9)
-        elif nodetype == NodeTypes.rom:
-            self.ReloadCode(True, Processor.ARM7)
-            self.ReloadCode(True, Processor.ARM9)
-            self.ReloadCode(False, Processor.ARM7)
-            self.ReloadCode(False, Processor.ARM9)
+    def LoadBannerAndTitles(self, titles, icon):
+        for textEdit, title in zip((self.tJapanese, self.tEnglish, self.tFrench, self.tGerman, self.tItalian, self.tSpanish), titles):
+            textEdit.setText(title)
 
-    def WaitForReloadExecutionFinishBasedOnNodeType(self, nodetype):
-        if nodetype == NodeTypes.overlay7:
-            self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM7)
-        elif nodetype == NodeTypes.overlay9:
-            self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM9)
-        elif nodetype == NodeTypes.main7:
-            self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM7)
-        elif nodetype == NodeTypes.main9:
-            self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM9)
-        elif nodetype == NodeTypes.arm7directory:
-            self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM7)
-            self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM7) 
-        elif nodetype == NodeTypes.arm9directory:
-            self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM9)
-            self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM9)
-        elif nodetype == NodeTypes.rom:
-            self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM7)
-            self.WaitUntilCodeLoadThreadFinished(True, Processor.ARM9)
-            self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM7)
-            self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM9)   
-
-    def LoadROMDir(self, folder, path, node):
-        for i, fileName in enumerate(folder.files):
-
-            self.SetProgressText('Found file: ' + fileName)
-
-            fileNode = QtWidgets.QTreeWidgetItem()
-            fileNode.setText(0, fileName)
-            fileNode.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.file)
-            fileNode.setData(NodeData.fileID, QtCore.Qt.UserRole, i + folder.firstID) 
-            fileNode.setData(NodeData.path, QtCore.Qt.UserRole, path) 
-            node.addChild(fileNode)
-
-        for i, (folderName, childFolder) in enumerate(folder.folders):
-
-            self.SetProgressText('Found folder: ' + folderName)
-
-            folderNode = QtWidgets.QTreeWidgetItem()
-            folderNode.setText(0, folderName)
-            folderNode.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.directory)
-            folderNode.setData(NodeData.folderFirstID, QtCore.Qt.UserRole, childFolder.firstID)
-            folderNode.setData(NodeData.path, QtCore.Qt.UserRole, path) 
-            node.addChild(folderNode)
-
-            self.LoadROMDir(childFolder, path + '/' + folderName, folderNode)
-
-
-    def ExtractFolder(self, folder, dirPath):
-        for fileName in folder.files:
-            self.SetProgressText('Extracting ' + fileName)
-            data = self.ROM.files[folder.idOf(fileName)]
-
-            with open(os.path.join(dirPath, fileName), 'wb') as f:
-                f.write(data)
-
-        for (folderName, childFolder) in folder.folders:
-            self.SetProgressText('Extracting ' + folderName)
-            path = os.path.join(dirPath, folderName)
-            if not os.path.isdir(path):
-                os.mkdir(path)
-
-            self.ExtractFolder(childFolder, path)
-
-
-    def ReplaceFolder(self, folder, dirPath):
-        for fileName in folder.files:
-            self.SetProgressText('Replacing ' + fileName)
-            fpath = os.path.join(dirPath, fileName)
-
-            if os.path.isfile(fpath):
-                with open(fpath, 'rb') as f:
-                    fileData = f.read()                   
-                    self.ROM.files[folder.idOf(fileName)] = fileData
-
-        for folderName, childFolder in folder.folders:
-            self.SetProgressText('Replacing ' + folderName)
-            path = os.path.join(dirPath, folderName)
-            self.ReplaceFolder(childFolder, path)
-
-
-    def ExtractCodeFolder(self, processor, path):
-        if processor == Processor.ARM7:
-            ovs = self.overlays7
-            m = self.ROM.arm7
-        else:
-            ovs = self.overlays9
-            m = self.ROM.arm9      
+        # The icon is an RGBA array; copying detaches the image from its buffer.
+        height, width = icon.shape[:2]
+        self.bannerIcon = QtGui.QImage(icon.tobytes(), width, height, width * 4, QtGui.QImage.Format_RGBA8888).copy()
+        self.bannerIconLabel.setPixmap(QtGui.QPixmap.fromImage(self.bannerIcon).scaled(64,64))
+
+    def ClearBannerAndTitles(self):
+        # ROMs without a banner never get one loaded, so the last ROM's is cleared first.
+        for textEdit in (self.tJapanese, self.tEnglish, self.tFrench, self.tGerman, self.tItalian, self.tSpanish):
+            textEdit.clear()
 
-        procStr = str(int(processor))
+        self.bannerIcon = None
+        self.bannerIconLabel.setPixmap(self.pixmapBlank)
+        
+    def LoadROM(self, fileName):
+        self.StopTask()
+        self.StopLoading()
+        self.codeLoader.Clear()
 
-        self.SetProgressText('Extracting main' + procStr)
-        with open(os.path.join(path, 'ARM' + procStr + '.bin'), 'wb') as f:
-            f.write(m)                 
+        if self.session is not None:
+            self.session.Close()
 
-        for i, ov in ovs.items():
-            fileName = 'Overlay' + procStr + '_' + str(i)
-            self.SetProgressText('Extracting ' + fileName)
+        self.ROM = None
+        self.session = None
+        self.currentNode = None
+        self.romFilesystemModel.Clear()
+        self.searchResultsTree.clear()
+        self.ClearBannerAndTitles()
+        self.SetEditingEnabled(False)
+
+        self.loadThread = QtCore.QThread()
+        self.loadWorker = ROMLoader.ROMLoadWorker(fileName, self.lazyLoading, self.codeLoader)
+        self.loadWorker.moveToThread(self.loadThread)
+
+        self.loadWorker.romLoaded.connect(self.HandleROMLoaded)
+        self.loadWorker.bannerLoaded.connect(self.HandleBannerLoaded)
+        self.loadWorker.codeLoaded.connect(self.HandleCodeLoaded)
+        self.loadWorker.codeIndexed.connect(self.HandleCodeIndexed)
+        self.loadWorker.progressChanged.connect(self.HandleLoadProgress)
+        self.loadWorker.finished.connect(self.HandleLoadFinished)
+        self.loadWorker.cancelled.connect(self.HandleLoadCancelled)
+        self.loadWorker.failed.connect(self.HandleLoadFailed)
+        self.loadThread.started.connect(self.loadWorker.Run)
 
-            with open(os.path.join(path, fileName), 'wb') as f:
-                f.write(ov.data)     
+        self.romFileName = fileName
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+        self.cancelButton.show()
+        self.loadThread.start()
 
+    def StopLoading(self):
+        if self.loadWorker is None:
+            return
 
-    def ReplaceCodeFolder(self, processor, path):
-        if processor == Processor.ARM7:
-            ovs = self.overlays7
-        else:
-            ovs = self.overlays9 
+        self.loadWorker.Cancel()
+        self.loadThread.quit()
+        self.loadThread.wait()
+        self.FinishLoading()
+
+    def FinishLoading(self):
+        if self.loadThread is not None:
+            self.loadThread.quit()
+            self.loadThread.wait()
+
+        self.loadThread = None
+        self.loadWorker = None
+        self.progressBar.hide()
+        self.cancelButton.hide()
+
+    def IsCurrentLoad(self):
+        # Signals queued by a load that has since been replaced or cancelled are dropped.
+        return self.loadWorker is not None and self.sender() is self.loadWorker
+
+    def HandleCancel(self):
+        if self.loadWorker is not None:
+            self.SetProgressText('Cancelling...')
+            self.loadWorker.Cancel()
+        elif self.taskThread is not None:
+            self.SetProgressText('Cancelling...')
+            self.taskCancelled = True
+            self.taskCancel()
+
+    def HandleLoadProgress(self, percentage, text):
+        if self.IsCurrentLoad():
+            self.SetProgress(percentage, text)
+
+    def HandleROMLoaded(self, rom):
+        if not self.IsCurrentLoad():
+            return
 
-        procStr = str(int(processor))
-        mainPath = os.path.join(path, 'ARM' + procStr + '.bin')
+        self.ROM = rom
+        self.session = ROMSession.ROMSession(rom, self.romFileName, self.codeLoader)
+        self.session.EnableHistory(self.historyMemoryLimit)
+        self.romEdited = False
 
-        if os.path.isfile(mainPath):
-            self.SetProgressText('Replacing main' + procStr)
-            with open(mainPath, 'rb') as f:
-                fileData = f.read()     
+        self.romFilesystemModel.SetROM(self.session)
+        self.romFilesystemTreeView.expand(self.romFilesystemModel.RomIndex())
 
-                if processor == Processor.ARM7:
-                    self.ROM.arm7 = fileData
-                else:
-                    self.ROM.arm9 = fileData
+    def HandleBannerLoaded(self, titles, icon):
+        if self.IsCurrentLoad():
+            self.LoadBannerAndTitles(titles, icon)
 
-        for i, ov in ovs.items():     
-            fileName = 'Overlay' + procStr + '_' + str(i)
-            overlayPath = os.path.join(path, fileName)
+    def HandleCodeLoaded(self, arm9File, arm7File, overlays9, overlays7):
+        if not self.IsCurrentLoad():
+            return
 
-            if os.path.isfile(overlayPath):
-                self.SetProgressText('Replacing ' + fileName)
-                with open(overlayPath, 'rb') as f:
-                    fileData = f.read()                   
-                    self.ROM.files[ov.fileID] = fileData
+        self.codeLoader.SetCode(arm9File, arm7File, overlays9, overlays7)
+        self.romFilesystemModel.CodeLoaded()
 
-    def ChangeFolderFirstIDsHigherThanBy(self, folder, startID, amount):
-        if (folder.firstID > startID):
-            folder.firstID += amount
+    def HandleCodeIndexed(self, rom, overlays9, overlays7):
+        if not self.IsCurrentLoad():
+            return
 
-        for _folderName, childFolder in folder.folders:
-            self.ChangeFolderFirstIDsHigherThanBy(childFolder, startID, amount)         
+        self.codeLoader.LoadInBackground(rom, overlays9, overlays7)
+        self.romFilesystemModel.CodeLoaded()
 
+    def HandleLoadFinished(self):
+        if not self.IsCurrentLoad():
+            return
 
-    def ChangeOverlayFileIDsHigherThanByAndDelete(self, startID, amount):
-        idsToDelete = []
+        self.FinishLoading()
+        self.SetProgressText('Done.')
+        self.StartJournal()
+        self.SetEditingEnabled(True)
+
+    def StartJournal(self):
+        # Edits that a crash kept from being saved are offered back before anything else is
+        # edited.
+        try:
+            count = self.session.RecoverableEdits()
+            recover = count > 0 and QtWidgets.QMessageBox.question(self, 'Recover edits',
+                str(count) + ' edits made to this ROM were never saved. Would you like to make them again?') == QtWidgets.QMessageBox.Yes
+            recovered, asideFileName = self.session.StartJournal(recover=recover)
+        except OSError as e:
+            # The ROM can still be edited, only without a way back after a crash.
+            self.SetProgressText('Edits can\'t be journaled: ' + str(e))
+            return
 
-        self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM7)
-        for i, ov in self.overlays7.items():
-            if ov.fileID == startID:
-                idsToDelete.append(i)
+        if recover:
+            self.romEdited = recovered > 0
+            self.SetProgressText('Recovered ' + str(recovered) + ' of ' + str(count) + ' edits.')
 
-        for Id in idsToDelete:
-            del self.overlays7[Id]   
+        if asideFileName is not None:
+            QtWidgets.QMessageBox.warning(self, 'Recover edits',
+                str(count - recovered) + ' edits couldn\'t be made again. The journal they\'re in was kept as ' + asideFileName + '.')
 
-        for i, ov in self.overlays7.items():
-            if ov.fileID > startID:
-                ov.fileID += amount     
+    def CloseROM(self):
+        # Only once the edits are saved or the user has chosen not to keep them, as this
+        # removes the journal.
+        if self.session is not None:
+            self.session.Close()
 
-        idsToDelete.clear()
-        self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM9)
-        
-        for i, ov in self.overlays9.items():
-            if ov.fileID == startID:
-                idsToDelete.append(i) 
+    def HandleLoadCancelled(self):
+        if not self.IsCurrentLoad():
+            return
 
-        for Id in idsToDelete:
-            del self.overlays9[Id]      
+        self.FinishLoading()
+        self.ROM = None
+        self.session = None
+        self.currentNode = None
+        self.romFilesystemModel.Clear()
+        self.SetProgressText('Loading cancelled.')
 
-        for i, ov in self.overlays9.items():
-            if ov.fileID > startID:
-                ov.fileID += amount
+    def HandleLoadFailed(self, message):
+        if not self.IsCurrentLoad():
+            return
 
-        self.ROM.arm7OverlayTable = ndspy.code.saveOverlayTable(self.overlays7)
-        self.ROM.arm9OverlayTable = ndspy.code.saveOverlayTable(self.overlays9)
+        self.FinishLoading()
+        self.ROM = None
+        self.session = None
+        self.currentNode = None
+        self.romFilesystemModel.Clear()
+        self.SetProgressText('Loading failed.')
+        QtWidgets.QMessageBox.information(self, 'Error', 'Could not load this ROM: ' + message)
 
-        self.ReloadCode(False, Processor.ARM7)
-        self.ReloadCode(False, Processor.ARM9)
 
+    def ROMChanged(self):
+        self.romEdited = True
 
-    def ChangeOverlayFileIDsHigherThanBy(self, startID, amount):
 
-        self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM7)
-        for _i, ov in self.overlays7.items():
-            if ov.fileID > startID:
-                ov.fileID += amount     
+    def Save(self, fileName=None):
+        # Saves the ROM, under another name if one is given. Returns whether it was saved;
+        # until it is, the journal is kept, so that the edits aren't lost.
+        if self.ROM is None:
+            return False
 
-        self.WaitUntilCodeLoadThreadFinished(False, Processor.ARM9)
-        for _i, ov in self.overlays9.items():
-            if ov.fileID > startID:
-                ov.fileID += amount
+        if self.IsBusy():
+            QtWidgets.QMessageBox.information(self, 'Save', 'The ROM can\'t be saved until the current task is finished or cancelled.')
+            return False
 
-        self.ROM.arm7OverlayTable = ndspy.code.saveOverlayTable(self.overlays7)
-        self.ROM.arm9OverlayTable = ndspy.code.saveOverlayTable(self.overlays9)
+        try:
+            shared = self.session.Save(fileName or self.romFileName, self.deduplicateOnSave)
+        except OSError as e:
+            QtWidgets.QMessageBox.critical(self, 'Save', 'The ROM couldn\'t be saved: ' + str(e))
+            return False
 
-        self.ReloadCode(False, Processor.ARM7)
-        self.ReloadCode(False, Processor.ARM9)
+        if fileName is not None:
+            self.romFileName = fileName
+        self.romEdited = False
 
+        if self.deduplicateOnSave:
+            self.SetProgressText('Saved. ' + self.session.SharingSummary(shared))
 
-    def UpdateNodeFileIDs(self, startID, amount, node):
-        count = node.childCount()
+        return True
 
-        for i in range (0, count):
-            nodeType = node.child(i).data(NodeData.nodeType, QtCore.Qt.UserRole) 
 
-            if nodeType in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9}:
-                fId = node.child(i).data(NodeData.fileID, QtCore.Qt.UserRole) 
-                if fId > startID:
-                    node.child(i).setData(NodeData.fileID, QtCore.Qt.UserRole, fId + amount)
+    def UndoLabel(self):
+        return None if self.session is None else self.session.history.UndoLabel()
 
-            elif nodeType == NodeTypes.directory:
-                fId = node.child(i).data(NodeData.folderFirstID, QtCore.Qt.UserRole) 
-                if fId > startID:
-                    node.child(i).setData(NodeData.folderFirstID, QtCore.Qt.UserRole, fId + amount)
+    def RedoLabel(self):
+        return None if self.session is None else self.session.history.RedoLabel()
 
-            self.UpdateNodeFileIDs(startID, amount, node.child(i))
+    def Undo(self):
+        self.UndoOrRedo(False)
 
-    def UpdateOverlayNodes(self, node, startid):
-        count = node.childCount()
+    def Redo(self):
+        self.UndoOrRedo(True)
 
-        for i in range (1, count):
+    def UndoOrRedo(self, redo):
+        if self.ROM is None or self.IsBusy():
+            return
 
-            oldOvId = node.child(i).data(NodeData.overlayID, QtCore.Qt.UserRole)
-            if (oldOvId > startid):
-                node.child(i).setText(0, 'Overlay ' + str(oldOvId + 1))
-                node.child(i).setData(NodeData.overlayID, QtCore.Qt.UserRole, oldOvId + 1)
+        # The tree is rebuilt, so what was expanded is expanded again afterwards.
+        expanded = self.ExpandedNodes()
+        label = self.session.Redo() if redo else self.session.Undo()
+        if label is None:
+            return
 
+        self.currentNode = None
+        self.ExpandNodes(expanded)
+        self.ROMChanged()
+        self.SetProgressText(('Redone: ' if redo else 'Undone: ') + label + '.')
+
+    def ExpandedNodes(self):
+        # Folders, and the node types of the others, whose nodes are expanded.
+        model = self.romFilesystemModel
+        nodes = [model.romNode, model.arm9Node, model.arm7Node] + list(model.folderNodes.values())
+        return [node.folder if node.folder is not None else node.nodeType
+                for node in nodes if self.romFilesystemTreeView.isExpanded(model.IndexOf(node))]
+
+    def ExpandNodes(self, expanded):
+        model = self.romFilesystemModel
+        indexes = {NodeTypes.rom: model.RomIndex, NodeTypes.arm9directory: lambda: model.CodeDirectoryIndex(Processor.ARM9),
+                   NodeTypes.arm7directory: lambda: model.CodeDirectoryIndex(Processor.ARM7)}
+
+        for item in expanded:
+            if item in indexes:
+                self.romFilesystemTreeView.expand(indexes[item]())
+            elif id(item) in self.session.paths.parents:
+                self.romFilesystemTreeView.expand(model.FolderNodeIndex(item))
 
-    def GetNumberOfFilesInFolder(self, folder):
-        num = len(folder.files)
-        for _folderName, folder in folder.folders:
-            num += self.GetNumberOfFilesInFolder(folder)
-        return num
+    def ReloadCodeBasedOnNodeType(self, nodetype):
+        for processor, main in CodeForNodeType(nodetype):
+            self.session.ReloadCode(main, processor)
 
+    def WaitForReloadExecutionFinishBasedOnNodeType(self, nodetype):
+        for processor, main in CodeForNodeType(nodetype):
+            self.codeLoader.Wait(processor, main)
 
-    def FixNodesAfterRename(self, node, parentPath, newFolderName):
-        count = node.childCount()
+    def FileIDs(self):
+        # The session's file ID index, or None with the user told why if this ROM's files
+        # can't be added or removed.
+        self.WaitForReloadExecutionFinishBasedOnNodeType(NodeTypes.rom)
+        try:
+            return self.session.FileIDs()
+        except ValueError as e:
+            QtWidgets.QMessageBox.information(self, 'Error', 'Files cannot be added or removed in this ROM: ' + str(e))
+            return None
 
-        for i in range (0, count):
-            childNode = node.child(i)
-            newData = parentPath + '/' + newFolderName
-            childNode.setData(NodeData.path, QtCore.Qt.UserRole, newData)
 
-            nodeType = childNode.data(NodeData.nodeType, QtCore.Qt.UserRole) 
+    def CurrentIndex(self):
+        if self.currentNode is None or not self.currentNode.isValid():
+            return None
 
-            if nodeType == NodeTypes.directory:
-                childFolderName = childNode.text(0)
-                self.FixNodesAfterRename(childNode, newData, childFolderName)
+        return QtCore.QModelIndex(self.currentNode)
 
     def HandleExtract(self):
-        if self.currentNode == None:
+        index = self.CurrentIndex()
+        if index is None:
             return
 
-        nodeType = self.currentNode.data(NodeData.nodeType, QtCore.Qt.UserRole)
+        nodeType = self.romFilesystemModel.NodeType(index)
 
         if nodeType not in {NodeTypes.directory, NodeTypes.arm7directory, NodeTypes.arm9directory, NodeTypes.rom, NodeTypes.filesystem}:
             fileName = QtWidgets.QFileDialog.getSaveFileName(self, 
@@ -643,14 +617,15 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
             if fileName == '': return
             else:     
                 self.WaitForReloadExecutionFinishBasedOnNodeType(nodeType)
+                self.session.WriteBackOverlays()
 
                 if nodeType in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9}:
-                    fileid = self.currentNode.data(NodeData.fileID, QtCore.Qt.UserRole)
+                    fileid = self.romFilesystemModel.FileID(index)
                     data = self.ROM.files[fileid]
                 elif nodeType == NodeTypes.main9:
-                    data = self.arm9
+                    data = self.ROM.arm9
                 elif nodeType == NodeTypes.main7:
-                    data = self.arm7        
+                    data = self.ROM.arm7        
 
                 with open(fileName, 'wb') as f:
                     f.write(data)
@@ -665,55 +640,23 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
             else:
                 self.WaitForReloadExecutionFinishBasedOnNodeType(nodeType)
 
-                if not os.path.isdir(dirName):
-                    os.mkdir(dirName)  
-
-                folderName = self.currentNode.text(0)
-                extractPath = os.path.join(dirName, folderName)
+                extractPath = os.path.join(dirName, self.romFilesystemModel.NodeName(index))
+                plan = self.session.PlanExtraction(extractPath, *self.FolderOrProcessor(index))
 
-                if not os.path.isdir(extractPath):
-                    os.mkdir(extractPath)
-
-                if nodeType in {NodeTypes.directory, NodeTypes.filesystem}:
-                    path = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
-
-                    if nodeType == NodeTypes.filesystem:
-                        folderToExtract = self.ROM.filenames
-                    else:
-                        folderToExtract = self.ROM.filenames.subfolder(folderName) if path == '' else self.ROM.filenames.subfolder(path + '/' + folderName)
-
-                    self.ExtractFolder(folderToExtract, extractPath)
-
-                elif nodeType == NodeTypes.arm7directory:
-                    self.ExtractCodeFolder(Processor.ARM7, extractPath) 
-
-                elif nodeType == NodeTypes.arm9directory:
-                    self.ExtractCodeFolder(Processor.ARM9, extractPath)  
-
-                elif nodeType == NodeTypes.rom:
-                    romPath = os.path.join(extractPath, 'Filesystem Root')
-                    if not os.path.isdir(romPath):
-                        os.mkdir(romPath)
-                    self.ExtractFolder(self.ROM.filenames, romPath)
-
-                    romPath = os.path.join(extractPath, 'ARM7')
-                    if not os.path.isdir(romPath):
-                        os.mkdir(romPath)
-                    self.ExtractCodeFolder(Processor.ARM7, romPath)   
-
-                    romPath = os.path.join(extractPath, 'ARM9')
-                    if not os.path.isdir(romPath):
-                        os.mkdir(romPath)
-                    self.ExtractCodeFolder(Processor.ARM9, romPath) 
+                engine = ExtractionEngine.ExtractionEngine(plan, self.progressReporter, incremental=self.incrementalExtraction)
+                self.progressReporter.Start('Extracting', len(plan.files), plan.byteCount)
+                self.RunTask(engine.Run, engine.Cancel, lambda: self.SetProgressText('Done. ' + engine.Summary()))
+                return
 
         self.SetProgressText('Done.')
 
 
     def HandleReplace(self):
-        if self.currentNode == None:
+        index = self.CurrentIndex()
+        if index is None:
             return
 
-        nodeType = self.currentNode.data(NodeData.nodeType, QtCore.Qt.UserRole)
+        nodeType = self.romFilesystemModel.NodeType(index)
         
         if nodeType not in {NodeTypes.directory, NodeTypes.arm7directory, NodeTypes.arm9directory, NodeTypes.rom, NodeTypes.filesystem}:
             fileName = QtWidgets.QFileDialog.getOpenFileName(self, 
@@ -727,20 +670,8 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
                 with open(fileName, 'rb') as f:
                     fileData = f.read()        
 
-                self.WaitForReloadExecutionFinishBasedOnNodeType(nodeType)            
-
-                if nodeType in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9}:
-                    fileid = self.currentNode.data(NodeData.fileID, QtCore.Qt.UserRole)
-                    self.ROM.files[fileid] = fileData
-                    self.HandleItemChange(self.currentNode, None)
-
-                elif nodeType == NodeTypes.main9:
-                    self.ROM.arm9 = fileData
-
-                elif nodeType == NodeTypes.main7:
-                    self.ROM.arm7 = fileData              
-
-                self.ROMChanged()
+                self.ReplaceNodeData(index, fileData)
+                self.SetProgressText('Done.')
         else:
             dirName = QtWidgets.QFileDialog.getExistingDirectory(self, 
                                                                 'Select a directory...',
@@ -750,73 +681,171 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
             else:        
                 self.WaitForReloadExecutionFinishBasedOnNodeType(nodeType)  
 
-                if nodeType in {NodeTypes.directory, NodeTypes.filesystem}:
-                    folderName = self.currentNode.text(0)
-                    path = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
+                plan = self.session.PlanReplacement(dirName, *self.FolderOrProcessor(index))
 
-                    if nodeType == NodeTypes.filesystem:
-                        folderToExtract = self.ROM.filenames
-                    else:
-                        folderToExtract = self.ROM.filenames.subfolder(folderName) if path == '' else self.ROM.filenames.subfolder(path + '/' + folderName)
+                engine = ReplacementEngine.ReplacementEngine(plan, self.progressReporter)
+                self.progressReporter.Start('Replacing', len(plan.files))
+                self.RunTask(engine.Run, engine.Cancel, lambda: self.FinishReplacement(engine))
 
-                    self.ReplaceFolder(folderToExtract, dirName)
 
-                elif nodeType == NodeTypes.arm7directory:
-                    self.ReplaceCodeFolder(Processor.ARM7, dirName)
+    def NodeData(self, index):
+        # The data of a file, overlay file or main code file node.
+        nodeType = self.romFilesystemModel.NodeType(index)
 
-                elif nodeType == NodeTypes.arm9directory:
-                    self.ReplaceCodeFolder(Processor.ARM9, dirName)  
+        self.WaitForReloadExecutionFinishBasedOnNodeType(nodeType)
+        self.session.WriteBackOverlays()
 
-                elif nodeType == NodeTypes.rom:
-                    self.ReplaceFolder(self.ROM.filenames, os.path.join(dirName, 'Filesystem Root'))   
-                    self.ReplaceCodeFolder(Processor.ARM7, os.path.join(dirName, 'ARM7'))   
-                    self.ReplaceCodeFolder(Processor.ARM9, os.path.join(dirName, 'ARM9')) 
+        if nodeType in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9}:
+            return self.ROM.files[self.romFilesystemModel.FileID(index)]
+        elif nodeType == NodeTypes.main9:
+            return self.ROM.arm9
+        elif nodeType == NodeTypes.main7:
+            return self.ROM.arm7
 
-                self.ROMChanged()
+    def ReplaceNodeData(self, index, fileData):
+        # Replaces the data of a file, overlay file or main code file node, and reloads the
+        # code that was in it.
+        nodeType = self.romFilesystemModel.NodeType(index)
+
+        self.WaitForReloadExecutionFinishBasedOnNodeType(nodeType)            
+        self.session.WriteBackOverlays()
+
+        if nodeType in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9}:
+            self.session.ReplaceFile(self.romFilesystemModel.FileID(index), fileData)
+
+        elif nodeType == NodeTypes.main9:
+            self.session.ReplaceMain(Processor.ARM9, fileData)
+
+        elif nodeType == NodeTypes.main7:
+            self.session.ReplaceMain(Processor.ARM7, fileData)
+
+        self.HandleItemChange(index, None)
+        self.ROMChanged()
 
-        self.ReloadCodeBasedOnNodeType(nodeType)              
-        self.SetProgressText('Done.')            
+        if nodeType in {NodeTypes.overlay7, NodeTypes.overlay9}:
+            self.session.ReloadCode(False, self.romFilesystemModel.Processor(index), {self.romFilesystemModel.OverlayID(index)})
+        else:
+            self.ReloadCodeBasedOnNodeType(nodeType)
+
+    def HandleOpen(self):
+        index = self.CurrentIndex()
+        if index is not None:
+            self.OpenInHexEditor(index)
+
+    def OpenInHexEditor(self, index):
+        # Edits are kept in the editor until applied, which replaces the node's data.
+        nodeType = self.romFilesystemModel.NodeType(index)
+        if self.IsBusy() or nodeType not in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9, NodeTypes.main7, NodeTypes.main9}:
+            return
+
+        node = QtCore.QPersistentModelIndex(index)
+        title = self.romFilesystemModel.FilePath(index) if nodeType == NodeTypes.file else self.romFilesystemModel.NodeName(index)
+
+        dialog = HexEditor.HexEditorDialog(self, title, self.NodeData(index), lambda data: self.ReplaceNodeData(QtCore.QModelIndex(node), data))
+        dialog.exec()
+
+
+    def HandleSearch(self):
+        if self.ROM is None or self.IsBusy():
+            return
+
+        kind = self.searchKind.currentData()
+        text = self.searchText.text()
+
+        try:
+            patterns = ROMSearch.ParsePatterns(text.split(',') if kind != 'text' else [text], kind)
+            start = int(self.searchStart.text() or '0', 0)
+            end = int(self.searchEnd.text(), 0) if self.searchEnd.text() else None
+        except ValueError as e:
+            QtWidgets.QMessageBox.information(self, 'Error', str(e))
+            return
+
+        self.WaitForReloadExecutionFinishBasedOnNodeType(NodeTypes.rom)
+        plan = self.session.PlanSearch()
+
+        # Results are listed as they're found, each linked to its node as it is now, since
+        # later edits can change which file a file ID is.
+        self.searchResultsTree.clear()
+        engine = ROMSearch.SearchEngine(plan, patterns, start, end, self.searchAlignment.value(),
+                                        reporter=self.progressReporter, onResults=self.searchResultsFound.emit)
+        self.searchLabels = engine.labels
+        self.progressReporter.Start('Searching', 0, plan.byteCount)
+        self.RunTask(engine.Run, engine.Cancel, lambda: self.SetProgressText(engine.Summary()))
+
+    def SearchTargetName(self, target):
+        if target[0] == 'main':
+            return 'ARM' + str(int(target[1])) + ' main'
+        if target[0] == 'overlay':
+            return 'ARM' + str(int(target[1])) + ' overlay ' + str(target[2])
+        return self.romFilesystemModel.FilePathOfID(target[1]) or 'File ID ' + str(target[1])
+
+    def AddSearchResults(self, results):
+        items = []
+
+        for target, offset, patternIndex in results:
+            index = self.romFilesystemModel.TargetIndex(target)
+            item = QtWidgets.QTreeWidgetItem([self.SearchTargetName(target), hex(offset), self.searchLabels[patternIndex]])
+            item.setData(0, QtCore.Qt.UserRole, None if index is None else QtCore.QPersistentModelIndex(index))
+            items.append(item)
+
+        self.searchResultsTree.addTopLevelItems(items)
+
+    def HandleSearchResultActivated(self, item, column):
+        index = item.data(0, QtCore.Qt.UserRole)
+        if index is None or not index.isValid():
+            return
+
+        self.tabs.setCurrentWidget(self.tab1)
+        self.romFilesystemTreeView.setCurrentIndex(QtCore.QModelIndex(index))
+        self.romFilesystemTreeView.scrollTo(QtCore.QModelIndex(index))
+
+    def FolderOrProcessor(self, index):
+        # What the session plans extractions and replacements of for a directory node; the
+        # ROM node has neither.
+        nodeType = self.romFilesystemModel.NodeType(index)
+
+        if nodeType in {NodeTypes.directory, NodeTypes.filesystem}:
+            return self.romFilesystemModel.Folder(index), None
+        if nodeType in {NodeTypes.arm7directory, NodeTypes.arm9directory}:
+            return None, self.romFilesystemModel.Processor(index)
+        return None, None
+
+    def FinishReplacement(self, engine):
+        if self.session.ApplyReplacement(engine):
+            self.ROMChanged()
+
+            index = self.CurrentIndex()
+            if index is not None:
+                self.HandleItemChange(index, None)
+
+        self.SetProgressText('Done. ' + engine.Summary())
 
                     
     def HandleRename(self):
-        if self.currentNode == None:
+        index = self.CurrentIndex()
+        if index is None:
             return
 
-        nodeType = self.currentNode.data(NodeData.nodeType, QtCore.Qt.UserRole)  
+        nodeType = self.romFilesystemModel.NodeType(index)  
 
         if nodeType in {NodeTypes.directory, NodeTypes.file}:
   
-            name = self.currentNode.text(0)
-            newName, ok = QtWidgets.QInputDialog.getText(self, 'Rename', 'Enter a new name for this ' + 'file' if nodeType == NodeTypes.file else 'folder' + ':', text=name)
+            name = self.romFilesystemModel.NodeName(index)
+            newName, ok = QtWidgets.QInputDialog.getText(self, 'Rename', 'Enter a new name for this ' + ('file' if nodeType == NodeTypes.file else 'folder') + ':', text=name)
             
             if ok:
-                parentFolderPath = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
-                parentFolder = self.ROM.filenames if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath)
-
-                if (nodeType == NodeTypes.file):
-                    for fn in parentFolder.files:
-                        if newName == fn:
-                            QtWidgets.QMessageBox.information(self, 'Error', 'A file with this name already exists in this folder.')
-                            return
-
-                    for i, fn in enumerate(parentFolder.files):
-                        if name == fn:
-                            parentFolder.files[i] = newName
-                            break
-                else:
-                    for dn in parentFolder.folders:
-                        if newName == dn:
-                            QtWidgets.QMessageBox.information(self, 'Error', 'A folder with this name already exists in this folder.')
-                            return
-
-                    for i, (folderName, childFolder) in enumerate(parentFolder.folders):
-                        if name == folderName:
-                            parentFolder.folders[i] = (newName, childFolder)
-                            break
-
-                    self.FixNodesAfterRename(self.currentNode, parentFolderPath, newName)
-
-                self.currentNode.setText(0, newName)
+                parentFolder = self.romFilesystemModel.ParentFolder(index)
+
+                try:
+                    if (nodeType == NodeTypes.file):
+                        self.session.RenameFile(parentFolder, index.row(), newName)
+                    else:
+                        self.session.RenameFolder(parentFolder, name, newName)
+                except ROMSession.ROMEditError as e:
+                    QtWidgets.QMessageBox.information(self, 'Error', str(e))
+                    return
+
+                self.HandleItemChange(index, None)
                 self.ROMChanged()
             else:
                 return
@@ -824,86 +853,48 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
             QtWidgets.QMessageBox.information(self, 'Error', 'These cannot be renamed.')
 
     def HandleRemove(self):
-        if self.currentNode is None:
+        index = self.CurrentIndex()
+        if index is None:
             return
 
-        nodeType = self.currentNode.data(NodeData.nodeType, QtCore.Qt.UserRole)
+        nodeType = self.romFilesystemModel.NodeType(index)
 
-        fileNumber = 0
-        fileId = 0
-        
-        if nodeType in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9}:
-            fileName = self.currentNode.text(0)
-            fileId = self.currentNode.data(NodeData.fileID, QtCore.Qt.UserRole)
+        if self.FileIDs() is None:
+            return
 
-            if nodeType == NodeTypes.file:
-                parentFolderPath = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
-                parentFolder = self.ROM.filenames if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath)
-
-                for fn in parentFolder.files:
-                    if fn == fileName:
-                        parentFolder.files.remove(fn)
-                        break
-            del self.ROM.files[fileId]
-            fileNumber = 1
-
-        elif nodeType in {NodeTypes.directory, NodeTypes.filesystem}:
-            folderName = self.currentNode.text(0)
-            parentFolderPath = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
-            parentFolder = self.ROM.filenames if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath)
-
-            if nodeType == NodeTypes.filesystem:
-                folderToRemove = self.ROM.filenames
-            else:
-                folderToRemove = self.ROM.filenames.subfolder(folderName) if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath + '/' + folderName)
+        if nodeType == NodeTypes.file:
+            self.session.RemoveFile(self.romFilesystemModel.Folder(index), index.row())
 
-            fileNumber = self.GetNumberOfFilesInFolder(folderToRemove)
-            fileId = folderToRemove.firstID
+        elif nodeType in {NodeTypes.overlay7, NodeTypes.overlay9}:
+            self.session.RemoveOverlay(self.romFilesystemModel.Processor(index), self.romFilesystemModel.OverlayID(index))
 
-            del self.ROM.files[fileId : fileId + fileNumber]
+        elif nodeType == NodeTypes.directory:
+            self.session.RemoveFolder(self.romFilesystemModel.ParentFolder(index), self.romFilesystemModel.NodeName(index))
 
-            if nodeType != NodeTypes.filesystem:
-                del parentFolder.folders[ndspy.indexInNamedList(parentFolder.folders, folderName)]
-            else:
-                parentFolder.folders.clear()
-                parentFolder.files.clear()
+        elif nodeType == NodeTypes.filesystem:
+            self.session.ClearFolder(self.romFilesystemModel.Folder(index))
         else:
             QtWidgets.QMessageBox.information(self, 'Error', 'This cannot be deleted...')
+            return
 
-        if nodeType in {NodeTypes.directory, NodeTypes.filesystem, NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9}:
-            self.SetProgressText('Correcting folders...')
-            self.ChangeFolderFirstIDsHigherThanBy(self.ROM.filenames, fileId, -1 * fileNumber)
-
-            self.SetProgressText('Correcting overlays...')
-            self.ChangeOverlayFileIDsHigherThanByAndDelete(fileId, -1 * fileNumber)
-
-            self.UpdateNodeFileIDs(fileId, -1 * fileNumber, self.romTree)
-            
-            if nodeType != NodeTypes.filesystem:
-                self.currentNode.parent().removeChild(self.currentNode)
-            else:
-                count = self.currentNode.childCount()
-                for _i in range (count):
-                    self.currentNode.removeChild(self.currentNode.child(0))
-
-            self.ROMChanged()
-            self.SetProgressText('Done.') 
+        self.ROMChanged()
+        self.SetProgressText('Done.') 
 
 
     def HandleAddFile(self):
-        if self.currentNode is None:
+        index = self.CurrentIndex()
+        if index is None:
             return
 
-        nodeType = self.currentNode.data(NodeData.nodeType, QtCore.Qt.UserRole)
+        nodeType = self.romFilesystemModel.NodeType(index)
 
         if nodeType not in {NodeTypes.file, NodeTypes.overlay7, NodeTypes.overlay9, NodeTypes.main7, NodeTypes.main9,
                             NodeTypes.arm7directory, NodeTypes.arm9directory, NodeTypes.directory, NodeTypes.filesystem}:
             QtWidgets.QMessageBox.information(self, 'Error', 'You cannot add files here...')
             return
 
-        fileId = 0
-        ovId = 0
-        folder = None
+        if self.FileIDs() is None:
+            return
 
         if nodeType in {NodeTypes.file, NodeTypes.directory, NodeTypes.filesystem}:
             newName, ok = QtWidgets.QInputDialog.getText(self, '', 'Enter a new name for the new file:')
@@ -911,148 +902,42 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
             if not ok:
                 return
 
-            fileName = self.currentNode.text(0)
-            fileId = self.currentNode.data(NodeData.fileID, QtCore.Qt.UserRole)
+            folder = self.romFilesystemModel.Folder(index)
 
             if nodeType == NodeTypes.file:
-                parentFolderPath = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
-                folder = self.ROM.filenames if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath)
-                
-                for fn in folder.files:
-                    if newName == fn:
-                        QtWidgets.QMessageBox.information(self, 'Error', 'A file with this name already exists in this folder.')
-                        return
-
-                for i, fn in enumerate(folder.files):
-                    if fn == fileName:
-                        folder.files.insert(i + 1, newName)
-                        self.ROM.files.insert(fileId + 1, b'')
-            else:
-                parentFolderPath = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
-
-                if nodeType == nodeType.filesystem:
-                    folder = self.ROM.filenames
-                else:
-                    folder = self.ROM.filenames.subfolder(self.currentNode.text(0)) if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath + '/' + self.currentNode.text(0))
-
-                for fn in folder.files:
-                    if newName == fn:
-                        QtWidgets.QMessageBox.information(self, 'Error', 'A file with this name already exists in this folder.')
-                        return
-
-                fileId = len(folder.files) + folder.firstID - 1
-
-                if (len(folder.files) == 0):
-                    newfolder = True
-
-                folder.files.insert(len(folder.files), newName)
-                self.ROM.files.insert(fileId + 1, b'')
-
-
-        if nodeType in {NodeTypes.main7, NodeTypes.overlay7, NodeTypes.arm7directory}:
-            fileId = len(self.ROM.files)
-
-            if nodeType == NodeTypes.main7:
-                ovId = -1
-            elif nodeType == NodeTypes.overlay7:
-                ovId = self.currentNode.data(NodeData.overlayID, QtCore.Qt.UserRole)
+                position = index.row() + 1
             else:
-                ovId = len(self.overlays7) - 1
-
-            newoverlays7 = {}
-            for key, overlay in self.overlays7.items():
-                if (key > ovId):
-                    newoverlays7[key + 1] = overlay
-                else:
-                    newoverlays7[key] = overlay
+                position = len(folder.files)
 
-            self.overlays7 = newoverlays7
-
-            self.ROM.files.insert(fileId, b'')
-            self.overlays7[ovId + 1] = ndspy.code.Overlay(b'', 0, 0, 0, 0, 0, fileId, 0, 0)
+            try:
+                self.session.InsertFile(folder, position, newName)
+            except ROMSession.ROMEditError as e:
+                QtWidgets.QMessageBox.information(self, 'Error', str(e))
+                return
 
-        if nodeType in {NodeTypes.main9, NodeTypes.overlay9, NodeTypes.arm9directory}:
-            fileId = len(self.ROM.files)
+        else:
+            processor = self.romFilesystemModel.Processor(index)
+            overlays = self.romFilesystemModel.Overlays(processor)
 
-            if nodeType == NodeTypes.main9:
+            if nodeType in {NodeTypes.main7, NodeTypes.main9}:
                 ovId = -1
-            elif nodeType == NodeTypes.overlay9:
-                ovId = self.currentNode.data(NodeData.overlayID, QtCore.Qt.UserRole)
+            elif nodeType in {NodeTypes.overlay7, NodeTypes.overlay9}:
+                ovId = self.romFilesystemModel.OverlayID(index)
             else:
-                ovId = len(self.overlays9) - 1
-
-            newoverlays9 = {}
-            for key, overlay in self.overlays9.items():
-                if (key > ovId):
-                    newoverlays9[key + 1] = overlay
-                else:
-                    newoverlays9[key] = overlay
-
-            self.overlays9 = newoverlays9
-
-            self.ROM.files.insert(fileId, [])
-            self.overlays9[ovId + 1] = ndspy.code.Overlay(b'', 0, 0, 0, 0, 0, fileId, 0, 0) 
-
-        oldId = 0
-
-        if (folder is not None):
-            oldId = folder.firstID
+                ovId = len(overlays) - 1
 
-        self.SetProgressText('Correcting folders...')
-        self.ChangeFolderFirstIDsHigherThanBy(self.ROM.filenames, fileId, 1)
-
-        self.SetProgressText('Correcting overlays...')
-        self.ChangeOverlayFileIDsHigherThanBy(fileId, 1)
-
-        self.UpdateNodeFileIDs(fileId, 1, self.romTree)
-
-        if (folder is not None):
-            folder.firstID = oldId
-
-        if nodeType in {NodeTypes.file, NodeTypes.filesystem, NodeTypes.directory}:
-            fileNode = QtWidgets.QTreeWidgetItem()
-            fileNode.setText(0, newName)
-            fileNode.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.file)
-            fileNode.setData(NodeData.fileID, QtCore.Qt.UserRole, fileId + 1)  
-
-            if nodeType == NodeTypes.file:
-                parentNodeType = self.currentNode.data(0, QtCore.Qt.UserRole)
-                
-                if parentNodeType == NodeTypes.filesystem:
-                    fileNode.setData(NodeData.path, QtCore.Qt.UserRole, '')
-                else:
-                    fileNode.setData(NodeData.path, QtCore.Qt.UserRole, parentFolderPath)
-                    
-                self.currentNode.parent().insertChild(self.currentNode.parent().indexOfChild(self.currentNode) + 1, fileNode)
-            else:
-                if (nodeType == NodeTypes.filesystem):
-                    fileNode.setData(NodeData.path, QtCore.Qt.UserRole, '')
-                else:
-                    fileNode.setData(NodeData.path, QtCore.Qt.UserRole, parentFolderPath + '/' + self.currentNode.text(0))
-
-                self.currentNode.addChild(fileNode)         
-
-        if nodeType in {NodeTypes.overlay9, NodeTypes.arm9directory, NodeTypes.overlay7, NodeTypes.arm7directory, NodeTypes.main9, NodeTypes.main7}:
-            if nodeType in {NodeTypes.overlay9, NodeTypes.arm9directory, NodeTypes.main9}:
-                ovNode = self.MakeOverlayNode(ovId + 1, self.overlays9[ovId + 1], NodeTypes.overlay9)
-            if nodeType in {NodeTypes.overlay7, NodeTypes.arm7directory, NodeTypes.main7}:
-                ovNode = self.MakeOverlayNode(ovId + 1, self.overlays7[ovId + 1], NodeTypes.overlay7)
-
-            if nodeType in {NodeTypes.overlay7, NodeTypes.overlay9, NodeTypes.main9, NodeTypes.main7}:
-                self.UpdateOverlayNodes(self.currentNode.parent(), ovId)
-                self.currentNode.parent().insertChild(self.currentNode.parent().indexOfChild(self.currentNode) + 1, ovNode)  
-            else:
-                self.currentNode.addChild(ovNode)      
+            self.session.InsertOverlay(processor, ovId)
 
         self.ROMChanged()
         self.SetProgressText('Done.') 
 
 
     def HandleAddFolder(self):
-        if self.currentNode is None:
+        index = self.CurrentIndex()
+        if index is None:
             return
 
-        nodeType = self.currentNode.data(NodeData.nodeType, QtCore.Qt.UserRole)
+        nodeType = self.romFilesystemModel.NodeType(index)
 
         if nodeType not in {NodeTypes.file, NodeTypes.directory, NodeTypes.filesystem}:
             QtWidgets.QMessageBox.information(self, 'Error', 'You cannot add folders here...')
@@ -1063,63 +948,73 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
         if not ok:
             return
 
-        if nodeType == NodeTypes.file:
-            parentFolderPath = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
-            parentFolder = self.ROM.filenames if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath)
+        if self.FileIDs() is None:
+            return
 
-            for fn in parentFolder.folders:
-                if newName == fn:
-                    QtWidgets.QMessageBox.information(self, 'Error', 'A folder with this name already exists in this folder.')
-                    return
+        try:
+            self.session.AddFolder(self.romFilesystemModel.Folder(index), newName)
+        except ROMSession.ROMEditError as e:
+            QtWidgets.QMessageBox.information(self, 'Error', str(e))
+            return
 
-            firstIDOfAddedFolder = len(self.ROM.files)
-            parentFolder.folders.append((newName, ndspy.fnt.Folder([], [], firstIDOfAddedFolder)))   
+        self.ROMChanged()
 
-            parentNodeType = self.currentNode.data(0, QtCore.Qt.UserRole)
-        
-            folderNode = QtWidgets.QTreeWidgetItem()
-            folderNode.setText(0, newName)
-            folderNode.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.directory)
-            folderNode.setData(NodeData.folderFirstID, QtCore.Qt.UserRole, firstIDOfAddedFolder)
 
-            if parentNodeType == NodeTypes.filesystem:
-                folderNode.setData(NodeData.path, QtCore.Qt.UserRole, '')
-            else:
-                folderNode.setData(NodeData.path, QtCore.Qt.UserRole, parentFolderPath)
+    def HandleImportFiles(self):
+        index = self.CurrentIndex()
+        if index is None:
+            return
 
-            self.currentNode.parent().addChild(folderNode)
+        fileNames = QtWidgets.QFileDialog.getOpenFileNames(self, 
+                                                          'Choose files to import...', 
+                                                          '', 
+                                                          'All Files(*)')[0]
+        if fileNames:
+            self.ImportPaths(self.romFilesystemModel.FolderIndex(index), fileNames)
 
-        else:
-            parentFolderPath = self.currentNode.data(NodeData.path, QtCore.Qt.UserRole)
 
-            if nodeType == nodeType.filesystem:
-                folder = self.ROM.filenames
-            else:
-                folder = self.ROM.filenames.subfolder(self.currentNode.text(0)) if parentFolderPath == '' else self.ROM.filenames.subfolder(parentFolderPath + '/' + self.currentNode.text(0))
+    def HandleImportFolder(self):
+        index = self.CurrentIndex()
+        if index is None:
+            return
 
-            for fn in folder.folders:
-                if newName == fn:
-                    QtWidgets.QMessageBox.information(self, 'Error', 'A folder with this name already exists in this folder.')
-                    return
+        dirName = QtWidgets.QFileDialog.getExistingDirectory(self, 
+                                                            'Select a directory to import...',
+                                                            '',
+                                                            QtWidgets.QFileDialog.ShowDirsOnly | QtWidgets.QFileDialog.DontResolveSymlinks)
+        if dirName != '':
+            self.ImportPaths(self.romFilesystemModel.FolderIndex(index), [dirName])
 
-            firstIDOfAddedFolder = len(self.ROM.files)
-            folder.folders.append((newName, ndspy.fnt.Folder([], [], firstIDOfAddedFolder))) 
 
-            folderNode = QtWidgets.QTreeWidgetItem()
-            folderNode.setText(0, newName)
-            folderNode.setData(NodeData.nodeType, QtCore.Qt.UserRole, NodeTypes.directory)
-            folderNode.setData(NodeData.folderFirstID, QtCore.Qt.UserRole, firstIDOfAddedFolder)
+    def ImportPaths(self, folderIndex, paths):
+        # Imports host files and directory trees into a folder. The files are read on a
+        # worker thread; the filename table, file list and IDs are then updated in one pass.
+        if self.FileIDs() is None:
+            return
 
-            if (nodeType == NodeTypes.filesystem):
-                folderNode.setData(NodeData.path, QtCore.Qt.UserRole, '')
-            else:
-                folderNode.setData(NodeData.path, QtCore.Qt.UserRole, parentFolderPath + '/' + self.currentNode.text(0))
+        root = BatchImport.ImportFolder.FromPaths(paths)
+        reader = BatchImport.ImportReader(root, self.progressReporter)
+        folderIndex = QtCore.QPersistentModelIndex(folderIndex)
 
-            self.currentNode.addChild(folderNode)
+        self.progressReporter.Start('Importing', sum(1 for _entry in root.AllFiles()))
+        self.RunTask(reader.Run, reader.Cancel, lambda: self.FinishImport(folderIndex, root))
+
+    def FinishImport(self, folderIndex, root):
+        if not folderIndex.isValid():
+            return
+
+        folderIndex = QtCore.QModelIndex(folderIndex)
+        added, replaced = self.session.Import(self.romFilesystemModel.Folder(folderIndex), root)
+
+        if added or replaced:
+            self.ROMChanged()
+
+        self.HandleItemChange(folderIndex, None)
+        self.SetProgressText('Done. ' + str(added) + ' files added, ' + str(replaced) + ' replaced.')
 
 
     def HandleExtractIcon(self):
-        if self.ROM is None:    
+        if self.ROM is None or self.bannerIcon is None:
             return
         else:
             fileName = QtWidgets.QFileDialog.getSaveFileName(self, 
@@ -1142,6 +1037,8 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
                                                             'Portable Network Graphics (*.png)')[0]
             if fileName == '': return
             else:
+                from PIL import Image
+
                 image = Image.open(fileName)
                 tex, _none, _pal = textureEncoding.encodeImage_Paletted_4BPP(image)
 
@@ -1158,55 +1055,61 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
 
     def HandleItemChange(self, current, previous):
 
-        self.currentNode = current 
-
-        if current is None:
+        if current is None or not current.isValid():
+            self.currentNode = None
             self.selectedFileText.setText('---------')
             self.selectedFileDetails.setText('---------')      
             return    
 
-        nodeType = current.data(0, QtCore.Qt.UserRole) 
+        self.currentNode = QtCore.QPersistentModelIndex(current)
+
+        nodeType = self.romFilesystemModel.NodeType(current)
+        name = self.romFilesystemModel.NodeName(current)
 
         if nodeType == NodeTypes.file:
-            fileName = current.text(0)
-            fileId = current.data(NodeData.fileID, QtCore.Qt.UserRole)
+            fileId = self.romFilesystemModel.FileID(current)
 
-            self.selectedFileText.setText('Selected file: ' + fileName)        
+            self.selectedFileText.setText('Selected file: ' + self.romFilesystemModel.FilePath(current))        
             currentFile = self.ROM.files[fileId]
             self.selectedFileDetails.setText('File ID: ' + str(fileId) + ', File size: ' + str(len(currentFile)) + ' bytes.')
 
         if nodeType in {NodeTypes.directory, NodeTypes.arm7directory, NodeTypes.arm9directory, NodeTypes.rom, NodeTypes.filesystem}:
-            self.selectedFileText.setText('Selected folder: ' + current.text(0))
+            self.selectedFileText.setText('Selected folder: ' + name)
             self.selectedFileDetails.setText('---------')
 
         if nodeType in {NodeTypes.overlay7, NodeTypes.overlay9}:
-            id = current.data(NodeData.overlayID, QtCore.Qt.UserRole)
-            fileId = current.data(NodeData.fileID, QtCore.Qt.UserRole)
-            ramAddress = current.data(NodeData.ramAddress, QtCore.Qt.UserRole)
+            overlay = self.romFilesystemModel.Overlay(current)
+            fileId = self.romFilesystemModel.FileID(current)
 
-            self.selectedFileText.setText('Selected file: Overlay ' + str(id))        
+            self.selectedFileText.setText('Selected file: ' + name)        
             self.selectedFileDetails.setText('Overlay File ID: ' + str(fileId) + 
                                             ' File size: ' + str(len(self.ROM.files[fileId])) + ' bytes.' +
-                                            ' RAM Address: ' + hex(ramAddress))
+                                            ' RAM Address: ' + hex(overlay.ramAddress))
 
         if nodeType in {NodeTypes.main7, NodeTypes.main9}:
-            ramAddress = current.data(NodeData.ramAddress, QtCore.Qt.UserRole)
-            size = current.data(NodeData.size, QtCore.Qt.UserRole)
+            if nodeType == NodeTypes.main9:
+                ramAddress = self.codeLoader.MainFile(Processor.ARM9).ramAddress
+                size = len(self.ROM.arm9)
+            else:
+                ramAddress = self.codeLoader.MainFile(Processor.ARM7).ramAddress
+                size = len(self.ROM.arm7)
 
-            self.selectedFileText.setText('Selected file: ' + current.text(0))        
+            self.selectedFileText.setText('Selected file: ' + name)        
             self.selectedFileDetails.setText('RAM Address: ' + hex(ramAddress) + ', File size: ' + str(size) + ' bytes.')
 
     def CreateContextMenu(self, location):
         if self.romFilesystemTreeView is None:
             return
 
-        if self.currentNode is None:
+        index = self.CurrentIndex()
+        if index is None or self.IsBusy():
             return
 
-        nodeType = self.currentNode.data(0, QtCore.Qt.UserRole)
+        nodeType = self.romFilesystemModel.NodeType(index)
 
         contextMenu = QtWidgets.QMenu()
         openAction = QtWidgets.QAction('&Open...', self)
+        openAction.triggered.connect(self.HandleOpen)
 
         extractAction = QtWidgets.QAction('&Extract...', self)
         extractAction.triggered.connect(self.HandleExtract)
@@ -1226,6 +1129,12 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
         removeActionF = QtWidgets.QAction('&Remove...', self)
         removeActionF.triggered.connect(self.HandleRemove)
 
+        importFilesAction = QtWidgets.QAction('Import &files...', self)
+        importFilesAction.triggered.connect(self.HandleImportFiles)
+
+        importFolderAction = QtWidgets.QAction('Import f&older...', self)
+        importFolderAction.triggered.connect(self.HandleImportFolder)
+
         if nodeType not in {NodeTypes.directory, NodeTypes.arm7directory, NodeTypes.arm9directory, NodeTypes.rom}:
             contextMenu.addAction(openAction)
 
@@ -1234,6 +1143,8 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
 
         if nodeType in {NodeTypes.file, NodeTypes.directory, NodeTypes.filesystem}:
             contextMenu.addAction(addFolderActionF)
+            contextMenu.addAction(importFilesAction)
+            contextMenu.addAction(importFolderAction)
 
         if nodeType not in {NodeTypes.main7, NodeTypes.main9, NodeTypes.arm7directory, NodeTypes.arm9directory, NodeTypes.rom}:
             contextMenu.addAction(removeActionF)
@@ -1244,16 +1155,17 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
         if nodeType in {NodeTypes.file, NodeTypes.directory}:
             contextMenu.addAction(renameAction)
 
-        contextMenu.exec(self.romFilesystemTreeView.mapToGlobal(location))
+        contextMenu.exec(self.romFilesystemTreeView.viewport().mapToGlobal(location))
 
     def CreateAddMenu(self):
         if self.romFilesystemTreeView is None:
             return
 
-        if self.currentNode is None:
+        index = self.CurrentIndex()
+        if index is None:
             return
 
-        nodeType = self.currentNode.data(0, QtCore.Qt.UserRole)
+        nodeType = self.romFilesystemModel.NodeType(index)
 
         if nodeType not in {NodeTypes.file, NodeTypes.directory, NodeTypes.filesystem}:
             self.HandleAddFile()
@@ -1266,10 +1178,18 @@ class FilesystemEditorWidget(QtWidgets.QWidget):
             addFolderAction = QtWidgets.QAction('&Add folder...', self)
             addFolderAction.triggered.connect(self.HandleAddFolder)
 
+            importFilesAction = QtWidgets.QAction('Import &files...', self)
+            importFilesAction.triggered.connect(self.HandleImportFiles)
+
+            importFolderAction = QtWidgets.QAction('Import f&older...', self)
+            importFolderAction.triggered.connect(self.HandleImportFolder)
+
             addMenu.addAction(addFileAction)
             addMenu.addAction(addFolderAction)
+            addMenu.addAction(importFilesAction)
+            addMenu.addAction(importFolderAction)
             addMenu.exec(self.addButton.mapToGlobal(QtCore.QPoint(0,self.addButton.frameGeometry().height())))
 
 
-    def HandleItemActivated(self, item, column):
-        return
\ No newline at end of file
+    def HandleItemActivated(self, index):
+        self.OpenInHexEditor(index)
\ No newline at end of file
@@ -0,0 +1,482 @@
+import ROMSession
+
+from enum import Enum
+from PyQt5 import QtCore
+from ndspy import Processor
+
+class NodeTypes(Enum):
+    rom = 1
+    filesystem = 2
+    directory = 3
+    arm9directory = 4
+    arm7directory = 5
+    main9 = 6
+    main7 = 7
+    overlay9 = 8
+    overlay7 = 9
+    file = 10
+
+CODE_DIRECTORIES = {
+    NodeTypes.arm9directory: (Processor.ARM9, NodeTypes.main9, NodeTypes.overlay9),
+    NodeTypes.arm7directory: (Processor.ARM7, NodeTypes.main7, NodeTypes.overlay7),
+}
+
+class ROMNode:
+
+    # Only the ROM, the filesystem root, folders and the two code directories get a node.
+    # Files, overlays and the main binaries are rows of their parent and share its ROMLeaves.
+
+    def __init__(self, nodeType, parent, name=None, folder=None):
+        self.nodeType = nodeType
+        self.parent = parent
+        self.name = name
+        self.folder = folder
+        self.children = []
+        self.fetched = False
+        self.leaves = ROMLeaves(self)
+
+
+class ROMLeaves:
+
+    def __init__(self, parent):
+        self.parent = parent
+
+
+class ROMFilesystemModel(QtCore.QAbstractItemModel, ROMSession.ROMObserver):
+
+    # A view of a ROMSession; edits go through the session, which reports them back here.
+
+    def __init__(self, editor):
+        super(ROMFilesystemModel, self).__init__(editor)
+
+        self.editor = editor
+        self.session = None
+        self.romNode = None
+        self.folderNodes = {}
+        self.clearedRows = 0
+        self.overlayIDs = {Processor.ARM9: [], Processor.ARM7: []}
+
+    def SetROM(self, session):
+        self.beginResetModel()
+
+        rom = session.rom
+        self.session = session
+        self.paths = session.paths
+        session.observer = self
+        self.romNode = ROMNode(NodeTypes.rom, None, rom.name.decode('utf-8'))
+        self.filesystemNode = ROMNode(NodeTypes.filesystem, self.romNode, 'Filesystem', rom.filenames)
+        self.arm9Node = ROMNode(NodeTypes.arm9directory, self.romNode, 'ARM9')
+        self.arm7Node = ROMNode(NodeTypes.arm7directory, self.romNode, 'ARM7')
+        self.romNode.children = [self.filesystemNode, self.arm9Node, self.arm7Node]
+        self.romNode.fetched = True
+        self.folderNodes = {id(rom.filenames): self.filesystemNode}
+        self.overlayIDs = {Processor.ARM9: [], Processor.ARM7: []}
+
+        self.endResetModel()
+
+    def Clear(self):
+        self.beginResetModel()
+        if self.session is not None:
+            self.session.observer = ROMSession.ROMObserver()
+        self.session = None
+        self.romNode = None
+        self.folderNodes = {}
+        self.endResetModel()
+
+    def ROMRestored(self):
+        # An undo or redo can change anything, so the tree is built again.
+        self.SetROM(self.session)
+        if self.Overlays(Processor.ARM9) is not None:
+            self.CodeLoaded()
+
+    def CodeLoaded(self):
+        for node in (self.arm9Node, self.arm7Node):
+            processor = CODE_DIRECTORIES[node.nodeType][0]
+            overlayIDs = sorted(self.Overlays(processor))
+
+            self.beginInsertRows(self.IndexOf(node), 0, len(overlayIDs))
+            self.overlayIDs[processor] = overlayIDs
+            node.fetched = True
+            self.endInsertRows()
+
+    def Overlays(self, processor):
+        # Only what's in the overlay tables is needed here, so decoding isn't waited for.
+        return self.editor.codeLoader.OverlayObjects(processor)
+
+    def RomIndex(self):
+        return self.IndexOf(self.romNode)
+
+    def FilesystemIndex(self):
+        return self.IndexOf(self.filesystemNode)
+
+    def CodeDirectoryIndex(self, processor):
+        return self.IndexOf(self.arm9Node if processor == Processor.ARM9 else self.arm7Node)
+
+    def IndexOf(self, node):
+        if node is self.romNode:
+            return self.createIndex(0, 0, node)
+
+        parent = node.parent
+
+        if parent.folder is not None:
+            row = len(parent.folder.files) + self.paths.FolderPosition(parent.folder, self.paths.FolderName(node.folder))
+        else:
+            row = parent.children.index(node)
+
+        return self.createIndex(row, 0, node)
+
+    def NodeType(self, index):
+        node = index.internalPointer()
+
+        if isinstance(node, ROMNode):
+            return node.nodeType
+
+        if node.parent.folder is not None:
+            return NodeTypes.file
+
+        _processor, mainType, overlayType = CODE_DIRECTORIES[node.parent.nodeType]
+        return mainType if index.row() == 0 else overlayType
+
+    def NodeName(self, index):
+        node = index.internalPointer()
+
+        if isinstance(node, ROMLeaves):
+            if node.parent.folder is not None:
+                return node.parent.folder.files[index.row()]
+            if index.row() == 0:
+                return 'Main ' + node.parent.name
+            return 'Overlay ' + str(self.OverlayID(index))
+
+        if node.nodeType == NodeTypes.directory:
+            return self.paths.FolderName(node.folder)
+
+        return node.name
+
+    def FilePath(self, index):
+        return self.paths.FilePath(self.Folder(index), index.row())
+
+    def FilePathOfID(self, fileID):
+        # The path of a file in the filename table by ID, or None for overlays and files
+        # that aren't in it.
+        try:
+            segment, row = self.session.FileIDs().Find(fileID)
+        except ValueError:
+            return None
+
+        if segment is None or not hasattr(segment, 'files'):
+            return None
+
+        return self.paths.FilePath(segment, row)
+
+    def Processor(self, index):
+        node = index.internalPointer()
+        if isinstance(node, ROMLeaves):
+            node = node.parent
+        return CODE_DIRECTORIES[node.nodeType][0]
+
+    def OverlayID(self, index):
+        return self.overlayIDs[self.Processor(index)][index.row() - 1]
+
+    def Overlay(self, index):
+        return self.Overlays(self.Processor(index))[self.OverlayID(index)]
+
+    def Folder(self, index):
+        # The folder a directory node stands for, or the folder a file lives in.
+        node = index.internalPointer()
+        return node.folder if isinstance(node, ROMNode) else node.parent.folder
+
+    def ParentFolder(self, index):
+        node = index.internalPointer()
+        return node.parent.folder
+
+    def FolderIndex(self, index):
+        return index.parent() if self.NodeType(index) == NodeTypes.file else index
+
+    def FolderNodeIndex(self, folder):
+        # The index of a folder's node, fetching the folders down to it.
+        node = self.folderNodes.get(id(folder))
+
+        if node is None:
+            self.fetchMore(self.FolderNodeIndex(self.paths.ParentFolder(folder)))
+            node = self.folderNodes[id(folder)]
+
+        index = self.IndexOf(node)
+        self.fetchMore(index)
+        return index
+
+    def TargetIndex(self, target):
+        # The index of a ROMSearch target: ('file', file ID), ('main', processor) or
+        # ('overlay', processor, overlay ID). None for files outside the filename table.
+        if target[0] == 'main':
+            return self.index(0, 0, self.CodeDirectoryIndex(target[1]))
+
+        if target[0] == 'overlay':
+            overlayIDs = self.overlayIDs[target[1]]
+            if target[2] not in overlayIDs:
+                return None
+            return self.index(overlayIDs.index(target[2]) + 1, 0, self.CodeDirectoryIndex(target[1]))
+
+        try:
+            segment, row = self.session.FileIDs().Find(target[1])
+        except ValueError:
+            return None
+
+        if segment is None or not hasattr(segment, 'files'):
+            return None
+
+        return self.index(row, 0, self.FolderNodeIndex(segment))
+
+    def FileID(self, index):
+        nodeType = self.NodeType(index)
+
+        fileIDs = self.session.fileIDs
+
+        if nodeType == NodeTypes.file:
+            folder = self.Folder(index)
+            return (folder.firstID if fileIDs is None else fileIDs.FirstID(folder)) + index.row()
+        if nodeType in {NodeTypes.overlay7, NodeTypes.overlay9}:
+            overlay = self.Overlay(index)
+            return overlay.fileID if fileIDs is None else fileIDs.FirstID(overlay)
+        return None
+
+    # Qt model interface
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+
+        if not parent.isValid():
+            return self.createIndex(row, column, self.romNode)
+
+        node = parent.internalPointer()
+
+        if node.folder is not None:
+            fileCount = len(node.folder.files)
+            if row < fileCount:
+                return self.createIndex(row, column, node.leaves)
+            return self.createIndex(row, column, node.children[row - fileCount])
+
+        if node.nodeType in CODE_DIRECTORIES:
+            return self.createIndex(row, column, node.leaves)
+
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+
+        parentNode = index.internalPointer().parent
+        if parentNode is None:
+            return QtCore.QModelIndex()
+
+        return self.IndexOf(parentNode)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+
+        if not parent.isValid():
+            return 0 if self.romNode is None else 1
+
+        node = parent.internalPointer()
+
+        if isinstance(node, ROMLeaves) or not node.fetched:
+            return 0
+        if node.folder is not None:
+            return len(node.folder.files) + len(node.children)
+        if node.nodeType in CODE_DIRECTORIES:
+            return 1 + len(self.overlayIDs[CODE_DIRECTORIES[node.nodeType][0]])
+        return len(node.children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return self.romNode is not None
+
+        node = parent.internalPointer()
+
+        if isinstance(node, ROMLeaves):
+            return False
+        if node.folder is not None and not node.fetched:
+            return bool(node.folder.files or node.folder.folders)
+        return self.rowCount(parent) > 0 or not node.fetched
+
+    def canFetchMore(self, parent):
+        if not parent.isValid():
+            return False
+
+        node = parent.internalPointer()
+        return isinstance(node, ROMNode) and node.folder is not None and not node.fetched
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+
+        node = parent.internalPointer()
+        count = len(node.folder.files) + len(node.folder.folders)
+
+        if count:
+            self.beginInsertRows(parent, 0, count - 1)
+        node.children = [self.AddFolderNode(node, childFolder) for _folderName, childFolder in node.folder.folders]
+        node.fetched = True
+        if count:
+            self.endInsertRows()
+
+    def flags(self, index):
+        flags = super().flags(index)
+
+        if index.isValid() and self.NodeType(index) in {NodeTypes.directory, NodeTypes.filesystem}:
+            flags |= QtCore.Qt.ItemIsDropEnabled
+
+        return flags
+
+    # Host files and directories dropped onto a folder are imported into it.
+
+    def mimeTypes(self):
+        return ['text/uri-list']
+
+    def supportedDropActions(self):
+        return QtCore.Qt.CopyAction
+
+    def DroppedPaths(self, data):
+        paths = [url.toLocalFile() for url in data.urls() if url.isLocalFile()]
+        return paths if paths and len(paths) == len(data.urls()) else None
+
+    def canDropMimeData(self, data, action, row, column, parent):
+        return (data.hasUrls() and parent.isValid() and not self.editor.IsBusy()
+                and self.NodeType(parent) in {NodeTypes.directory, NodeTypes.filesystem}
+                and self.DroppedPaths(data) is not None)
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if not self.canDropMimeData(data, action, row, column, parent):
+            return False
+
+        self.editor.ImportPaths(parent, self.DroppedPaths(data))
+        return True
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+
+        return self.NodeName(index)
+
+    # ROMSession observer hooks. Only folders whose node has been fetched have rows to tell
+    # the view about; the others pick up the edits when they are expanded.
+
+    def FetchedNode(self, folder):
+        node = self.folderNodes.get(id(folder))
+        return node if node is not None and node.fetched else None
+
+    def AddFolderNode(self, parentNode, folder):
+        node = ROMNode(NodeTypes.directory, parentNode, folder=folder)
+        self.folderNodes[id(folder)] = node
+        return node
+
+    def DropFolderNodes(self, node):
+        self.folderNodes.pop(id(node.folder), None)
+        for childNode in node.children:
+            self.DropFolderNodes(childNode)
+
+    def BeginInsertFiles(self, folder, position, count):
+        node = self.FetchedNode(folder)
+        if node is not None:
+            self.beginInsertRows(self.IndexOf(node), position, position + count - 1)
+
+    def EndInsertFiles(self, folder):
+        if self.FetchedNode(folder) is not None:
+            self.endInsertRows()
+
+    def BeginRemoveFiles(self, folder, position, count):
+        node = self.FetchedNode(folder)
+        if node is not None:
+            self.beginRemoveRows(self.IndexOf(node), position, position + count - 1)
+
+    def EndRemoveFiles(self, folder):
+        if self.FetchedNode(folder) is not None:
+            self.endRemoveRows()
+
+    def FileRenamed(self, folder, row):
+        node = self.FetchedNode(folder)
+        if node is not None:
+            index = self.index(row, 0, self.IndexOf(node))
+            self.dataChanged.emit(index, index)
+
+    def BeginInsertFolder(self, parentFolder, position):
+        node = self.FetchedNode(parentFolder)
+        if node is not None:
+            row = len(parentFolder.files) + position
+            self.beginInsertRows(self.IndexOf(node), row, row)
+
+    def EndInsertFolder(self, parentFolder, folder):
+        node = self.FetchedNode(parentFolder)
+        if node is not None:
+            node.children.append(self.AddFolderNode(node, folder))
+            self.endInsertRows()
+
+    def BeginRemoveFolder(self, parentFolder, position):
+        node = self.FetchedNode(parentFolder)
+        if node is not None:
+            row = len(parentFolder.files) + position
+            self.beginRemoveRows(self.IndexOf(node), row, row)
+
+    def EndRemoveFolder(self, parentFolder, folder):
+        node = self.FetchedNode(parentFolder)
+        if node is None:
+            return
+
+        childNode = next(childNode for childNode in node.children if childNode.folder is folder)
+        node.children.remove(childNode)
+        self.DropFolderNodes(childNode)
+        self.endRemoveRows()
+
+    def FolderRenamed(self, parentFolder, position):
+        node = self.FetchedNode(parentFolder)
+        if node is not None:
+            index = self.index(len(parentFolder.files) + position, 0, self.IndexOf(node))
+            self.dataChanged.emit(index, index)
+
+    def BeginClearFolder(self, folder):
+        node = self.FetchedNode(folder)
+        self.clearedRows = 0 if node is None else len(folder.files) + len(node.children)
+
+        if self.clearedRows:
+            self.beginRemoveRows(self.IndexOf(node), 0, self.clearedRows - 1)
+
+    def EndClearFolder(self, folder):
+        node = self.FetchedNode(folder)
+        if node is None:
+            return
+
+        for childNode in node.children:
+            self.DropFolderNodes(childNode)
+        node.children = []
+
+        if self.clearedRows:
+            self.endRemoveRows()
+
+    def OverlayInserted(self, processor, overlayID):
+        parent = self.CodeDirectoryIndex(processor)
+        overlayIDs = sorted(self.Overlays(processor))
+        row = 1 + overlayIDs.index(overlayID)
+
+        self.beginInsertRows(parent, row, row)
+        self.overlayIDs[processor] = overlayIDs
+        self.endInsertRows()
+
+        last = len(overlayIDs)
+        if row < last:
+            self.dataChanged.emit(self.index(row + 1, 0, parent), self.index(last, 0, parent))
+
+    def OverlaysRemoved(self, processor):
+        # Drops the rows of overlays that are gone from the overlay dictionary.
+        parent = self.CodeDirectoryIndex(processor)
+        overlays = self.Overlays(processor)
+        overlayIDs = self.overlayIDs[processor]
+
+        for i in reversed(range(len(overlayIDs))):
+            if overlayIDs[i] not in overlays:
+                self.beginRemoveRows(parent, i + 1, i + 1)
+                del overlayIDs[i]
+                self.endRemoveRows()
@@ -0,0 +1,266 @@
+import string
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PieceTable import PieceTable
+
+BYTES_PER_ROW = 16
+
+HEX_DIGITS = '0123456789abcdefABCDEF'
+PRINTABLE = set(string.printable.encode('ascii')) - set(b'\t\n\r\x0b\x0c')
+
+class HexView(QtWidgets.QAbstractScrollArea):
+
+    # A hex and ASCII view of a PieceTable. Only the rows on screen are read and painted,
+    # so how big the data is makes no difference. Typing overwrites, or inserts after
+    # Insert is pressed; Tab switches between the hex and ASCII columns.
+
+    cursorMoved = QtCore.pyqtSignal()
+    edited = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(HexView, self).__init__(parent)
+
+        self.document = PieceTable(b'')
+        self.cursor = 0
+        self.lowNibble = False
+        self.inAscii = False
+        self.insertMode = False
+
+        self.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.setFocusPolicy(QtCore.Qt.StrongFocus)
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)
+        self.UpdateMetrics()
+
+    def UpdateMetrics(self):
+        metrics = self.fontMetrics()
+        self.charWidth = metrics.horizontalAdvance('0')
+        self.lineHeight = metrics.height()
+        self.ascent = metrics.ascent()
+
+        self.hexX = self.charWidth * 10
+        self.asciiX = self.hexX + self.charWidth * (BYTES_PER_ROW * 3 + 1)
+        self.setMinimumWidth(self.asciiX + self.charWidth * (BYTES_PER_ROW + 1) + self.verticalScrollBar().sizeHint().width())
+
+    def SetData(self, data):
+        self.document = PieceTable(data)
+        self.cursor = min(self.cursor, self.LastCursor())
+        self.lowNibble = False
+        self.UpdateScrollBar()
+        self.viewport().update()
+        self.cursorMoved.emit()
+
+    def Data(self):
+        return self.document.ToBytes()
+
+    def IsModified(self):
+        return self.document.IsModified()
+
+    def SetInsertMode(self, insertMode):
+        self.insertMode = insertMode
+        self.MoveCursor(self.cursor)
+
+    def VisibleRows(self):
+        return max(1, self.viewport().height() // self.lineHeight)
+
+    def LastCursor(self):
+        # The cursor can sit after the last byte only when that's somewhere to insert.
+        if self.insertMode or not len(self.document):
+            return len(self.document)
+        return len(self.document) - 1
+
+    def UpdateScrollBar(self):
+        rows = len(self.document) // BYTES_PER_ROW + 1
+        scrollBar = self.verticalScrollBar()
+        scrollBar.setRange(0, max(0, rows - self.VisibleRows()))
+        scrollBar.setPageStep(self.VisibleRows())
+
+    def MoveCursor(self, offset, lowNibble=False):
+        self.cursor = max(0, min(offset, self.LastCursor()))
+        self.lowNibble = lowNibble and self.cursor < len(self.document)
+
+        row = self.cursor // BYTES_PER_ROW
+        scrollBar = self.verticalScrollBar()
+        if row < scrollBar.value():
+            scrollBar.setValue(row)
+        elif row >= scrollBar.value() + self.VisibleRows():
+            scrollBar.setValue(row - self.VisibleRows() + 1)
+
+        self.viewport().update()
+        self.cursorMoved.emit()
+
+    def Edit(self, value, nibble):
+        # Writes a byte, or one nibble of it, at the cursor and moves on.
+        atEnd = self.cursor >= len(self.document)
+
+        if (self.insertMode and not self.lowNibble) or atEnd:
+            self.document.Insert(self.cursor, bytes([value << 4 if nibble else value]))
+        else:
+            old = self.document.Read(self.cursor, 1)[0]
+            if nibble:
+                value = (old & 0x0F) | (value << 4) if not self.lowNibble else (old & 0xF0) | value
+            self.document.Replace(self.cursor, bytes([value]))
+
+        self.UpdateScrollBar()
+        self.edited.emit()
+
+        if nibble and not self.lowNibble:
+            self.MoveCursor(self.cursor, True)
+        else:
+            self.MoveCursor(self.cursor + 1)
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        control = event.modifiers() & QtCore.Qt.ControlModifier
+        page = self.VisibleRows() * BYTES_PER_ROW
+        moves = {QtCore.Qt.Key_Left: -1, QtCore.Qt.Key_Right: 1, QtCore.Qt.Key_Up: -BYTES_PER_ROW,
+                 QtCore.Qt.Key_Down: BYTES_PER_ROW, QtCore.Qt.Key_PageUp: -page, QtCore.Qt.Key_PageDown: page}
+
+        if key in moves:
+            self.MoveCursor(self.cursor + moves[key])
+        elif key == QtCore.Qt.Key_Home:
+            self.MoveCursor(0 if control else self.cursor - self.cursor % BYTES_PER_ROW)
+        elif key == QtCore.Qt.Key_End:
+            self.MoveCursor(len(self.document) if control else self.cursor - self.cursor % BYTES_PER_ROW + BYTES_PER_ROW - 1)
+        elif key == QtCore.Qt.Key_Tab:
+            self.inAscii = not self.inAscii
+            self.MoveCursor(self.cursor)
+        elif key == QtCore.Qt.Key_Insert:
+            self.SetInsertMode(not self.insertMode)
+        elif key in {QtCore.Qt.Key_Delete, QtCore.Qt.Key_Backspace} and self.insertMode:
+            # Only in insert mode, so that the size doesn't change by accident.
+            offset = self.cursor if key == QtCore.Qt.Key_Delete else self.cursor - 1
+            if 0 <= offset < len(self.document):
+                self.document.Delete(offset, 1)
+                self.UpdateScrollBar()
+                self.edited.emit()
+                self.MoveCursor(offset)
+        elif not control and event.text() and not self.inAscii and event.text() in HEX_DIGITS:
+            self.Edit(int(event.text(), 16), True)
+        elif not control and event.text() and self.inAscii and len(event.text()) == 1 and ord(event.text()) in PRINTABLE:
+            self.Edit(ord(event.text()), False)
+        else:
+            super(HexView, self).keyPressEvent(event)
+
+    def focusNextPrevChild(self, next):
+        # Tab switches columns instead of moving focus.
+        return False
+
+    def mousePressEvent(self, event):
+        row = self.verticalScrollBar().value() + event.y() // self.lineHeight
+        x = event.x()
+
+        if self.hexX <= x < self.asciiX - self.charWidth:
+            column, position = divmod(x - self.hexX, self.charWidth * 3)
+            self.inAscii = False
+            self.MoveCursor(row * BYTES_PER_ROW + min(column, BYTES_PER_ROW - 1), position >= self.charWidth)
+        elif x >= self.asciiX:
+            self.inAscii = True
+            self.MoveCursor(row * BYTES_PER_ROW + min((x - self.asciiX) // self.charWidth, BYTES_PER_ROW - 1))
+
+    def resizeEvent(self, event):
+        super(HexView, self).resizeEvent(event)
+        self.UpdateScrollBar()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self.viewport())
+        palette = self.palette()
+        painter.fillRect(event.rect(), palette.color(QtGui.QPalette.Base))
+
+        firstRow = self.verticalScrollBar().value()
+        offset = firstRow * BYTES_PER_ROW
+        size = (self.VisibleRows() + 1) * BYTES_PER_ROW
+
+        data = bytearray()
+        edited = []
+        for chunk, chunkEdited in self.document.Chunks(offset, size):
+            data.extend(chunk)
+            edited.extend([chunkEdited] * len(chunk))
+
+        text = palette.color(QtGui.QPalette.Text)
+        dim = palette.color(QtGui.QPalette.Mid)
+        editedColor = QtGui.QColor('red')
+
+        # The cursor's byte is highlighted in the column being typed in and outlined in
+        # the other one.
+        if offset <= self.cursor < offset + size:
+            row, column = divmod(self.cursor - offset, BYTES_PER_ROW)
+            y = row * self.lineHeight
+            hexRect = QtCore.QRect(self.hexX + column * 3 * self.charWidth + (self.charWidth if self.lowNibble else 0), y,
+                                   self.charWidth * (1 if self.insertMode or self.lowNibble else 2), self.lineHeight)
+            asciiRect = QtCore.QRect(self.asciiX + column * self.charWidth, y, self.charWidth, self.lineHeight)
+
+            highlight = palette.color(QtGui.QPalette.Highlight)
+            painter.fillRect(asciiRect if self.inAscii else hexRect, highlight)
+            painter.setPen(highlight)
+            painter.drawRect((hexRect if self.inAscii else asciiRect).adjusted(0, 0, -1, -1))
+
+        for row in range((len(data) + BYTES_PER_ROW - 1) // BYTES_PER_ROW or 1):
+            y = row * self.lineHeight + self.ascent
+            painter.setPen(dim)
+            painter.drawText(0, y, format(offset + row * BYTES_PER_ROW, '08X'))
+
+            for column in range(BYTES_PER_ROW):
+                i = row * BYTES_PER_ROW + column
+                if i >= len(data):
+                    break
+
+                painter.setPen(editedColor if edited[i] else text)
+                painter.drawText(self.hexX + column * 3 * self.charWidth, y, format(data[i], '02X'))
+                painter.drawText(self.asciiX + column * self.charWidth, y, chr(data[i]) if data[i] in PRINTABLE else '.')
+
+
+class HexEditorDialog(QtWidgets.QDialog):
+
+    # Views and edits data in a HexView. Edits stay in the view's piece table until
+    # they're applied, which passes the edited data to apply.
+
+    def __init__(self, parent, title, data, apply):
+        super(HexEditorDialog, self).__init__(parent)
+
+        self.apply = apply
+        self.setWindowTitle(title)
+
+        self.view = HexView(self)
+        self.view.cursorMoved.connect(self.UpdateStatus)
+        self.view.edited.connect(self.UpdateStatus)
+
+        self.statusLabel = QtWidgets.QLabel(self)
+
+        self.buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Apply | QtWidgets.QDialogButtonBox.Cancel, self)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        self.buttons.button(QtWidgets.QDialogButtonBox.Apply).clicked.connect(self.Apply)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.view)
+        layout.addWidget(self.statusLabel)
+        layout.addWidget(self.buttons)
+
+        self.resize(self.view.minimumWidth() + 40, 480)
+        self.view.SetData(data)
+        self.view.setFocus()
+
+    def UpdateStatus(self):
+        view = self.view
+        self.statusLabel.setText('Offset: ' + hex(view.cursor) + ' of ' + hex(len(view.document))
+                                 + ('  Insert' if view.insertMode else '  Overwrite')
+                                 + ('  (edited)' if view.IsModified() else ''))
+        self.buttons.button(QtWidgets.QDialogButtonBox.Apply).setEnabled(view.IsModified())
+
+    def Apply(self):
+        if self.view.IsModified():
+            data = self.view.Data()
+            self.apply(data)
+            self.view.SetData(data)
+
+    def accept(self):
+        self.Apply()
+        super(HexEditorDialog, self).accept()
+
+    def reject(self):
+        if self.view.IsModified():
+            answer = QtWidgets.QMessageBox.question(self, 'Discard changes', 'Discard the changes that haven\'t been applied?')
+            if answer != QtWidgets.QMessageBox.Yes:
+                return
+
+        super(HexEditorDialog, self).reject()
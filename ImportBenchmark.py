@@ -0,0 +1,89 @@
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# Measures what starting the GUI and the command line costs in imports, using Python's
+# -X importtime, and fails if either goes over its budget or loads a module it shouldn't.
+#
+#     python ImportBenchmark.py [--runs N] [--gui-budget MS] [--cli-budget MS]
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# What each entry point imports before it can do anything: the GUI up to showing the
+# window, which ndspy-gui.py's main() imports, the command line up to parsing its arguments.
+GUI_CODE = ("import importlib.util\n"
+            "spec = importlib.util.spec_from_file_location('ndspygui', 'ndspy-gui.py')\n"
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+            "import MainWindow\n")
+CLI_CODE = "import ROMCommandLine\n"
+
+# Modules that are only needed once a ROM is open (or never, for the command line).
+GUI_DEFERRED = ('PIL', 'numpy', 'ndspy.rom', 'ndspy._common', 'ndspy.graphics2D', 'PyQt5.Qt', 'multiprocessing.context')
+CLI_DEFERRED = ('PyQt5', 'PIL', 'numpy', 'ndspy.rom')
+
+def MeasureImports(code):
+    """
+    Runs code in a fresh interpreter with -X importtime. Returns the total import time in
+    milliseconds and {module name: cumulative microseconds} for everything imported.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+
+    modules = {}
+    total = 0
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+
+        modules[name.strip()] = int(cumulative)
+
+        # Only top-level imports count towards the total; the rest are inside them.
+        if name[1:2] != ' ':
+            total += int(cumulative)
+
+    return total / 1000, modules
+
+
+def Check(label, code, budget, deferred, runs, out):
+    # Returns whether the entry point is within its budget and loads nothing deferred.
+    times = []
+    modules = {}
+
+    for _run in range(runs):
+        total, modules = MeasureImports(code)
+        times.append(total)
+
+    median = statistics.median(times)
+    loaded = [name for name in modules if any(name == d or name.startswith(d + '.') for d in deferred)]
+
+    out.write(label + ': ' + format(median, '.1f') + ' ms median over ' + str(runs) + ' runs (budget ' + str(budget) + ' ms)\n')
+    for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:10]:
+        out.write('    ' + format(cumulative / 1000, '8.1f') + ' ms  ' + name + '\n')
+
+    if loaded:
+        out.write('  loads modules it should defer: ' + ', '.join(sorted(loaded)) + '\n')
+
+    return median <= budget and not loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the startup import cost of ndspy-gui.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--gui-budget', type=float, default=300, help='milliseconds')
+    parser.add_argument('--cli-budget', type=float, default=150, help='milliseconds')
+    args = parser.parse_args(argv)
+
+    ok = Check('GUI', GUI_CODE, args.gui_budget, GUI_DEFERRED, args.runs, sys.stdout)
+    ok = Check('Command line', CLI_CODE, args.cli_budget, CLI_DEFERRED, args.runs, sys.stdout) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,369 @@
+import mmap
+import os
+import bisect
+import struct
+import collections
+import ndspy.rom
+import ndspy.fnt
+import ndspy.code
+import BlobStore
+
+from collections.abc import MutableSequence
+from ndspy import _common
+
+ICON_BANNER_LENGTHS = {0x0001: 0x840, 0x0002: 0x940, 0x0003: 0x1240, 0x0103: 0x23C0}
+
+# Header values that saving in place copies from the existing image; if any of them were
+# edited the ROM has to be rebuilt.
+HEADER_ATTRIBUTES = ('name', 'idCode', 'developerCode', 'unitCode', 'encryptionSeedSelect', 'deviceCapacity',
+                     'pad015', 'pad016', 'pad017', 'pad018', 'pad019', 'pad01A', 'pad01B', 'pad01C',
+                     'region', 'version', 'autostart', 'arm9EntryAddress', 'arm9RamAddress',
+                     'arm7EntryAddress', 'arm7RamAddress', 'normalCardControlRegisterSettings',
+                     'secureCardControlRegisterSettings', 'secureAreaChecksum', 'secureTransferDelay',
+                     'arm9CodeSettingsPointerAddress', 'arm7CodeSettingsPointerAddress', 'secureAreaDisable',
+                     'pad088', 'nintendoLogo', 'debugRomAddress', 'pad16C')
+
+class LazyFileList(MutableSequence):
+
+    # Entries are either (start, end) pairs from the FAT, resolved to zero-copy views
+    # of the mapped ROM on access, or the data a file has been replaced with, held in a
+    # BlobStore so that files given the same data share one copy of it. Slots keep the
+    # range each file occupies in the mapped image, or None for files added since.
+
+    def __init__(self, romMap, fat, identity):
+        self.romMap = romMap
+        self.romView = memoryview(romMap)
+        self.identity = identity
+        self.entries = [struct.unpack_from('<II', fat, 8 * i) for i in range(len(fat) // 8)]
+        self.slots = list(self.entries)
+        self.store = BlobStore.BlobStore()
+
+    def Release(self, entries):
+        for entry in entries:
+            if not isinstance(entry, tuple):
+                self.store.Release(entry)
+
+    def Resolve(self, entry):
+        if isinstance(entry, tuple):
+            return self.romView[entry[0] : entry[1]]
+        return entry
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.Resolve(entry) for entry in self.entries[index]]
+        return self.Resolve(self.entries[index])
+
+    def __setitem__(self, index, data):
+        if isinstance(index, slice):
+            data = [self.store.Add(fileData) for fileData in data]
+            slots = self.slots[index]
+            self.Release(self.entries[index])
+            self.entries[index] = data
+            self.slots[index] = slots if len(slots) == len(data) else [None] * len(data)
+        else:
+            data = self.store.Add(data)
+            self.Release([self.entries[index]])
+            self.entries[index] = data
+
+    def __delitem__(self, index):
+        self.Release(self.entries[index] if isinstance(index, slice) else [self.entries[index]])
+        del self.entries[index]
+        del self.slots[index]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def insert(self, index, data):
+        self.entries.insert(index, self.store.Add(data))
+        self.slots.insert(index, None)
+
+    def SetEntries(self, start, end, entries):
+        # Puts back entries the way undoing or redoing an edit has them. Mapped ranges get
+        # their slots back; files given data don't, so saving won't write them in place.
+        entries = [self.store.Add(entry) for entry in entries]
+        self.Release(self.entries[start : end])
+        self.entries[start : end] = entries
+        self.slots[start : end] = [entry if isinstance(entry, tuple) else None for entry in entries]
+
+    def IsMapped(self, index):
+        return isinstance(self.entries[index], tuple)
+
+    def FileSize(self, index):
+        entry = self.entries[index]
+        if isinstance(entry, tuple):
+            return entry[1] - entry[0]
+        return len(entry)
+
+    def Materialize(self, index):
+        entry = self.entries[index]
+        if isinstance(entry, tuple):
+            entry = self.entries[index] = self.store.Add(bytes(self.romView[entry[0] : entry[1]]))
+        return entry
+
+    def IsMapping(self, fileName):
+        if self.romMap.closed:
+            return False
+
+        try:
+            st = os.stat(fileName)
+        except OSError:
+            return False
+
+        return (st.st_dev, st.st_ino) == self.identity
+
+    def Detach(self):
+        for i in range(len(self.entries)):
+            self.Materialize(i)
+
+        self.romView.release()
+        try:
+            self.romMap.close()
+        except BufferError:
+            pass
+
+    def Remap(self, fileName):
+        # Points every entry at a freshly saved image of the same files, dropping the data
+        # held for replaced files. The old mapping stays alive for as long as views of it do.
+        with open(fileName, 'rb') as f:
+            romMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            st = os.fstat(f.fileno())
+
+        fatOffset, fatLen = struct.unpack_from('<2I', romMap, 0x48)
+        entries = [struct.unpack_from('<II', romMap, fatOffset + 8 * i) for i in range(fatLen // 8)]
+
+        if len(entries) != len(self.entries):
+            romMap.close()
+            return
+
+        self.romMap = romMap
+        self.romView = memoryview(romMap)
+        self.identity = (st.st_dev, st.st_ino)
+        self.entries = entries
+        self.slots = list(entries)
+        self.store = BlobStore.BlobStore()
+
+
+class LazyNintendoDSRom(ndspy.rom.NintendoDSRom):
+
+    @classmethod
+    def fromFile(cls, fileName, index=None):
+        # Given a ROMIndex of the file, its filename table and FAT are taken from that.
+        with open(fileName, 'rb') as f:
+            romMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            st = os.fstat(f.fileno())
+
+        romSize = len(romMap)
+
+        # ndspy only gets to parse the header; everything past it is taken from the mapping
+        # below instead of being copied out of a full read of the file.
+        header = bytearray(romMap[0 : 0x200].ljust(0x200, b'\0'))
+
+        (arm9Offset, _arm9Entry, _arm9Ram, arm9Len, 
+        arm7Offset, _arm7Entry, _arm7Ram, arm7Len, 
+        fntOffset, fntLen, fatOffset, fatLen, 
+        arm9OvTOffset, arm9OvTLen, arm7OvTOffset, arm7OvTLen) = struct.unpack_from('<16I', header, 0x20)
+
+        iconBannerOffset, = struct.unpack_from('<I', header, 0x68)
+        romSizeOrRsaSigOffset, = struct.unpack_from('<I', header, 0x80)
+        debugRomOffset, debugRomSize = struct.unpack_from('<2I', header, 0x160)
+
+        struct.pack_into('<I', header, 0x68, 0)
+        rom = cls(bytes(header))
+
+        rom.pad200 = romMap[0x200 : min(arm9Offset, romSize)]
+
+        realSigOffset = 0
+        if romSize >= 0x1004:
+            realSigOffset, = struct.unpack_from('<I', romMap, 0x1000)
+        if not realSigOffset and romSize > romSizeOrRsaSigOffset:
+            realSigOffset = romSizeOrRsaSigOffset
+        rom.rsaSignature = romMap[realSigOffset : min(romSize, realSigOffset + 0x88)] if realSigOffset else b''
+
+        rom.arm9 = romMap[arm9Offset : arm9Offset + arm9Len]
+        rom.arm7 = romMap[arm7Offset : arm7Offset + arm7Len]
+        rom.arm9OverlayTable = romMap[arm9OvTOffset : arm9OvTOffset + arm9OvTLen]
+        rom.arm7OverlayTable = romMap[arm7OvTOffset : arm7OvTOffset + arm7OvTLen]
+
+        if iconBannerOffset:
+            version, = struct.unpack_from('<H', romMap, iconBannerOffset)
+            iconBannerLen = ICON_BANNER_LENGTHS.get(version, ICON_BANNER_LENGTHS[1])
+            rom.iconBanner = romMap[iconBannerOffset : iconBannerOffset + iconBannerLen]
+        else:
+            rom.iconBanner = b''
+
+        rom.debugRom = romMap[debugRomOffset : debugRomOffset + debugRomSize] if debugRomOffset else b''
+
+        arm9PostData = bytearray()
+        arm9PostDataOffset = arm9Offset + arm9Len
+        while romMap[arm9PostDataOffset : arm9PostDataOffset + 4] == b'\x21\x06\xC0\xDE':
+            arm9PostData.extend(romMap[arm9PostDataOffset : arm9PostDataOffset + 12])
+            arm9PostDataOffset += 12
+        rom.arm9PostData = arm9PostData
+
+        if index is not None:
+            rom.filenames = index.filenames
+            fat = index.fat
+        else:
+            fnt = romMap[fntOffset : fntOffset + fntLen]
+            rom.filenames = ndspy.fnt.load(fnt) if fnt else ndspy.fnt.Folder()
+            fat = romMap[fatOffset : fatOffset + fatLen]
+
+        rom.files = LazyFileList(romMap, fat, (st.st_dev, st.st_ino))
+        rom.sortedFileIds = sorted(range(len(rom.files)), key=lambda i: rom.files.entries[i][0])
+
+        return rom
+
+    # Overlay decompression needs real bytes rather than views into the mapping.
+
+    def loadArm9Overlays(self, idsToLoad=None):
+        return ndspy.code.loadOverlayTable(self.arm9OverlayTable, lambda ovID, fileID: bytes(self.files[fileID]), idsToLoad)
+
+    def loadArm7Overlays(self, idsToLoad=None):
+        return ndspy.code.loadOverlayTable(self.arm7OverlayTable, lambda ovID, fileID: bytes(self.files[fileID]), idsToLoad)
+
+
+def IsLazy(rom):
+    return isinstance(rom.files, LazyFileList)
+
+
+def PatchROM(rom, fileName):
+    """
+    Saves a lazily loaded ROM by rewriting only what changed in the image it was mapped
+    from, in place and so not atomically. Returns False, without writing anything, if the
+    changes don't fit in place.
+    """
+    if not IsLazy(rom) or not rom.files.IsMapping(fileName):
+        return False
+
+    files = rom.files
+    romMap = files.romMap
+    romSize = len(romMap)
+    header = bytearray(romMap[0 : 0x200])
+
+    (arm9Offset, _arm9Entry, _arm9Ram, arm9Len, 
+    arm7Offset, _arm7Entry, _arm7Ram, arm7Len, 
+    fntOffset, fntLen, fatOffset, fatLen, 
+    arm9OvTOffset, arm9OvTLen, arm7OvTOffset, arm7OvTLen) = struct.unpack_from('<16I', header, 0x20)
+
+    iconBannerOffset, = struct.unpack_from('<I', header, 0x68)
+    debugRomOffset, debugRomSize = struct.unpack_from('<2I', header, 0x160)
+    rsaSignatureOffset, = struct.unpack_from('<I', romMap, 0x1000) if romSize >= 0x1004 else (0,)
+
+    struct.pack_into('<I', header, 0x68, 0)
+    original = ndspy.rom.NintendoDSRom(bytes(header))
+    struct.pack_into('<I', header, 0x68, iconBannerOffset)
+
+    if any(getattr(rom, name) != getattr(original, name) for name in HEADER_ATTRIBUTES):
+        return False
+
+    # Saving stores the RSA signature offset at 0x1000, inside the post-header padding.
+    pad200 = bytearray(rom.pad200)
+    if len(pad200) >= 0xE04:
+        struct.pack_into('<I', pad200, 0xE00, rsaSignatureOffset)
+
+    if pad200 != romMap[0x200 : arm9Offset] or rom.debugRom != romMap[debugRomOffset : debugRomOffset + debugRomSize]:
+        return False
+
+    if rsaSignatureOffset and rom.rsaSignature != romMap[rsaSignatureOffset : rsaSignatureOffset + len(rom.rsaSignature)]:
+        return False
+
+    iconBannerLen = 0
+    if iconBannerOffset:
+        version, = struct.unpack_from('<H', romMap, iconBannerOffset)
+        iconBannerLen = ICON_BANNER_LENGTHS.get(version, ICON_BANNER_LENGTHS[1])
+
+    # Everything in the image is a region; data written in place may grow into the padding
+    # after its region, up to the start of the next one.
+    regions = [(0, 0x200), (arm9Offset, arm9Offset + arm9Len + len(rom.arm9PostData)), (arm7Offset, arm7Offset + arm7Len),
+               (fntOffset, fntOffset + fntLen), (fatOffset, fatOffset + fatLen),
+               (arm9OvTOffset, arm9OvTOffset + arm9OvTLen), (arm7OvTOffset, arm7OvTOffset + arm7OvTLen),
+               (iconBannerOffset, iconBannerOffset + iconBannerLen), (debugRomOffset, debugRomOffset + debugRomSize),
+               (rsaSignatureOffset, rsaSignatureOffset + len(rom.rsaSignature))]
+    regions = [region for region in regions if region[0]] + [slot for slot in files.slots if slot is not None]
+    starts = sorted(start for start, _end in regions)
+    occupied = {start for start, end in regions if end > start}
+
+    def Capacity(start, end):
+        # Empty files share their start with the file after them and cannot grow.
+        if end == start and start in occupied:
+            return start
+
+        i = bisect.bisect_right(starts, start)
+        return min(starts[i] if i < len(starts) else romSize, romSize)
+
+    writes = []
+
+    def Patch(start, end, data):
+        if romMap[start : end] == data:
+            return True
+
+        if not start or start + len(data) > Capacity(start, end):
+            return False
+
+        writes.append((start, data, max(0, end - start - len(data))))
+        return True
+
+    # Files saved with duplicates sharing their data have the same slot; writing over one
+    # of them would change the others.
+    sharedSlots = {slot for slot, count in collections.Counter(files.slots).items() if count > 1}
+
+    fat = bytearray()
+    replaced = []
+
+    for i, entry in enumerate(files.entries):
+        if isinstance(entry, tuple):
+            fat += struct.pack('<II', *entry)
+            continue
+
+        slot = files.slots[i]
+        if slot is None or slot in sharedSlots or slot[0] + len(entry) > Capacity(*slot):
+            return False
+
+        writes.append((slot[0], entry, max(0, slot[1] - slot[0] - len(entry))))
+        replaced.append((i, (slot[0], slot[0] + len(entry))))
+        fat += struct.pack('<II', slot[0], slot[0] + len(entry))
+
+    fnt = ndspy.fnt.save(rom.filenames)
+
+    if not (Patch(arm9Offset, arm9Offset + arm9Len + len(rom.arm9PostData), bytes(rom.arm9) + bytes(rom.arm9PostData))
+            and Patch(arm7Offset, arm7Offset + arm7Len, rom.arm7)
+            and Patch(arm9OvTOffset, arm9OvTOffset + arm9OvTLen, rom.arm9OverlayTable)
+            and Patch(arm7OvTOffset, arm7OvTOffset + arm7OvTLen, rom.arm7OverlayTable)
+            and Patch(fntOffset, fntOffset + fntLen, fnt)
+            and Patch(fatOffset, fatOffset + fatLen, fat)
+            and Patch(iconBannerOffset, iconBannerOffset + iconBannerLen, rom.iconBanner)):
+        return False
+
+    struct.pack_into('<I', header, 0x2C, len(rom.arm9))
+    struct.pack_into('<I', header, 0x3C, len(rom.arm7))
+    struct.pack_into('<I', header, 0x44, len(fnt))
+    struct.pack_into('<I', header, 0x4C, len(fat))
+    struct.pack_into('<I', header, 0x54, len(rom.arm9OverlayTable))
+    struct.pack_into('<I', header, 0x5C, len(rom.arm7OverlayTable))
+    struct.pack_into('<H', header, 0x15E, _common.crc16(header[0 : 0x15E]))
+
+    if not writes and header == romMap[0 : 0x200]:
+        return True
+
+    # This isn't atomic: replaced data is written over its old slot, so a save that's
+    # interrupted leaves a file that's neither the old ROM nor the new one. Only SaveROM's
+    # rewrite through a temporary file is safe against that.
+    with open(fileName, 'r+b') as f:
+        for start, data, padding in writes:
+            f.seek(start)
+            f.write(data)
+            f.write(b'\xFF' * padding)
+
+        f.seek(0)
+        f.write(header)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Replaced files are back in the image, so they can be views of the mapping again, and
+    # the store no longer has to hold their data.
+    for i, slot in replaced:
+        files.Release([files.entries[i]])
+        files.entries[i] = slot
+        files.slots[i] = slot
+
+    return True
@@ -0,0 +1,160 @@
+import sys
+import FilesystemEditorWidget
+
+from PyQt5 import QtGui, QtWidgets
+
+class MainNDSPYWindow(QtWidgets.QMainWindow):
+
+    def CreateMenuBar(self):
+
+        self.statusBar()
+        mainMenu = self.menuBar()
+
+        fileMenu = mainMenu.addMenu('&File')
+      
+        openAction = QtWidgets.QAction('&Open...', self)
+        openAction.triggered.connect(self.HandleOpenROM)
+
+        saveAction = QtWidgets.QAction('&Save', self)
+        saveAction.triggered.connect(self.HandleSave)
+        
+        saveAsAction = QtWidgets.QAction('&Save as...', self)
+        saveAsAction.triggered.connect(self.HandleSaveAs)
+        
+        lazyAction = QtWidgets.QAction('&Memory-map opened ROMs', self, checkable=True)
+        lazyAction.setChecked(True)
+        lazyAction.toggled.connect(self.HandleLazyLoadingToggled)
+
+        incrementalAction = QtWidgets.QAction('&Skip unchanged files when extracting', self, checkable=True)
+        incrementalAction.toggled.connect(self.HandleIncrementalExtractionToggled)
+
+        deduplicateAction = QtWidgets.QAction('Save &duplicate files as one copy', self, checkable=True)
+        deduplicateAction.toggled.connect(self.HandleDeduplicationToggled)
+
+        exitAction = QtWidgets.QAction('&Exit', self)
+        exitAction.triggered.connect(self.HandleCloseApplication)
+
+        fileMenu.addAction(openAction)
+        fileMenu.addAction(saveAction)
+        fileMenu.addAction(saveAsAction)
+        fileMenu.addSeparator()
+        fileMenu.addAction(lazyAction)
+        fileMenu.addAction(incrementalAction)
+        fileMenu.addAction(deduplicateAction)
+        fileMenu.addSeparator()
+        fileMenu.addAction(exitAction)
+        
+        editMenu = mainMenu.addMenu('&Edit')
+
+        self.undoAction = QtWidgets.QAction('&Undo', self)
+        self.undoAction.setShortcut(QtGui.QKeySequence.Undo)
+        self.undoAction.triggered.connect(self.HandleUndo)
+
+        self.redoAction = QtWidgets.QAction('&Redo', self)
+        self.redoAction.setShortcut(QtGui.QKeySequence.Redo)
+        self.redoAction.triggered.connect(self.HandleRedo)
+
+        editMenu.addAction(self.undoAction)
+        editMenu.addAction(self.redoAction)
+        editMenu.aboutToShow.connect(self.HandleEditMenuShown)
+        editMenu.aboutToHide.connect(self.HandleEditMenuHidden)
+
+        aboutMenu = mainMenu.addMenu('&Help')
+        
+        aboutAction = QtWidgets.QAction('&About', self)
+        aboutAction.triggered.connect(self.HandleAbout)      
+        
+        
+        aboutMenu.addAction(aboutAction)
+
+    def __init__(self):
+        super(MainNDSPYWindow, self).__init__()
+        self.setGeometry(50, 50, 800, 600)
+        self.setWindowTitle('ndspy-gui')
+
+        self.CreateMenuBar()
+        self.CreateEditor()
+
+    def CreateEditor(self):
+        self.romEditor = FilesystemEditorWidget.FilesystemEditorWidget(self)
+        self.setCentralWidget(self.romEditor)
+
+    def HandleCloseApplication(self):
+        # A task or load still running could neither be saved nor left behind.
+        if self.romEditor.IsBusy():
+            QtWidgets.QMessageBox.information(self, 'Exit', 'Please wait for the current task to finish, or cancel it, before exiting.')
+            return
+
+        if self.UnsavedChanges():
+            self.romEditor.CloseROM()
+            sys.exit()
+
+    def HandleSave(self):
+        self.romEditor.Save()
+        
+    def HandleLazyLoadingToggled(self, checked):
+        self.romEditor.lazyLoading = checked
+
+    def HandleIncrementalExtractionToggled(self, checked):
+        self.romEditor.incrementalExtraction = checked
+
+    def HandleDeduplicationToggled(self, checked):
+        self.romEditor.deduplicateOnSave = checked
+
+    def HandleUndo(self):
+        self.romEditor.Undo()
+
+    def HandleRedo(self):
+        self.romEditor.Redo()
+
+    def HandleEditMenuShown(self):
+        undoLabel = self.romEditor.UndoLabel()
+        redoLabel = self.romEditor.RedoLabel()
+        self.undoAction.setText('&Undo ' + undoLabel if undoLabel else '&Undo')
+        self.undoAction.setEnabled(undoLabel is not None)
+        self.redoAction.setText('&Redo ' + redoLabel if redoLabel else '&Redo')
+        self.redoAction.setEnabled(redoLabel is not None)
+
+    def HandleEditMenuHidden(self):
+        # The shortcuts work whether or not there's anything to undo or redo.
+        self.undoAction.setEnabled(True)
+        self.redoAction.setEnabled(True)
+
+    def HandleAbout(self):
+        QtWidgets.QMessageBox.information(self, 'About', 'NDSPY-Gui 0.1 by Skawo.')
+
+    def HandleSaveAs(self):
+        fileName = QtWidgets.QFileDialog.getSaveFileName(self, 
+                                                        'Choose a file name...', 
+                                                        '', 
+                                                        'Nintendo DS ROMs (*.nds;*.srl);;All Files(*)')[0]
+
+        if fileName == '': return
+        else:     
+            self.romEditor.Save(fileName)
+
+    def HandleOpenROM(self):
+        if self.UnsavedChanges():
+            fileName = QtWidgets.QFileDialog.getOpenFileName(self, 
+                                                            'Choose a file...', 
+                                                            '', 
+                                                            'Nintendo DS ROMs (*.nds;*.srl);;All Files(*)')[0]
+            if fileName == '': return
+            else:     
+                self.romEditor.LoadROM(fileName)
+
+    def UnsavedChanges(self):
+        if self.romEditor.romEdited:
+            Reply = QtWidgets.QMessageBox.question(self, 
+                                                  'Unsaved changes', 
+                                                  'You have unsaved changes. Would you like to save this ROM first?', 
+                                                  QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No | QtWidgets.QMessageBox.Cancel)
+
+            if Reply == QtWidgets.QMessageBox.Yes:
+                return self.romEditor.Save()
+            elif Reply == QtWidgets.QMessageBox.Cancel:
+                return False      
+            else:
+                return True
+        else:
+            return True
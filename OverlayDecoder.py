@@ -0,0 +1,161 @@
+import os
+import struct
+import threading
+import collections
+
+from ExtractionEngine import HashData
+
+# ndspy's code modules and multiprocessing are imported where they're used, so that
+# starting the GUI doesn't wait for them.
+
+def DecompressOverlay(fileData):
+    import ndspy.codeCompression
+    return bytes(ndspy.codeCompression.decompress(fileData))
+
+
+def CompressOverlay(data):
+    import ndspy.codeCompression
+    return bytes(ndspy.codeCompression.compress(data, False))
+
+
+class OverlayDecoder:
+
+    # Decodes overlay files the way ndspy does, but decompresses the compressed ones in a
+    # process pool, in parallel across overlays. Decoded data is kept in an LRU cache keyed
+    # by (file ID, hash of the file), holding at most maxCacheBytes, so overlays whose files
+    # haven't changed are never decompressed twice. Encode goes the other way for overlays
+    # whose data was replaced, caching compressed data by the hash of what was compressed.
+
+    def __init__(self, maxCacheBytes=64 * 1024 * 1024, maxWorkers=None):
+        self.maxCacheBytes = maxCacheBytes
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+        self.cacheBytes = 0
+        self.executor = None
+
+    def CacheGet(self, key):
+        with self.lock:
+            data = self.cache.get(key)
+            if data is not None:
+                self.cache.move_to_end(key)
+            return data
+
+    def CachePut(self, key, data):
+        if len(data) > self.maxCacheBytes:
+            return
+
+        with self.lock:
+            if key in self.cache:
+                return
+
+            self.cache[key] = data
+            self.cacheBytes += len(data)
+
+            while self.cacheBytes > self.maxCacheBytes:
+                _key, evicted = self.cache.popitem(last=False)
+                self.cacheBytes -= len(evicted)
+
+    def Executor(self):
+        # Started on first use, so ROMs without compressed overlays never spawn processes.
+        # Workers are spawned rather than forked, since this is called from worker threads.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.maxWorkers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def Decode(self, entries):
+        # Takes (file ID, file data, compressed) for each overlay and returns the decoded data
+        # of each, in order, as new bytearrays the caller may edit.
+        results = [None] * len(entries)
+        misses = []
+
+        for i, (fileID, fileData, compressed) in enumerate(entries):
+            if not compressed:
+                results[i] = bytearray(fileData)
+                continue
+
+            key = (fileID, HashData(fileData))
+            data = self.CacheGet(key)
+
+            if data is None:
+                # Memory-mapped ROMs hand out memoryviews, which can't be sent to other processes.
+                misses.append((i, key, bytes(fileData)))
+            else:
+                results[i] = bytearray(data)
+
+        decoded = self.Map(DecompressOverlay, [fileData for _i, _key, fileData in misses])
+
+        for (i, key, _fileData), data in zip(misses, decoded):
+            self.CachePut(key, data)
+            results[i] = bytearray(data)
+
+        return results
+
+    def Encode(self, entries):
+        # Takes (file ID, data, compressed) for each overlay and returns the file data of each,
+        # in order. The results are also cached as decoded, for when the saved ROM is reopened.
+        results = [None] * len(entries)
+        misses = []
+
+        for i, (_fileID, data, compressed) in enumerate(entries):
+            if not compressed:
+                results[i] = bytes(data)
+                continue
+
+            key = ('compressed', HashData(data))
+            fileData = self.CacheGet(key)
+
+            if fileData is None:
+                misses.append((i, key, bytes(data)))
+            else:
+                results[i] = fileData
+
+        encoded = self.Map(CompressOverlay, [data for _i, _key, data in misses])
+
+        for (i, key, _data), fileData in zip(misses, encoded):
+            self.CachePut(key, fileData)
+            results[i] = fileData
+
+        for (fileID, data, compressed), fileData in zip(entries, results):
+            if compressed:
+                self.CachePut((fileID, HashData(fileData)), bytes(data))
+
+        return results
+
+    def Map(self, function, inputs):
+        if len(inputs) <= 1 or self.maxWorkers == 1:
+            # Not worth a round trip to another process.
+            return [function(data) for data in inputs]
+
+        return list(self.Executor().map(function, inputs))
+
+    def LoadOverlays(self, tableData, files, decode=True):
+        # The equivalent of loadArm9Overlays() and loadArm7Overlays() for an overlay table
+        # and the ROM's files. Without decode the overlays are left empty, to be filled in
+        # by a reload.
+        import ndspy.code
+
+        rows = [struct.unpack_from('<8I', tableData, i) for i in range(0, len(tableData), 32)]
+
+        if decode:
+            decoded = self.Decode([(row[6], files[row[6]], (row[7] >> 24) & 1) for row in rows])
+        else:
+            decoded = [bytearray() for _row in rows]
+
+        overlays = {}
+        for (ovID, ramAddr, ramSize, bssSize, staticInitStart, staticInitEnd,
+                fileID, compressedSize_Flags), data in zip(rows, decoded):
+            flags = compressedSize_Flags >> 24
+
+            # Built as uncompressed so ndspy doesn't decompress it again, then given its real flags.
+            ov = ndspy.code.Overlay(b'', ramAddr, ramSize, bssSize, staticInitStart, staticInitEnd,
+                                    fileID, compressedSize_Flags & 0xFFFFFF, flags & ~1)
+            ov.flags = flags
+            ov.data = data
+            overlays[ovID] = ov
+
+        return overlays
@@ -0,0 +1,149 @@
+class PathIndex:
+
+    # Hash lookups over a filename table: each folder's parent and name, and per folder,
+    # file name -> row and subfolder name -> position. Parents are recorded up front; the
+    # name tables of a folder are built the first time it is looked into. Edits to the
+    # filename table have to be reported through the methods below to keep it current.
+
+    def __init__(self, root):
+        self.root = root
+        self.parents = {}
+        self.fileRows = {}
+        self.folderPositions = {}
+        self.AddTree(root, None, '')
+
+    def AddTree(self, folder, parent, name):
+        self.parents[id(folder)] = (parent, name, folder)
+        for folderName, childFolder in folder.folders:
+            self.AddTree(childFolder, folder, folderName)
+
+    def DropTree(self, folder):
+        self.parents.pop(id(folder), None)
+        self.fileRows.pop(id(folder), None)
+        self.folderPositions.pop(id(folder), None)
+        for _folderName, childFolder in folder.folders:
+            self.DropTree(childFolder)
+
+    def FileRows(self, folder):
+        rows = self.fileRows.get(id(folder))
+        if rows is None:
+            rows = self.fileRows[id(folder)] = {fileName: i for i, fileName in enumerate(folder.files)}
+        return rows
+
+    def FolderPositions(self, folder):
+        positions = self.folderPositions.get(id(folder))
+        if positions is None:
+            positions = self.folderPositions[id(folder)] = {folderName: i for i, (folderName, _childFolder) in enumerate(folder.folders)}
+        return positions
+
+    # Lookups
+
+    def FileRow(self, folder, fileName):
+        return self.FileRows(folder).get(fileName)
+
+    def FolderPosition(self, folder, folderName):
+        return self.FolderPositions(folder).get(folderName)
+
+    def ChildFolder(self, folder, folderName):
+        position = self.FolderPosition(folder, folderName)
+        return None if position is None else folder.folders[position][1]
+
+    def ParentFolder(self, folder):
+        return self.parents[id(folder)][0]
+
+    def FolderName(self, folder):
+        return self.parents[id(folder)][1]
+
+    def FolderPath(self, folder):
+        names = []
+        while folder is not self.root:
+            folder, name, _folder = self.parents[id(folder)]
+            names.append(name)
+        return '/'.join(reversed(names))
+
+    def FilePath(self, folder, row):
+        folderPath = self.FolderPath(folder)
+        return folderPath + '/' + folder.files[row] if folderPath else folder.files[row]
+
+    def Folder(self, path):
+        # The folder at a '/'-separated path, or None.
+        folder = self.root
+        for folderName in path.strip('/').split('/'):
+            if folderName and folder is not None:
+                folder = self.ChildFolder(folder, folderName)
+        return folder
+
+    def File(self, path):
+        # The (folder, row) of the file at a path, or None.
+        folderPath, _sep, fileName = path.strip('/').rpartition('/')
+        folder = self.Folder(folderPath)
+        if folder is None:
+            return None
+
+        row = self.FileRow(folder, fileName)
+        return None if row is None else (folder, row)
+
+    # Updates. Appending keeps a folder's tables; anything that moves rows drops them to be
+    # rebuilt on the next lookup.
+
+    def FilesInserted(self, folder, position, fileNames):
+        rows = self.fileRows.get(id(folder))
+        if rows is None:
+            return
+
+        if position + len(fileNames) == len(folder.files):
+            for i, fileName in enumerate(fileNames):
+                rows[fileName] = position + i
+        else:
+            del self.fileRows[id(folder)]
+
+    def FileRemoved(self, folder, row, fileName):
+        rows = self.fileRows.get(id(folder))
+        if rows is None:
+            return
+
+        if row == len(folder.files):
+            rows.pop(fileName, None)
+        else:
+            del self.fileRows[id(folder)]
+
+    def FileRenamed(self, folder, row, oldName, newName):
+        rows = self.fileRows.get(id(folder))
+        if rows is not None:
+            rows.pop(oldName, None)
+            rows[newName] = row
+
+    def FolderAdded(self, parent, folderName, folder):
+        # Folders are always appended.
+        self.AddTree(folder, parent, folderName)
+
+        positions = self.folderPositions.get(id(parent))
+        if positions is not None:
+            positions[folderName] = len(parent.folders) - 1
+
+    def FolderRemoved(self, parent, position, folderName, folder):
+        self.DropTree(folder)
+
+        positions = self.folderPositions.get(id(parent))
+        if positions is None:
+            return
+
+        if position == len(parent.folders):
+            positions.pop(folderName, None)
+        else:
+            del self.folderPositions[id(parent)]
+
+    def FolderRenamed(self, parent, position, oldName, newName, folder):
+        self.parents[id(folder)] = (parent, newName, folder)
+
+        positions = self.folderPositions.get(id(parent))
+        if positions is not None:
+            positions.pop(oldName, None)
+            positions[newName] = position
+
+    def FolderCleared(self, folder):
+        for _folderName, childFolder in folder.folders:
+            self.DropTree(childFolder)
+
+        self.fileRows.pop(id(folder), None)
+        self.folderPositions.pop(id(folder), None)
@@ -0,0 +1,110 @@
+import bisect
+
+# Piece sources: runs of the data being edited, or of the buffer edits are appended to.
+ORIGINAL = 0
+ADDED = 1
+
+class PieceTable:
+
+    # An edited version of some data that never copies the data itself. The document is a
+    # list of pieces, each a run of either the original data or an append-only buffer that
+    # holds everything inserted, so an edit only splits the pieces around it and adds its
+    # own bytes to the buffer. The original can be a memoryview of a mapped file.
+
+    def __init__(self, original):
+        self.original = memoryview(original).cast('B')
+        self.added = bytearray()
+        self.pieces = [(ORIGINAL, 0, len(self.original))] if len(self.original) else []
+        self.starts = [0] if self.pieces else []
+        self.length = len(self.original)
+
+    def __len__(self):
+        return self.length
+
+    def UpdateStarts(self, i):
+        # Recomputes the document offsets of the pieces from i on.
+        del self.starts[i:]
+        offset = self.starts[i - 1] + self.pieces[i - 1][2] if i else 0
+
+        for _source, _start, length in self.pieces[i:]:
+            self.starts.append(offset)
+            offset += length
+
+        self.length = offset
+
+    def Split(self, offset):
+        # Makes a piece start at offset, and returns its index; len(self.pieces) at the end.
+        if offset >= self.length:
+            return len(self.pieces)
+
+        i = bisect.bisect_right(self.starts, offset) - 1
+        split = offset - self.starts[i]
+
+        if split:
+            source, start, length = self.pieces[i]
+            self.pieces[i:i + 1] = [(source, start, split), (source, start + split, length - split)]
+            self.starts.insert(i + 1, offset)
+            i += 1
+
+        return i
+
+    def Insert(self, offset, data):
+        if not data:
+            return
+
+        i = self.Split(offset)
+
+        # Typing straight on from the last insert extends its piece rather than adding one.
+        if i and self.pieces[i - 1][0] == ADDED and sum(self.pieces[i - 1][1:]) == len(self.added):
+            source, start, length = self.pieces[i - 1]
+            self.pieces[i - 1] = (source, start, length + len(data))
+            i -= 1
+        else:
+            self.pieces.insert(i, (ADDED, len(self.added), len(data)))
+
+        self.added.extend(data)
+        self.UpdateStarts(i)
+
+    def Delete(self, offset, size):
+        size = min(size, self.length - offset)
+        if size <= 0:
+            return
+
+        i = self.Split(offset)
+        j = self.Split(offset + size)
+        del self.pieces[i:j]
+        del self.starts[i:j]
+        self.UpdateStarts(i)
+
+    def Replace(self, offset, data):
+        self.Delete(offset, len(data))
+        self.Insert(offset, data)
+
+    def Chunks(self, offset, size):
+        # Yields (data, edited) for the runs making up size bytes from offset, where edited is
+        # whether the run comes from an edit. Runs of the original are memoryviews; edited
+        # runs are copied, since a view would stop the edit buffer from growing.
+        end = min(offset + size, self.length)
+        if offset >= end:
+            return
+
+        i = bisect.bisect_right(self.starts, offset) - 1
+
+        while i < len(self.pieces) and self.starts[i] < end:
+            source, start, length = self.pieces[i]
+            first = max(offset, self.starts[i]) - self.starts[i]
+            last = min(end, self.starts[i] + length) - self.starts[i]
+            if source == ORIGINAL:
+                yield self.original[start + first : start + last], False
+            else:
+                yield bytes(self.added[start + first : start + last]), True
+            i += 1
+
+    def Read(self, offset, size):
+        return b''.join(chunk for chunk, _edited in self.Chunks(offset, size))
+
+    def IsModified(self):
+        return self.pieces != ([(ORIGINAL, 0, len(self.original))] if len(self.original) else [])
+
+    def ToBytes(self):
+        return self.Read(0, self.length)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+def FormatSize(byteCount):
+    for unit in ('bytes', 'KB', 'MB'):
+        if byteCount < 1024:
+            return ('%d %s' if unit == 'bytes' else '%.1f %s') % (byteCount, unit)
+        byteCount /= 1024
+    return '%.1f GB' % byteCount
+
+
+def FormatDuration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return '%ds' % seconds
+    return '%dm %02ds' % (seconds // 60, seconds % 60)
+
+
+class ProgressReporter:
+
+    # Counts work done by bulk operations and passes a summary to the callback at most
+    # maxUpdatesPerSecond times a second. The callback gets a percentage (None when there
+    # is nothing to show a bar for) and a message. Advance can be called from any thread.
+
+    def __init__(self, callback, maxUpdatesPerSecond=10):
+        self.callback = callback
+        self.interval = 1.0 / maxUpdatesPerSecond
+        self.lock = threading.Lock()
+        self.Reset('', 0, 0)
+
+    def Reset(self, text, totalCount, totalBytes):
+        self.text = text
+        self.totalCount = totalCount
+        self.totalBytes = totalBytes
+        self.count = 0
+        self.byteCount = 0
+        self.startTime = time.monotonic()
+        self.lastReport = self.startTime
+
+    def Start(self, text, totalCount=0, totalBytes=0):
+        with self.lock:
+            self.Reset(text, totalCount, totalBytes)
+            percentage, message = self.Summary(self.startTime)
+
+        self.callback(percentage, message)
+
+    def Advance(self, count=1, byteCount=0):
+        with self.lock:
+            self.count += count
+            self.byteCount += byteCount
+
+            now = time.monotonic()
+            if now - self.lastReport < self.interval:
+                return
+
+            self.lastReport = now
+            percentage, message = self.Summary(now)
+
+        self.callback(percentage, message)
+
+    def Finish(self, text='Done.'):
+        self.callback(None, text)
+
+    def Fraction(self):
+        if self.totalBytes:
+            return min(1.0, self.byteCount / self.totalBytes)
+        if self.totalCount:
+            return min(1.0, self.count / self.totalCount)
+        return None
+
+    def Summary(self, now):
+        fraction = self.Fraction()
+        message = self.text
+
+        if self.totalCount:
+            message += ' %d/%d files' % (self.count, self.totalCount)
+        elif self.count:
+            message += ' %d files' % self.count
+
+        if self.totalBytes:
+            message += ', %s of %s' % (FormatSize(self.byteCount), FormatSize(self.totalBytes))
+        elif self.byteCount:
+            message += ', ' + FormatSize(self.byteCount)
+
+        elapsed = now - self.startTime
+        if fraction and elapsed >= 1:
+            message += ', %s left' % FormatDuration(elapsed * (1 - fraction) / fraction)
+
+        return (None if fraction is None else int(fraction * 100)), message
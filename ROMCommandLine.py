@@ -0,0 +1,428 @@
+import os
+import sys
+import shlex
+import argparse
+import BatchImport
+import ROMSession
+import ExtractionEngine
+import ReplacementEngine
+import ROMSearch
+
+from ndspy import Processor
+
+# Everything here works on a ROMSession and nothing imports PyQt5, so the command line
+# starts without loading the GUI.
+
+COMMANDS = ('info', 'extract', 'replace', 'add', 'rm', 'mv', 'batch', 'search', 'banners')
+
+CODE_DIRECTORIES = {'@arm9': Processor.ARM9, '@arm7': Processor.ARM7}
+
+class CommandError(Exception):
+    pass
+
+
+def IsCommandLine(args):
+    return bool(args) and args[0] in COMMANDS
+
+
+def ResolvePath(session, path):
+    """
+    Works out what a path names. Filesystem paths are '/'-separated from the root ('/' is
+    the root itself); '@arm9' and '@arm7' are the code directories, and inside them 'main'
+    is the main code file and a number is that overlay. No path at all means the whole ROM.
+    Returns one of ('rom',), ('folder', folder), ('file', folder, row), ('code', processor),
+    ('main', processor) or ('overlay', processor, overlayID).
+    """
+    if not path:
+        return ('rom',)
+
+    directory, _sep, name = path.strip('/').partition('/')
+
+    if directory in CODE_DIRECTORIES:
+        processor = CODE_DIRECTORIES[directory]
+
+        if not name:
+            return ('code', processor)
+        if name == 'main':
+            return ('main', processor)
+        if name.isdigit() and int(name) in session.OverlayObjects(processor):
+            return ('overlay', processor, int(name))
+
+        raise CommandError('No such code file: ' + path)
+
+    folder = session.paths.Folder(path)
+    if folder is not None:
+        return ('folder', folder)
+
+    found = session.paths.File(path)
+    if found is not None:
+        return ('file',) + found
+
+    raise CommandError('No such file or folder: ' + path)
+
+
+def TargetPath(session, target):
+    # The path of a ROMSearch target, the other way round from ResolvePath; files outside
+    # the filename table are given by ID, as '#ID'.
+    directory = {processor: name for name, processor in CODE_DIRECTORIES.items()}
+
+    if target[0] == 'main':
+        return directory[target[1]] + '/main'
+    if target[0] == 'overlay':
+        return directory[target[1]] + '/' + str(target[2])
+
+    try:
+        segment, row = session.FileIDs().Find(target[1])
+    except ValueError:
+        segment = None
+
+    if segment is None or not hasattr(segment, 'files'):
+        return '#' + str(target[1])
+
+    return session.paths.FilePath(segment, row)
+
+
+def SplitPath(session, path):
+    # The existing folder a new entry at path goes in, and the entry's name.
+    folderPath, _sep, name = path.rstrip('/').rpartition('/')
+    folder = session.paths.Folder(folderPath)
+
+    if folder is None:
+        raise CommandError('No such folder: ' + folderPath)
+    if not name:
+        raise CommandError('A name is needed: ' + path)
+
+    return folder, name
+
+
+def TargetData(session, target):
+    # The data of a file, main code file or overlay file.
+    if target[0] == 'file':
+        _kind, folder, row = target
+        return session.rom.files[session.FileIDs().FirstID(folder) + row]
+    if target[0] == 'main':
+        return session.rom.arm9 if target[1] == Processor.ARM9 else session.rom.arm7
+    if target[0] == 'overlay':
+        session.WriteBackOverlays()
+        return session.rom.files[session.OverlayObjects(target[1])[target[2]].fileID]
+
+    raise CommandError('Not a file')
+
+
+def Info(session, args, out):
+    if not args.path:
+        rom = session.rom
+        out.write('Name: ' + rom.name.decode('ascii', 'replace').rstrip('\0') + '\n')
+        out.write('Game code: ' + rom.idCode.decode('ascii', 'replace') + '\n')
+
+        if rom.iconBanner:
+            out.write('Title: ' + bytes(rom.iconBanner[0x340:0x440]).decode('utf-16-le', 'replace').split('\0')[0].replace('\n', ' / ') + '\n')
+
+        out.write('Files: ' + str(len(rom.files)) + '\n')
+        out.write('ARM9 overlays: ' + str(len(session.OverlayObjects(Processor.ARM9))) + '\n')
+        out.write('ARM7 overlays: ' + str(len(session.OverlayObjects(Processor.ARM7))) + '\n')
+        return
+
+    target = ResolvePath(session, args.path)
+
+    if target[0] == 'folder':
+        folder = target[1]
+        firstID = session.FileIDs().FirstID(folder)
+
+        for folderName, _childFolder in folder.folders:
+            out.write(folderName + '/\n')
+        for i, fileName in enumerate(folder.files):
+            out.write(fileName + '\t' + str(firstID + i) + '\t' + str(len(session.rom.files[firstID + i])) + '\n')
+
+    elif target[0] == 'code':
+        out.write('main\n')
+        for overlayID, ov in sorted(session.OverlayObjects(target[1]).items()):
+            out.write(str(overlayID) + '\t' + str(ov.fileID) + '\t' + hex(ov.ramAddress) + '\n')
+
+    elif target[0] == 'overlay':
+        ov = session.OverlayObjects(target[1])[target[2]]
+        out.write('File ID: ' + str(ov.fileID) + ', File size: ' + str(len(TargetData(session, target))) + ' bytes, '
+                  + 'RAM Address: ' + hex(ov.ramAddress) + (', compressed' if ov.compressed else '') + '\n')
+
+    elif target[0] == 'main':
+        rom = session.rom
+        ramAddress = rom.arm9RamAddress if target[1] == Processor.ARM9 else rom.arm7RamAddress
+        out.write('RAM Address: ' + hex(ramAddress) + ', File size: ' + str(len(TargetData(session, target))) + ' bytes\n')
+
+    elif target[0] == 'file':
+        _kind, folder, row = target
+        out.write('File ID: ' + str(session.FileIDs().FirstID(folder) + row) + ', File size: ' + str(len(TargetData(session, target))) + ' bytes\n')
+
+
+def Extract(session, args, out):
+    target = ResolvePath(session, args.path)
+
+    if target[0] in {'file', 'main', 'overlay'}:
+        with open(args.destination, 'wb') as f:
+            f.write(TargetData(session, target))
+        return
+
+    plan = session.PlanExtraction(args.destination, *FolderOrProcessor(target))
+    engine = ExtractionEngine.ExtractionEngine(plan, incremental=not args.full)
+    engine.Run()
+    out.write(engine.Summary() + '\n')
+
+
+def Replace(session, args, out):
+    target = ResolvePath(session, args.path)
+
+    if target[0] in {'file', 'main', 'overlay'}:
+        with open(args.source, 'rb') as f:
+            data = f.read()
+
+        if target[0] == 'file':
+            _kind, folder, row = target
+            session.ReplaceFile(session.FileIDs().FirstID(folder) + row, data)
+        elif target[0] == 'main':
+            session.ReplaceMain(target[1], data)
+            session.ReloadCode(True, target[1])
+        else:
+            session.WriteBackOverlays()
+            session.ReplaceFile(session.OverlayObjects(target[1])[target[2]].fileID, data)
+            session.ReloadCode(False, target[1], {target[2]})
+        return True
+
+    plan = session.PlanReplacement(args.source, *FolderOrProcessor(target))
+    engine = ReplacementEngine.ReplacementEngine(plan)
+    engine.Run()
+    out.write(engine.Summary() + '\n')
+    return bool(session.ApplyReplacement(engine))
+
+
+def FolderOrProcessor(target):
+    if target[0] == 'folder':
+        return target[1], None
+    if target[0] == 'code':
+        return None, target[1]
+    return None, None
+
+
+def Add(session, args, out):
+    if args.path.strip('/').partition('/')[0] in CODE_DIRECTORIES:
+        # '@arm9/N' inserts overlay N, renumbering the ones from N on.
+        directory, _sep, name = args.path.strip('/').partition('/')
+        processor = CODE_DIRECTORIES[directory]
+        overlays = session.OverlayObjects(processor)
+
+        if name and not name.isdigit():
+            raise CommandError('Overlays are added by number: ' + args.path)
+
+        overlayID = int(name) if name else len(overlays)
+        session.InsertOverlay(processor, overlayID - 1)
+
+        if args.source is not None:
+            with open(args.source, 'rb') as f:
+                session.ReplaceFile(session.FileIDs().FirstID(session.OverlayObjects(processor)[overlayID]), f.read())
+        return True
+
+    if args.source is not None and os.path.isdir(args.source):
+        # A directory is imported into the folder at path, which is created if needed.
+        folder = session.paths.Folder(args.path)
+        if folder is None:
+            parentFolder, folderName = SplitPath(session, args.path)
+            folder = session.AddFolder(parentFolder, folderName)
+
+        root = BatchImport.ImportFolder.Scan(args.source)
+        BatchImport.ImportReader(root).Run()
+        added, replaced = session.Import(folder, root)
+        out.write(str(added) + ' files added, ' + str(replaced) + ' replaced.\n')
+        return True
+
+    folder, name = SplitPath(session, args.path)
+
+    if args.source is None and args.path.endswith('/'):
+        session.AddFolder(folder, name)
+        return True
+
+    data = b''
+    if args.source is not None:
+        with open(args.source, 'rb') as f:
+            data = f.read()
+
+    session.InsertFile(folder, len(folder.files), name, data)
+    return True
+
+
+def Remove(session, args, out):
+    target = ResolvePath(session, args.path)
+
+    if target[0] == 'file':
+        session.RemoveFile(target[1], target[2])
+    elif target[0] == 'overlay':
+        session.RemoveOverlay(target[1], target[2])
+    elif target[0] == 'folder' and target[1] is session.rom.filenames:
+        session.ClearFolder(target[1])
+    elif target[0] == 'folder':
+        folder = target[1]
+        session.RemoveFolder(session.paths.ParentFolder(folder), session.paths.FolderName(folder))
+    else:
+        raise CommandError('This cannot be removed: ' + args.path)
+
+    return True
+
+
+def Move(session, args, out):
+    # Renames within a folder; the new name may be given as a bare name or a full path.
+    target = ResolvePath(session, args.path)
+    newName = args.name.rstrip('/').rpartition('/')[2]
+
+    if target[0] == 'file':
+        _kind, folder, row = target
+        if '/' in args.name.strip('/') and session.paths.Folder(args.name.rstrip('/').rpartition('/')[0]) is not folder:
+            raise CommandError('Files can only be renamed within their folder.')
+        session.RenameFile(folder, row, newName)
+
+    elif target[0] == 'folder' and target[1] is not session.rom.filenames:
+        folder = target[1]
+        parentFolder = session.paths.ParentFolder(folder)
+        if '/' in args.name.strip('/') and session.paths.Folder(args.name.rstrip('/').rpartition('/')[0]) is not parentFolder:
+            raise CommandError('Folders can only be renamed within their parent folder.')
+        session.RenameFolder(parentFolder, session.paths.FolderName(folder), newName)
+
+    else:
+        raise CommandError('This cannot be renamed: ' + args.path)
+
+    return True
+
+
+def Search(session, args, out):
+    patterns = ROMSearch.ParsePatterns(args.patterns, args.kind)
+
+    engine = ROMSearch.SearchEngine(session.PlanSearch(), patterns, args.start, args.end, args.align, args.max, maxWorkers=args.jobs)
+    engine.Run()
+
+    for target, offset, patternIndex in engine.SortedResults():
+        out.write(TargetPath(session, target) + '\t' + hex(offset) + '\t' + engine.labels[patternIndex] + '\n')
+    out.write(engine.Summary() + '\n')
+
+
+def Batch(session, args, out):
+    # Runs a script of commands, one per line and without the ROM argument, on one loaded
+    # ROM; '#' starts a comment. The ROM is saved once, after the last command.
+    parser = CreateParser(batch=True)
+    edited = False
+
+    with open(args.script, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    for lineNumber, line in enumerate(lines, 1):
+        words = shlex.split(line, comments=True)
+        if not words:
+            continue
+
+        try:
+            commandArgs = parser.parse_args(words)
+            edited = bool(commandArgs.function(session, commandArgs, out)) or edited
+        except (CommandError, ROMSession.ROMEditError, OSError, ValueError) as e:
+            raise CommandError(args.script + ':' + str(lineNumber) + ': ' + str(e))
+        except SystemExit:
+            raise CommandError(args.script + ':' + str(lineNumber) + ': invalid command: ' + line)
+
+    return edited
+
+
+def Banners(args, out):
+    # Works on many ROMs, reading each one's banner rather than opening it as a session.
+    import BannerExport
+
+    romFiles = BannerExport.FindROMs(args.roms)
+    if not romFiles:
+        raise CommandError('No ROMs found')
+
+    exporter = BannerExport.BannerExporter(romFiles, args.output, args.animated, args.jobs)
+    exporter.Run()
+    exporter.SaveManifest(args.manifest or os.path.join(args.output, 'manifest.json'))
+
+    for record in exporter.FailedRecords():
+        out.write(record['file'] + ': ' + record['error'] + '\n')
+    out.write(exporter.Summary() + '\n')
+
+
+def CreateParser(batch=False):
+    parser = argparse.ArgumentParser(prog='ndspy-gui' if not batch else 'ndspy-gui batch', add_help=not batch,
+                                     description='Edit Nintendo DS ROMs from the command line.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def AddCommand(name, function, help, edits=False):
+        command = commands.add_parser(name, help=help, add_help=not batch)
+        if not batch:
+            command.add_argument('rom', help='the ROM file')
+        if edits and not batch:
+            command.add_argument('-o', '--output', help='save the edited ROM here instead of over the original')
+            command.add_argument('--deduplicate', action='store_true', help='save files with the same data as one copy of it')
+        command.set_defaults(function=function)
+        return command
+
+    command = AddCommand('info', Info, 'describe the ROM, or a file or folder in it')
+    command.add_argument('path', nargs='?')
+
+    command = AddCommand('extract', Extract, 'extract a file or folder')
+    command.add_argument('path', help="a path in the ROM, '@arm9' or '@arm7' for the code, or '' for the whole ROM")
+    command.add_argument('destination')
+    command.add_argument('--full', action='store_true', help="rewrite files that haven't changed since the last extraction")
+
+    command = AddCommand('replace', Replace, 'replace a file, or the files of a folder from a directory', True)
+    command.add_argument('path')
+    command.add_argument('source')
+
+    command = AddCommand('add', Add, 'add a file, a folder (path ending in /), an overlay or a directory tree', True)
+    command.add_argument('path')
+    command.add_argument('source', nargs='?')
+
+    command = AddCommand('rm', Remove, 'remove a file, folder or overlay', True)
+    command.add_argument('path')
+
+    command = AddCommand('mv', Move, 'rename a file or folder', True)
+    command.add_argument('path')
+    command.add_argument('name')
+
+    command = AddCommand('search', Search, 'find which files contain byte patterns, text or pointers')
+    command.add_argument('patterns', nargs='+', metavar='pattern')
+    command.add_argument('-k', '--kind', choices=ROMSearch.PATTERN_KINDS, default='hex', help='what the patterns are (default: hex)')
+    command.add_argument('--start', type=lambda text: int(text, 0), default=0, help='only matches from this offset in each file')
+    command.add_argument('--end', type=lambda text: int(text, 0), help='only matches before this offset in each file')
+    command.add_argument('--align', type=int, default=1, help='only matches at offsets that are a multiple of this')
+    command.add_argument('--max', type=int, default=10000, help='stop after this many matches (default: 10000)')
+    command.add_argument('-j', '--jobs', type=int, help='worker processes (default: one per CPU)')
+
+    if not batch:
+        command = AddCommand('batch', Batch, 'run a script of these commands with one load and save', True)
+        command.add_argument('script')
+
+        command = commands.add_parser('banners', help='export the icons and titles of many ROMs')
+        command.add_argument('output', help='the directory to write the icons and the manifest to')
+        command.add_argument('roms', nargs='+', help='ROM files, or directories to search for them')
+        command.add_argument('--manifest', help='the manifest file, .json or .csv (default: manifest.json in the output directory)')
+        command.add_argument('--animated', action='store_true', help='save DSi animated icons as animated PNGs')
+        command.add_argument('-j', '--jobs', type=int, help='worker processes (default: one per CPU)')
+        command.set_defaults(function=Banners, rom=None)
+
+    return parser
+
+
+def main(argv=None, out=sys.stdout):
+    args = CreateParser().parse_args(argv)
+
+    try:
+        if args.rom is None:
+            args.function(args, out)
+            return 0
+
+        session = ROMSession.ROMSession.Open(args.rom)
+        edited = args.function(session, args, out)
+
+        deduplicate = getattr(args, 'deduplicate', False)
+        if edited or deduplicate:
+            shared = session.Save(getattr(args, 'output', None) or args.rom, deduplicate)
+            if deduplicate:
+                out.write(session.SharingSummary(shared) + '\n')
+    except (CommandError, ROMSession.ROMEditError, OSError, ValueError) as e:
+        sys.stderr.write('ndspy-gui: ' + str(e) + '\n')
+        return 1
+
+    return 0
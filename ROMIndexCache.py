@@ -0,0 +1,88 @@
+import os
+import json
+import base64
+import struct
+import ndspy.fnt
+
+from ExtractionEngine import HashData
+
+INDEX_VERSION = 2
+
+def CacheDirectory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'ndspy-gui', 'roms')
+
+
+def SaveFolder(folder):
+    return [folder.firstID, folder.files, [[name, SaveFolder(childFolder)] for name, childFolder in folder.folders]]
+
+
+def LoadFolder(data):
+    firstID, files, folders = data
+    return ndspy.fnt.Folder(folders=[(name, LoadFolder(childData)) for name, childData in folders], files=files, firstID=firstID)
+
+
+class ROMIndex:
+
+    # What opening a ROM works out before anything can be shown: the filename table, the
+    # FAT and the decoded banner. Cached per ROM file outside the ROM's own directory, and
+    # only trusted while the file's path, size, mtime and header CRC are unchanged.
+
+    def __init__(self, filenames, fat, titles, icon):
+        self.filenames = filenames
+        self.fat = fat
+        self.titles = titles
+        self.icon = icon
+
+    @staticmethod
+    def Key(fileName):
+        # Raises OSError if the file can't be read.
+        fileName = os.path.abspath(fileName)
+
+        with open(fileName, 'rb') as f:
+            st = os.fstat(f.fileno())
+            f.seek(0x15E)
+            headerCRC = f.read(2)
+
+        return {'path': fileName, 'size': st.st_size, 'mtime': st.st_mtime_ns,
+                'headerCRC': struct.unpack('<H', headerCRC)[0] if len(headerCRC) == 2 else None}
+
+    @staticmethod
+    def CacheFileName(key):
+        return os.path.join(CacheDirectory(), HashData(key['path'].encode('utf-8')) + '.json')
+
+    @classmethod
+    def Load(cls, key):
+        # Returns None unless an index was saved for exactly this version of the file.
+        try:
+            with open(cls.CacheFileName(key), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            if data['version'] != INDEX_VERSION or data['key'] != key:
+                return None
+
+            icon = None
+            if data['icon'] is not None:
+                # Like the rest of the banner decoding, NumPy is only loaded when there's an icon.
+                import numpy
+                icon = numpy.frombuffer(base64.b64decode(data['icon']['rgba']), dtype=numpy.uint8).reshape(data['icon']['shape'])
+
+            return cls(LoadFolder(data['filenames']), base64.b64decode(data['fat']), data['titles'], icon)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def Save(self, key):
+        icon = None
+        if self.icon is not None:
+            icon = {'shape': list(self.icon.shape), 'rgba': base64.b64encode(self.icon.tobytes()).decode('ascii')}
+
+        data = {'version': INDEX_VERSION, 'key': key, 'filenames': SaveFolder(self.filenames),
+                'fat': base64.b64encode(self.fat).decode('ascii'), 'titles': self.titles, 'icon': icon}
+
+        fileName = self.CacheFileName(key)
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+
+        with open(fileName + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+        os.replace(fileName + '.tmp', fileName)
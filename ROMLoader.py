@@ -0,0 +1,126 @@
+import struct
+
+from ndspy import Processor
+
+from PyQt5 import QtCore
+
+# ndspy's ROM modules, PIL through them, and NumPy are imported where they're used, so
+# that they load with the first ROM rather than with the GUI.
+
+class ROMLoadCancelled(Exception):
+    pass
+
+
+def DecodeBanner(iconBanner):
+    # Returns the titles and the icon as an RGBA array.
+    import BannerIcon
+
+    return BannerIcon.DecodeTitles(iconBanner), BannerIcon.DecodeIcon(iconBanner)
+
+
+class ROMLoadWorker(QtCore.QObject):
+
+    romLoaded = QtCore.pyqtSignal(object)
+    bannerLoaded = QtCore.pyqtSignal(list, object)
+    codeLoaded = QtCore.pyqtSignal(object, object, object, object)
+    codeIndexed = QtCore.pyqtSignal(object, object, object)
+    progressChanged = QtCore.pyqtSignal(int, str)
+    finished = QtCore.pyqtSignal()
+    cancelled = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, fileName, lazy, codeLoader):
+        super(ROMLoadWorker, self).__init__()
+
+        self.fileName = fileName
+        self.lazy = lazy
+        self.codeLoader = codeLoader
+        self.cancelRequested = False
+
+    def Cancel(self):
+        self.cancelRequested = True
+
+    def CheckCancelled(self):
+        if self.cancelRequested:
+            raise ROMLoadCancelled
+
+    def Run(self):
+        try:
+            self.Load()
+        except ROMLoadCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.finished.emit()
+
+    def Load(self):
+        import ndspy.rom
+        import LazyROM
+        import ROMIndexCache
+
+        self.progressChanged.emit(0, 'Loading the ROM...')
+
+        if not self.lazy:
+            self.LoadFully(ndspy.rom.NintendoDSRom.fromFile(self.fileName))
+            return
+
+        # Memory-mapped ROMs are indexed, so reopening an unchanged one skips the parsing
+        # and decoding needed before the tree and banner can be shown.
+        try:
+            key = ROMIndexCache.ROMIndex.Key(self.fileName)
+        except OSError:
+            key = None
+
+        index = ROMIndexCache.ROMIndex.Load(key) if key is not None else None
+        rom = LazyROM.LazyNintendoDSRom.fromFile(self.fileName, index)
+
+        if index is None:
+            titles, icon = self.LoadFully(rom)
+
+            if key is not None:
+                fat = b''.join(struct.pack('<II', *entry) for entry in rom.files.entries)
+                try:
+                    ROMIndexCache.ROMIndex(rom.filenames, fat, titles, icon).Save(key)
+                except OSError:
+                    pass
+            return
+
+        self.CheckCancelled()
+        self.romLoaded.emit(rom)
+
+        if index.icon is not None:
+            self.bannerLoaded.emit(index.titles, index.icon)
+
+        # The code is parsed in the background by the code loader once the tree is up.
+        overlays9 = self.codeLoader.LoadOverlays(rom, Processor.ARM9, decode=False)
+        overlays7 = self.codeLoader.LoadOverlays(rom, Processor.ARM7, decode=False)
+        self.codeIndexed.emit(rom, overlays9, overlays7)
+
+        self.progressChanged.emit(100, 'Done.')
+
+    def LoadFully(self, rom):
+        # Returns the decoded titles and icon, both None without a banner.
+        titles = icon = None
+
+        self.CheckCancelled()
+        self.romLoaded.emit(rom)
+
+        if rom.iconBanner:
+            titles, icon = DecodeBanner(rom.iconBanner)
+            self.bannerLoaded.emit(titles, icon)
+
+        self.progressChanged.emit(20, 'Loading the code...')
+        arm9File = rom.loadArm9()
+        arm7File = rom.loadArm7()
+        self.CheckCancelled()
+
+        self.progressChanged.emit(40, 'Loading the overlays...')
+        overlays9 = self.codeLoader.LoadOverlays(rom, Processor.ARM9)
+        self.CheckCancelled()
+        overlays7 = self.codeLoader.LoadOverlays(rom, Processor.ARM7)
+        self.CheckCancelled()
+        self.codeLoaded.emit(arm9File, arm7File, overlays9, overlays7)
+
+        self.progressChanged.emit(100, 'Done.')
+        return titles, icon
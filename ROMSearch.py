@@ -0,0 +1,233 @@
+import os
+import mmap
+import threading
+
+# multiprocessing is imported where it's used, so that the GUI and the command line don't
+# wait for it at startup.
+
+PATTERN_KINDS = ('hex', 'text', 'pointer')
+
+def ParsePatterns(texts, kind):
+    """
+    Turns what was asked for into the byte strings to look for, as (label, bytes) pairs.
+    'hex' takes hex bytes, spaces allowed; 'text' looks for the text as both ASCII and
+    UTF-16; 'pointer' takes a number (0x for hex) and looks for it as a 32-bit little-endian
+    value. Raises ValueError for anything that can't be searched for.
+    """
+    patterns = []
+
+    for text in texts:
+        if kind == 'hex':
+            data = bytes.fromhex(text)
+            patterns.append((data.hex(' ').upper(), data))
+        elif kind == 'text':
+            if text.isascii():
+                patterns.append(('"' + text + '" (ASCII)', text.encode('ascii')))
+            patterns.append(('"' + text + '" (UTF-16)', text.encode('utf-16-le')))
+        elif kind == 'pointer':
+            value = int(text, 0)
+            if not 0 <= value <= 0xFFFFFFFF:
+                raise ValueError('Not a 32-bit value: ' + text)
+            patterns.append((format(value, '#010x'), value.to_bytes(4, 'little')))
+        else:
+            raise ValueError('Unknown pattern kind: ' + kind)
+
+    patterns = [(label, data) for label, data in patterns if data]
+    if not patterns:
+        raise ValueError('Nothing to search for')
+
+    return patterns
+
+
+def SearchChunks(fileName, chunks, patterns, alignment, maxResults):
+    """
+    Runs in the pool. Each chunk is (entry index, source, start, end, limit, file offset):
+    matches starting from start up to end are looked for in source, which is the data
+    itself or None for the ROM file at fileName, mapped rather than read. Matches may run
+    on up to limit, and are reported as (entry index, offset in the file, pattern index),
+    with the offset counted from file offset at start.
+    """
+    romMap = None
+    results = []
+
+    try:
+        if any(chunk[1] is None for chunk in chunks):
+            with open(fileName, 'rb') as f:
+                romMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # One C-level find per pattern, which runs far faster than a matcher in Python
+        # could, and finds overlapping matches too.
+        for entryIndex, source, start, end, limit, fileOffset in chunks:
+            data = romMap if source is None else source
+
+            for patternIndex, pattern in enumerate(patterns):
+                last = min(limit, end + len(pattern) - 1)
+                i = data.find(pattern, start, last)
+
+                while i >= 0:
+                    offset = i - start + fileOffset
+                    if offset % alignment == 0:
+                        results.append((entryIndex, offset, patternIndex))
+                    i = data.find(pattern, i + 1, last)
+
+            if len(results) >= maxResults:
+                break
+    finally:
+        if romMap is not None:
+            romMap.close()
+
+    results.sort()
+    return results
+
+
+class SearchPlan:
+
+    # What a search goes through: each target ('file', file ID), ('main', processor) or
+    # ('overlay', processor, overlay ID) with either its data or, for files that are still
+    # where they are in the ROM file, their range in it, so that workers can map the file
+    # instead of being sent the data.
+
+    def __init__(self, fileName=None):
+        self.fileName = fileName
+        self.targets = []
+        self.sources = []
+        self.byteCount = 0
+
+    def AddData(self, target, data):
+        self.targets.append(target)
+        self.sources.append(data)
+        self.byteCount += len(data)
+
+    def AddRange(self, target, start, end):
+        self.targets.append(target)
+        self.sources.append((start, end))
+        self.byteCount += end - start
+
+
+class SearchEngine:
+
+    taskSize = 4 * 1024 * 1024
+
+    def __init__(self, plan, patterns, start=0, end=None, alignment=1, maxResults=10000, reporter=None, onResults=None, maxWorkers=None):
+        self.plan = plan
+        self.labels = [label for label, _data in patterns]
+        self.patterns = [data for _label, data in patterns]
+        self.start = start
+        self.end = end
+        self.alignment = max(1, alignment)
+        self.maxResults = maxResults
+        self.reporter = reporter
+        self.onResults = onResults
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.cancelEvent = threading.Event()
+        self.results = []
+        self.truncated = False
+
+    def Cancel(self):
+        self.cancelEvent.set()
+
+    def MakeTasks(self):
+        # Targets are taken in order and cut into chunks of at most taskSize, overlapping by
+        # a pattern's length so that nothing is missed at the cuts; consecutive small targets
+        # share a task. Returns (chunks, byte count) for each task.
+        overlap = max(len(pattern) for pattern in self.patterns) - 1
+        tasks = []
+        chunks = []
+        taskBytes = 0
+
+        for entryIndex, source in enumerate(self.plan.sources):
+            size = source[1] - source[0] if isinstance(source, tuple) else len(source)
+            first = min(self.start, size)
+            last = size if self.end is None else min(self.end, size)
+
+            for chunkStart in range(first, last, self.taskSize):
+                chunkEnd = min(chunkStart + self.taskSize, last)
+
+                if isinstance(source, tuple):
+                    base = source[0]
+                    chunks.append((entryIndex, None, base + chunkStart, base + chunkEnd, source[1], chunkStart))
+                else:
+                    data = bytes(source[chunkStart : min(size, chunkEnd + overlap)])
+                    chunks.append((entryIndex, data, 0, chunkEnd - chunkStart, len(data), chunkStart))
+
+                taskBytes += chunkEnd - chunkStart
+                if taskBytes >= self.taskSize:
+                    tasks.append((chunks, taskBytes))
+                    chunks = []
+                    taskBytes = 0
+
+        if chunks:
+            tasks.append((chunks, taskBytes))
+
+        return tasks
+
+    def AddResults(self, results, byteCount):
+        results = [(self.plan.targets[entryIndex], offset, patternIndex) for entryIndex, offset, patternIndex in results]
+
+        room = self.maxResults - len(self.results)
+        if len(results) > room:
+            results = results[:room]
+            self.truncated = True
+            self.cancelEvent.set()
+
+        self.results.extend(results)
+
+        if results and self.onResults is not None:
+            self.onResults(results)
+        if self.reporter is not None:
+            self.reporter.Advance(0, byteCount)
+
+    def Run(self):
+        tasks = self.MakeTasks()
+        arguments = (self.patterns, self.alignment, self.maxResults)
+
+        # Starting worker processes costs more than searching a single task does.
+        if len(tasks) <= 1 or self.maxWorkers == 1:
+            for chunks, byteCount in tasks:
+                if self.cancelEvent.is_set():
+                    break
+                self.AddResults(SearchChunks(self.plan.fileName, chunks, *arguments), byteCount)
+            return
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+        # Only a couple of tasks per worker are queued at a time, so a cancel takes effect
+        # without waiting for the whole ROM to drain through the pool. Results are added in
+        # the order tasks finish.
+        tasks = iter(tasks)
+        pending = {}
+
+        with ProcessPoolExecutor(max_workers=self.maxWorkers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                while len(pending) < self.maxWorkers * 2 and not self.cancelEvent.is_set():
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    chunks, byteCount = task
+                    pending[pool.submit(SearchChunks, self.plan.fileName, chunks, *arguments)] = byteCount
+
+                if not pending:
+                    break
+
+                done, _notDone = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    byteCount = pending.pop(future)
+                    if not self.cancelEvent.is_set():
+                        self.AddResults(future.result(), byteCount)
+
+                if self.cancelEvent.is_set():
+                    for future in pending:
+                        future.cancel()
+                    break
+
+    def SortedResults(self):
+        # Results come in as tasks finish; this puts them in the order of the plan.
+        order = {id(target): i for i, target in enumerate(self.plan.targets)}
+        return sorted(self.results, key=lambda result: (order[id(result[0])], result[1], result[2]))
+
+    def Summary(self):
+        summary = str(len(self.results)) + ' matches in ' + str(len({id(result[0]) for result in self.results})) + ' files.'
+        if self.truncated:
+            summary += ' Stopped after the first ' + str(self.maxResults) + '.'
+        return summary
@@ -0,0 +1,775 @@
+import os
+import functools
+import PathIndex
+import CodeLoader
+import FileIDIndex
+import ExtractionEngine
+import ReplacementEngine
+import ROMSearch
+
+from ndspy import Processor
+
+# ndspy's ROM modules, and PIL through them, are imported where they're used, so that
+# starting the GUI or the command line doesn't wait for them before a ROM is opened.
+
+class ROMEditError(Exception):
+    pass
+
+
+def Recorded(label):
+    # Makes a session method an edit that can be undone, as one step however many other
+    # edits it makes, and that's journaled so that it can be made again after a crash.
+    def Decorate(method):
+        @functools.wraps(method)
+        def Edit(session, *args, **kwargs):
+            # The arguments are journaled as they were before the edit changed anything.
+            entry = session.JournalEntry(method.__name__, args, kwargs)
+            session.BeginEdit(label, entry)
+            try:
+                result = method(session, *args, **kwargs)
+            finally:
+                session.EndEdit()
+            session.Journal(entry)
+            return result
+        Edit.recorded = True
+        return Edit
+    return Decorate
+
+
+class ROMObserver:
+
+    # Told about edits to the filename table and the overlays as they happen, with the data
+    # changing between each Begin and End call. The GUI's model uses this to keep the tree
+    # in step; by default nothing is listening.
+
+    def BeginInsertFiles(self, folder, position, count):
+        pass
+
+    def EndInsertFiles(self, folder):
+        pass
+
+    def BeginRemoveFiles(self, folder, position, count):
+        pass
+
+    def EndRemoveFiles(self, folder):
+        pass
+
+    def FileRenamed(self, folder, row):
+        pass
+
+    def BeginInsertFolder(self, parentFolder, position):
+        pass
+
+    def EndInsertFolder(self, parentFolder, folder):
+        pass
+
+    def BeginRemoveFolder(self, parentFolder, position):
+        pass
+
+    def EndRemoveFolder(self, parentFolder, folder):
+        pass
+
+    def FolderRenamed(self, parentFolder, position):
+        pass
+
+    def BeginClearFolder(self, folder):
+        pass
+
+    def EndClearFolder(self, folder):
+        pass
+
+    def OverlayInserted(self, processor, overlayID):
+        pass
+
+    def OverlaysRemoved(self, processor):
+        pass
+
+    def ROMRestored(self):
+        # After an undo or redo, which can change anything.
+        pass
+
+
+class ROMSession:
+
+    # An open ROM and what editing it needs: its parsed code, the file ID index and the path
+    # index. Every change to the filename table, the file list or the overlays goes through
+    # here, so the GUI and the command line edit ROMs the same way.
+
+    def __init__(self, rom, fileName=None, codeLoader=None):
+        self.rom = rom
+        self.fileName = fileName
+        self.codeLoader = codeLoader or CodeLoader.CodeLoader()
+        self.fileIDs = None
+        self.paths = PathIndex.PathIndex(rom.filenames)
+        self.observer = ROMObserver()
+        self.codeParsed = True
+        self.history = None
+        self.journal = None
+        self.editDepth = 0
+
+    @classmethod
+    def Open(cls, fileName, lazy=True):
+        import ndspy.rom
+        import LazyROM
+        import ROMIndexCache
+
+        if not lazy:
+            return cls(ndspy.rom.NintendoDSRom.fromFile(fileName), fileName)
+
+        # An index the GUI saved for this version of the file saves parsing the FNT and FAT.
+        try:
+            index = ROMIndexCache.ROMIndex.Load(ROMIndexCache.ROMIndex.Key(fileName))
+        except OSError:
+            index = None
+
+        return cls(LazyROM.LazyNintendoDSRom.fromFile(fileName, index), fileName)
+
+    def Code(self):
+        # Without a loader that already has the code, only the overlay tables are read here;
+        # the code itself is parsed the first time its data is needed.
+        if self.codeLoader.OverlayObjects(Processor.ARM9) is None:
+            self.codeLoader.SetCode(None, None,
+                                    self.codeLoader.LoadOverlays(self.rom, Processor.ARM9, decode=False),
+                                    self.codeLoader.LoadOverlays(self.rom, Processor.ARM7, decode=False))
+            self.codeParsed = False
+        return self.codeLoader
+
+    def ParsedCode(self):
+        code = self.Code()
+
+        if not self.codeParsed:
+            self.codeParsed = True
+            for processor in (Processor.ARM9, Processor.ARM7):
+                self.ReloadCode(True, processor)
+                self.ReloadCode(False, processor)
+
+        return code
+
+    def Overlays(self, processor):
+        # The overlays with their data.
+        return self.ParsedCode().Overlays(processor)
+
+    def OverlayObjects(self, processor):
+        # The overlays, for when only their table entries are needed.
+        return self.Code().OverlayObjects(processor)
+
+    def MainFile(self, processor):
+        return self.ParsedCode().MainFile(processor)
+
+    def Save(self, fileName=None, deduplicate=False):
+        # Returns the IDs of the files that were saved pointing at another file's data.
+        import ROMWriter
+
+        self.WriteBackOverlays()
+
+        if self.history is None:
+            shared = ROMWriter.SaveROM(self.rom, fileName or self.fileName, deduplicate)
+        else:
+            entries = self.history.BeforeSave(self.rom)
+            shared = ROMWriter.SaveROM(self.rom, fileName or self.fileName, deduplicate)
+            self.history.AfterSave(self.rom, entries)
+
+        # Saved under another name, the session goes on with that file, which is the one a
+        # lazily loaded ROM is mapped from now.
+        if fileName is not None:
+            self.fileName = fileName
+
+        # The saved file is on disk by now, and is what later edits are journaled against.
+        if self.journal is not None:
+            self.journal.Close()
+            self.StartJournal()
+
+        return shared
+
+    def SharingSummary(self, shared):
+        # Each file's data would have taken up whole 0x200-byte blocks.
+        size = sum(-(-len(self.rom.files[fileID]) // 0x200) * 0x200 for fileID in shared)
+        return str(len(shared)) + ' duplicate files share data with another file, saving ' + str(size) + ' bytes.'
+
+    # Undo and redo, for sessions that keep a history
+
+    def EnableHistory(self, memoryLimit=None):
+        import EditHistory
+
+        self.history = EditHistory.EditHistory(memoryLimit)
+        if self.fileIDs is not None:
+            self.fileIDs.log = self.history.indexLog
+
+    def Close(self):
+        # The edits are saved or given up on by now, so the journal goes too.
+        if self.history is not None:
+            self.history.Close()
+        if self.journal is not None:
+            self.journal.Close()
+            self.journal = None
+
+    def BeginEdit(self, label, entry=None):
+        # Edits nest; only the outermost one is recorded, under its label and with what was
+        # journaled for it.
+        self.editDepth += 1
+        if self.editDepth == 1 and self.history is not None:
+            self.history.Begin(self, label, entry)
+
+    def EndEdit(self):
+        self.editDepth -= 1
+        if not self.editDepth and self.history is not None:
+            self.history.End(self)
+
+    def Undo(self):
+        # Returns the label of the edit undone, or None if there was nothing to undo.
+        if self.history is None or not self.history.CanUndo():
+            return None
+
+        import EditHistory
+
+        # Undoing an edit the journal has is journaled as the step it undoes, which recovering
+        # undoes too. An edit made before the ROM was last saved isn't in the journal, so
+        # undoing it is journaled as the changes undoing it makes, as an edit of its own.
+        step = self.history.UndoStep()
+        changes = None
+        if self.Journaling() and not step.journaled:
+            changes = EditHistory.ChangeList()
+
+        entry = self.JournalEntry('Undo', (step.label,), {}) if changes is None else None
+        step, reload = self.history.Undo(self, changes)
+        self.Restored(step.attributes, reload)
+        self.Journal(entry if changes is None else self.JournalEntry('MakeChanges', (changes,), {}))
+        return step.label
+
+    def Redo(self):
+        if self.history is None or not self.history.CanRedo():
+            return None
+
+        import EditHistory
+
+        # A redone edit is journaled as the edit itself where that's known, and otherwise as
+        # the changes redoing it makes, so that it's made again whatever the journal has.
+        step = self.history.RedoStep()
+        changes = None
+        if self.Journaling() and step.entry is None:
+            changes = EditHistory.ChangeList(label=step.label)
+
+        entry = step.entry if changes is None else None
+        step, reload = self.history.Redo(self, changes)
+        self.Restored(step.attributes, reload)
+        if self.Journaling():
+            self.Journal(entry if changes is None else self.JournalEntry('MakeChanges', (changes,), {}))
+            step.journaled = True
+        return step.label
+
+    @Recorded('Recovered edit')
+    def MakeChanges(self, changes):
+        # Makes again what an undo or redo journaled as a ChangeList did.
+        import EditHistory
+
+        # The index has to have the segments as they are before the changes, which its own
+        # changes are made to.
+        self.FileIDs()
+        decodedFrom = EditHistory.DecodedFrom(self)
+        changes.Make(self)
+        self.Restored(changes.Attributes(), EditHistory.Reload(self, decodedFrom))
+
+        # Changes that redo a step are recorded as that step, so that undoing it is journaled
+        # the same here as where it was redone.
+        if changes.label is not None and self.history is not None and self.history.step is not None:
+            self.history.step.label = changes.label
+
+    def Restored(self, attributes, reload):
+        # The file ID index was put back by the history; the path index is rebuilt and the
+        # code that changed is parsed again.
+        self.paths = PathIndex.PathIndex(self.rom.filenames)
+
+        for processor in (Processor.ARM9, Processor.ARM7):
+            if {'arm' + str(int(processor)), 'arm9PostData' if processor == Processor.ARM9 else None} & set(attributes):
+                self.ReloadCode(True, processor)
+            if reload.get(processor):
+                self.ReloadCode(False, processor, reload[processor])
+
+        self.observer.ROMRestored()
+
+    # Journaling, for sessions of a ROM file that edits should survive a crash of
+
+    def RecoverableEdits(self):
+        # How many edits a journal left by an earlier session holds for this ROM file.
+        import EditJournal
+
+        return EditJournal.EditJournal(self.fileName).Scan()
+
+    def StartJournal(self, fileName=None, recover=False):
+        """
+        Starts journaling edits next to the ROM file. With recover, the edits a journal left
+        by an earlier session holds for this version of the file are made again first, as
+        far as they can be, and kept in the journal; otherwise it's started over. Returns
+        how many edits were recovered, and the name of the file the journal was copied to
+        if some of them couldn't be, so that they aren't lost when the journal goes on from
+        the last one that could. Raises OSError if the journal can't be written.
+        """
+        import EditJournal
+
+        journal = EditJournal.EditJournal(fileName or self.fileName)
+        count = 0
+        end = None
+        asideFileName = None
+
+        if recover:
+            for recordEnd, document, blobs in journal.Records():
+                lastStep = self.history.UndoStep() if self.history is not None else None
+                try:
+                    self.Replay(document, blobs)
+                except (ROMEditError, LookupError, ValueError, TypeError):
+                    # What an edit did before it failed is taken back.
+                    if self.history is not None and self.history.UndoStep() is not lastStep:
+                        step, reload = self.history.Undo(self)
+                        self.history.Discard()
+                        self.Restored(step.attributes, reload)
+                    asideFileName = journal.SetAside()
+                    break
+                count += 1
+                end = recordEnd
+
+        journal.Open(end)
+        self.journal = journal
+
+        # The history's steps are either the edits just recovered, or ones from before the
+        # ROM was saved, which the journal doesn't have.
+        if self.history is not None:
+            self.history.SetJournaled(recover)
+
+        return count, asideFileName
+
+    def Journaling(self):
+        # Edits made by other edits aren't journaled.
+        return self.journal is not None and not self.editDepth
+
+    def JournalEntry(self, name, args, kwargs):
+        # What to journal for an edit, or None.
+        if not self.Journaling():
+            return None
+
+        import EditJournal
+
+        blobs = []
+        document = {'edit': name, 'args': [EditJournal.Encode(self, value, blobs) for value in args],
+                    'kwargs': {key: EditJournal.Encode(self, value, blobs) for key, value in kwargs.items()}}
+        return document, blobs
+
+    def Journal(self, entry):
+        if entry is not None:
+            self.journal.Append(*entry)
+
+    def Replay(self, document, blobs):
+        import EditJournal
+
+        name = document['edit']
+        if name in ('Undo', 'Redo'):
+            # Only if it undoes or redoes the same step here.
+            label = None
+            if self.history is not None:
+                label = self.history.UndoLabel() if name == 'Undo' else self.history.RedoLabel()
+            if label is None or document['args'] != [label]:
+                raise ValueError(name + ' of an edit that isn\'t in the journal')
+            getattr(self, name)()
+            return
+
+        # Only edits are made from a journal, whatever else it names.
+        method = getattr(type(self), name, None)
+        if not getattr(method, 'recorded', False):
+            raise ValueError('Not an edit: ' + name)
+
+        args = [EditJournal.Decode(self, value, blobs) for value in document['args']]
+        kwargs = {key: EditJournal.Decode(self, value, blobs) for key, value in document['kwargs'].items()}
+        method(self, *args, **kwargs)
+
+    # File IDs
+
+    def FileIDs(self):
+        # Built on first use; until then, and after every compaction, the IDs stored in the
+        # folders and overlays are current. Raises ValueError for ROMs whose IDs overlap.
+        if self.fileIDs is None:
+            overlays = (self.OverlayObjects(Processor.ARM9), self.OverlayObjects(Processor.ARM7))
+            self.fileIDs = FileIDIndex.FileIDIndex(self.rom.filenames, overlays, len(self.rom.files))
+            if self.history is not None:
+                self.fileIDs.log = self.history.indexLog
+
+        return self.fileIDs
+
+    def OverlayFileID(self, overlay):
+        # Current even while the index has edits that Compact hasn't written back.
+        return overlay.fileID if self.fileIDs is None else self.fileIDs.FirstID(overlay)
+
+    def CompactFileIDs(self):
+        if self.fileIDs is None or not self.fileIDs.Compact():
+            return
+
+        self.SaveOverlayTables()
+
+    def WriteBackOverlays(self):
+        # Overlays replaced from a code folder only have new decoded data until this
+        # compresses them into the ROM's files.
+        self.CompactFileIDs()
+        if self.codeParsed and self.Code().WriteBackOverlays(self.rom):
+            self.SaveOverlayTables()
+
+    def SaveOverlayTables(self):
+        import ndspy.code
+
+        self.rom.arm7OverlayTable = ndspy.code.saveOverlayTable(self.OverlayObjects(Processor.ARM7))
+        self.rom.arm9OverlayTable = ndspy.code.saveOverlayTable(self.OverlayObjects(Processor.ARM9))
+
+    def FolderRanges(self, folder):
+        # The (first ID, count) of every folder in a subtree; folders added since the ROM was
+        # opened take IDs at the end, so a subtree's files aren't always contiguous.
+        fileIDs = self.FileIDs()
+        ranges = [(fileIDs.FirstID(folder), len(folder.files))]
+
+        for _folderName, childFolder in folder.folders:
+            ranges.extend(self.FolderRanges(childFolder))
+
+        return ranges
+
+    def DeleteRanges(self, ranges):
+        for start, count in sorted(ranges, reverse=True):
+            self.SetFiles(start, start + count, [])
+
+    # Every change to the file list, the folders' lists and the overlays goes through these,
+    # so that the history can record it.
+
+    def SetFiles(self, start, end, data):
+        if self.history is None:
+            self.rom.files[start : end] = data
+        else:
+            self.history.SetFiles(self.rom, start, end, data)
+
+    def SetItems(self, items, start, end, newItems):
+        if self.history is None:
+            items[start : end] = newItems
+        else:
+            self.history.SetItems(items, start, end, newItems)
+
+    def SetOverlays(self, processor, overlays):
+        if self.history is None:
+            self.codeLoader.SetOverlays(processor, overlays)
+        else:
+            self.history.SetOverlays(self.codeLoader, processor, overlays)
+
+    def ReplaceOverlayData(self, overlay, data):
+        self.ParsedCode()
+        if self.history is None:
+            self.codeLoader.ReplaceOverlayData(overlay, data)
+        else:
+            self.history.ReplaceOverlayData(self, overlay, data)
+
+    # Code
+
+    def ReloadCode(self, main, processor, overlayIDs=None):
+        if not self.codeParsed:
+            # The first parse reads everything as it is then.
+            return
+
+        if main:
+            self.Code().ReloadMain(self.rom, processor)
+        else:
+            # The overlays' files are read by their file IDs, so those have to be current.
+            self.CompactFileIDs()
+            self.Code().ReloadOverlays(self.rom, processor, overlayIDs)
+
+    def ReloadChangedCode(self, fileIDs, attributes):
+        # Re-parses only the main code files and overlays whose data was replaced.
+        for processor in (Processor.ARM9, Processor.ARM7):
+            if 'arm' + str(int(processor)) in attributes:
+                self.ReloadCode(True, processor)
+
+            overlayIDs = {i for i, ov in self.OverlayObjects(processor).items() if ov.fileID in fileIDs}
+            if overlayIDs:
+                self.ReloadCode(False, processor, overlayIDs)
+
+    # Extracting and replacing folders. With neither a folder nor a processor these work
+    # on the whole ROM, laid out as the filesystem root and the two code directories.
+
+    def PlanCodeFolder(self, plan, processor, path):
+        mainData = self.rom.arm7 if processor == Processor.ARM7 else self.rom.arm9
+        plan.AddCodeFolder(processor, mainData, self.Overlays(processor), path)
+
+    def PlanExtraction(self, dirPath, folder=None, processor=None):
+        self.CompactFileIDs()
+        plan = ExtractionEngine.ExtractionPlan(dirPath)
+
+        if folder is not None:
+            plan.AddFolder(self.rom, folder, dirPath)
+        elif processor is not None:
+            self.PlanCodeFolder(plan, processor, dirPath)
+        else:
+            plan.AddFolder(self.rom, self.rom.filenames, os.path.join(dirPath, 'Filesystem Root'))
+            self.PlanCodeFolder(plan, Processor.ARM7, os.path.join(dirPath, 'ARM7'))
+            self.PlanCodeFolder(plan, Processor.ARM9, os.path.join(dirPath, 'ARM9'))
+
+        return plan
+
+    def PlanReplacement(self, dirPath, folder=None, processor=None):
+        self.CompactFileIDs()
+        plan = ReplacementEngine.ReplacementPlan(dirPath)
+
+        if folder is not None:
+            plan.AddFolder(self.rom, folder, dirPath)
+        elif processor is not None:
+            plan.AddCodeFolder(self.rom, processor, self.Overlays(processor), dirPath)
+        else:
+            plan.AddFolder(self.rom, self.rom.filenames, os.path.join(dirPath, 'Filesystem Root'))
+            plan.AddCodeFolder(self.rom, Processor.ARM7, self.Overlays(Processor.ARM7), os.path.join(dirPath, 'ARM7'))
+            plan.AddCodeFolder(self.rom, Processor.ARM9, self.Overlays(Processor.ARM9), os.path.join(dirPath, 'ARM9'))
+
+        return plan
+
+    def PlanSearch(self):
+        # The code is searched first, with the overlays decompressed, then every other file.
+        # Files still where they are in the mapped ROM file are searched there.
+        import LazyROM
+
+        self.CompactFileIDs()
+        plan = ROMSearch.SearchPlan(self.fileName)
+        overlayFileIDs = set()
+
+        for processor in (Processor.ARM9, Processor.ARM7):
+            plan.AddData(('main', processor), self.rom.arm9 if processor == Processor.ARM9 else self.rom.arm7)
+
+            for overlayID, ov in sorted(self.Overlays(processor).items()):
+                plan.AddData(('overlay', processor, overlayID), ov.data)
+                overlayFileIDs.add(ov.fileID)
+
+        files = self.rom.files
+        mapped = LazyROM.IsLazy(self.rom) and self.fileName is not None and files.IsMapping(self.fileName)
+
+        for fileID in range(len(files)):
+            if fileID in overlayFileIDs:
+                continue
+
+            if mapped and files.IsMapped(fileID):
+                plan.AddRange(('file', fileID), *files.entries[fileID])
+            else:
+                plan.AddData(('file', fileID), files[fileID])
+
+        return plan
+
+    @Recorded('Replace')
+    def ApplyReplacement(self, engine):
+        # Returns how many files changed.
+        changed = engine.Apply(self.rom, self.ReplaceFile, self.ReplaceOverlayData)
+        if changed:
+            self.ReloadChangedCode(engine.ChangedFileIDs(), engine.ChangedAttributes())
+        return changed
+
+    @Recorded('Replace')
+    def ReplaceFile(self, fileID, data):
+        self.SetFiles(fileID, fileID + 1, [data])
+
+    @Recorded('Replace')
+    def ReplaceMain(self, processor, data):
+        setattr(self.rom, 'arm' + str(int(processor)), data)
+
+    # The filename table
+
+    def CheckFileName(self, folder, fileName):
+        if self.paths.FileRow(folder, fileName) is not None:
+            raise ROMEditError('A file with this name already exists in this folder.')
+
+    def CheckFolderName(self, folder, folderName):
+        if self.paths.FolderPosition(folder, folderName) is not None:
+            raise ROMEditError('A folder with this name already exists in this folder.')
+
+    @Recorded('Add file')
+    def InsertFile(self, folder, position, fileName, data=b''):
+        self.CheckFileName(folder, fileName)
+        fileIDs = self.FileIDs()
+
+        self.observer.BeginInsertFiles(folder, position, 1)
+        firstID = fileIDs.FirstID(folder)
+        self.SetFiles(firstID + position, firstID + position, [data])
+        fileIDs.AddFiles(folder, 1)
+        self.SetItems(folder.files, position, position, [fileName])
+        self.paths.FilesInserted(folder, position, [fileName])
+        self.observer.EndInsertFiles(folder)
+
+    @Recorded('Remove file')
+    def RemoveFile(self, folder, row):
+        fileIDs = self.FileIDs()
+        fileName = folder.files[row]
+
+        self.observer.BeginRemoveFiles(folder, row, 1)
+        fileID = fileIDs.FirstID(folder) + row
+        self.SetFiles(fileID, fileID + 1, [])
+        fileIDs.RemoveFiles(folder, 1)
+        self.SetItems(folder.files, row, row + 1, [])
+        self.paths.FileRemoved(folder, row, fileName)
+        self.observer.EndRemoveFiles(folder)
+
+    @Recorded('Rename file')
+    def RenameFile(self, folder, row, newName):
+        oldName = folder.files[row]
+        if newName == oldName:
+            return
+
+        self.CheckFileName(folder, newName)
+        self.SetItems(folder.files, row, row + 1, [newName])
+        self.paths.FileRenamed(folder, row, oldName, newName)
+        self.observer.FileRenamed(folder, row)
+
+    @Recorded('Add folder')
+    def AddFolder(self, parentFolder, folderName):
+        import ndspy.fnt
+
+        self.CheckFolderName(parentFolder, folderName)
+
+        newFolder = ndspy.fnt.Folder(firstID=len(self.rom.files))
+        self.FileIDs().AppendSegment(newFolder, 0)
+        self.AttachFolder(parentFolder, folderName, newFolder)
+        return newFolder
+
+    def AttachFolder(self, parentFolder, folderName, newFolder):
+        position = len(parentFolder.folders)
+        self.observer.BeginInsertFolder(parentFolder, position)
+        self.SetItems(parentFolder.folders, position, position, [(folderName, newFolder)])
+        self.paths.FolderAdded(parentFolder, folderName, newFolder)
+        self.observer.EndInsertFolder(parentFolder, newFolder)
+
+    @Recorded('Remove folder')
+    def RemoveFolder(self, parentFolder, folderName):
+        position = self.paths.FolderPosition(parentFolder, folderName)
+        folder = parentFolder.folders[position][1]
+        ranges = self.FolderRanges(folder)
+
+        self.observer.BeginRemoveFolder(parentFolder, position)
+        self.DeleteRanges(ranges)
+        self.FileIDs().RemoveFolder(folder)
+        self.SetItems(parentFolder.folders, position, position + 1, [])
+        self.paths.FolderRemoved(parentFolder, position, folderName, folder)
+        self.observer.EndRemoveFolder(parentFolder, folder)
+
+    @Recorded('Rename folder')
+    def RenameFolder(self, parentFolder, oldName, newName):
+        if newName == oldName:
+            return
+
+        self.CheckFolderName(parentFolder, newName)
+        position = self.paths.FolderPosition(parentFolder, oldName)
+        folder = parentFolder.folders[position][1]
+
+        self.SetItems(parentFolder.folders, position, position + 1, [(newName, folder)])
+        self.paths.FolderRenamed(parentFolder, position, oldName, newName, folder)
+        self.observer.FolderRenamed(parentFolder, position)
+
+    @Recorded('Remove everything')
+    def ClearFolder(self, folder):
+        # Removes everything in a folder, which is kept; used for the filesystem root.
+        fileIDs = self.FileIDs()
+        ranges = self.FolderRanges(folder)
+
+        self.observer.BeginClearFolder(folder)
+        self.DeleteRanges(ranges)
+        fileIDs.RemoveFiles(folder, len(folder.files))
+        for _folderName, childFolder in folder.folders:
+            fileIDs.RemoveFolder(childFolder)
+        self.paths.FolderCleared(folder)
+        self.SetItems(folder.files, 0, len(folder.files), [])
+        self.SetItems(folder.folders, 0, len(folder.folders), [])
+        self.observer.EndClearFolder(folder)
+
+    @Recorded('Import')
+    def Import(self, folder, importFolder):
+        # Merges a BatchImport tree into a folder: files with names already in the folder
+        # replace the existing ones and subfolders that already exist are merged into.
+        # Returns how many files were added and how many replaced.
+        fileIDs = self.FileIDs()
+        firstID = fileIDs.FirstID(folder)
+        added = 0
+        replaced = 0
+        pending = {}
+        newNames = []
+        newData = []
+
+        for fileName, _path, data in importFolder.files:
+            row = self.paths.FileRow(folder, fileName)
+
+            if row is not None:
+                self.ReplaceFile(firstID + row, data)
+                replaced += 1
+            elif fileName in pending:
+                newData[pending[fileName]] = data
+            else:
+                pending[fileName] = len(newNames)
+                newNames.append(fileName)
+                newData.append(data)
+
+        if newNames:
+            position = len(folder.files)
+
+            self.observer.BeginInsertFiles(folder, position, len(newNames))
+            self.SetFiles(firstID + position, firstID + position, newData)
+            fileIDs.AddFiles(folder, len(newNames))
+            self.SetItems(folder.files, position, position, newNames)
+            self.paths.FilesInserted(folder, position, newNames)
+            self.observer.EndInsertFiles(folder)
+            added += len(newNames)
+
+        for folderName, childImport in importFolder.folders:
+            childFolder = self.paths.ChildFolder(folder, folderName)
+
+            if childFolder is not None:
+                childAdded, childReplaced = self.Import(childFolder, childImport)
+                added += childAdded
+                replaced += childReplaced
+            else:
+                self.AttachFolder(folder, folderName, self.AppendImportedFolder(childImport))
+                added += sum(1 for _entry in childImport.AllFiles())
+
+        return added, replaced
+
+    def AppendImportedFolder(self, importFolder):
+        # New folders take the IDs after every existing file, in preorder. Only the files
+        # are recorded, as the folder is new until it's attached.
+        import ndspy.fnt
+
+        fileCount = len(self.rom.files)
+        newFolder = ndspy.fnt.Folder(files=[entry[0] for entry in importFolder.files], firstID=fileCount)
+        self.SetFiles(fileCount, fileCount, [entry[2] for entry in importFolder.files])
+        self.FileIDs().AppendSegment(newFolder, len(newFolder.files))
+
+        for folderName, childImport in importFolder.folders:
+            newFolder.folders.append((folderName, self.AppendImportedFolder(childImport)))
+
+        return newFolder
+
+    # Overlays
+
+    @Recorded('Add overlay')
+    def InsertOverlay(self, processor, afterID):
+        # Adds an empty overlay after the given one (-1 for the start), renumbering the ones
+        # after it. Returns the new overlay's ID.
+        import ndspy.code
+
+        overlays = self.OverlayObjects(processor)
+
+        newOverlays = {}
+        for key, overlay in overlays.items():
+            newOverlays[key + 1 if key > afterID else key] = overlay
+
+        newOverlay = ndspy.code.Overlay(b'', 0, 0, 0, 0, 0, len(self.rom.files), 0, 0)
+        newOverlays[afterID + 1] = newOverlay
+
+        fileCount = len(self.rom.files)
+        self.FileIDs().AppendSegment(newOverlay, 1)
+        self.SetFiles(fileCount, fileCount, [b''])
+        self.SetOverlays(processor, newOverlays)
+        self.observer.OverlayInserted(processor, afterID + 1)
+        return afterID + 1
+
+    @Recorded('Remove overlay')
+    def RemoveOverlay(self, processor, overlayID):
+        fileIDs = self.FileIDs()
+        overlays = self.OverlayObjects(processor)
+        overlay = overlays[overlayID]
+
+        fileID = fileIDs.FirstID(overlay)
+        self.SetFiles(fileID, fileID + 1, [])
+        fileIDs.RemoveSegment(overlay)
+        self.SetOverlays(processor, {key: ov for key, ov in overlays.items() if key != overlayID})
+        self.observer.OverlaysRemoved(processor)
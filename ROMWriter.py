@@ -0,0 +1,233 @@
+import os
+import struct
+import LazyROM
+import collections
+import ndspy.fnt
+
+from ndspy import _common
+from LazyROM import ICON_BANNER_LENGTHS
+from ExtractionEngine import HashData
+
+def ContentKeys(rom):
+    # A key for each file with the same size as another, equal for files with equal data.
+    # Only those files are hashed, and files still mapped from the same range only once.
+    files = rom.files
+    lazy = LazyROM.IsLazy(rom)
+    sizes = [files.FileSize(i) if lazy else len(files[i]) for i in range(len(files))]
+    counts = collections.Counter(sizes)
+    rangeDigests = {}
+    keys = {}
+
+    for fileID, size in enumerate(sizes):
+        if not size or counts[size] < 2:
+            continue
+
+        if not lazy:
+            digest = HashData(files[fileID])
+        elif files.IsMapped(fileID):
+            entry = files.entries[fileID]
+            digest = rangeDigests.get(entry)
+            if digest is None:
+                digest = rangeDigests[entry] = HashData(files[fileID])
+        else:
+            digest = files.store.Digest(files[fileID])
+
+        keys[fileID] = (size, digest)
+
+    return keys
+
+
+def LayOutROM(rom, deduplicate=False):
+    """
+    Works out where everything in a saved ROM goes, in the same layout ndspy's save
+    produces. Returns the header, the pieces that follow it in file order and the IDs of
+    the files that point at another file's data instead of having their own, which only
+    deduplicating does. File data is referenced rather than copied, and padding is the
+    only thing allocated here.
+    """
+    pieces = []
+    position = 0x200
+    fileOffsets = {}
+    keys = ContentKeys(rom) if deduplicate else {}
+    placed = {}
+    shared = []
+
+    def Add(data):
+        nonlocal position
+        pieces.append(data)
+        offset = position
+        position += len(data)
+        return offset
+
+    def Align(alignment, fill=b'\xFF'):
+        if position % alignment:
+            Add(fill * (alignment - position % alignment))
+
+    def AddFile(fileID):
+        # Files with the same data as one already laid out point at it instead.
+        key = keys.get(fileID)
+        if key in placed:
+            fileOffsets[fileID] = placed[key]
+            shared.append(fileID)
+            return
+
+        Align(0x200)
+        fileOffsets[fileID] = Add(rom.files[fileID])
+        if key is not None:
+            placed[key] = fileOffsets[fileID]
+
+    Add(rom.pad200)
+    Align(0x4000, b'\0')
+
+    arm9Offset = Add(rom.arm9)
+    Add(rom.arm9PostData)
+    Align(0x200)
+
+    arm9OvTOffset = 0
+    if rom.arm9OverlayTable:
+        arm9OvTOffset = Add(rom.arm9OverlayTable)
+        Align(0x200)
+
+    for i in range(0, len(rom.arm9OverlayTable), 32):
+        AddFile(struct.unpack_from('<I', rom.arm9OverlayTable, i + 0x18)[0])
+    Align(0x200)
+
+    arm7Offset = Add(rom.arm7)
+    Align(0x200)
+
+    arm7OvTOffset = 0
+    if rom.arm7OverlayTable:
+        arm7OvTOffset = Add(rom.arm7OverlayTable)
+        Align(0x200)
+
+    for i in range(0, len(rom.arm7OverlayTable), 32):
+        AddFile(struct.unpack_from('<I', rom.arm7OverlayTable, i + 0x18)[0])
+    Align(0x200)
+
+    fnt = ndspy.fnt.save(rom.filenames)
+    fntOffset = Add(fnt)
+    Align(0x200)
+
+    # Filled in once every file has an offset.
+    fat = bytearray(8 * len(rom.files))
+    fatOffset = Add(fat)
+    Align(0x200)
+
+    iconBannerOffset = 0
+    if rom.iconBanner:
+        version, = struct.unpack_from('<H', rom.iconBanner, 0)
+        if len(rom.iconBanner) != ICON_BANNER_LENGTHS.get(version, ICON_BANNER_LENGTHS[1]):
+            raise ValueError('Icon banner length is wrong (version ' + hex(version) + ', length ' + hex(len(rom.iconBanner)) + ')')
+        iconBannerOffset = Add(rom.iconBanner)
+        Align(0x200)
+
+    debugRomOffset = 0
+    if rom.debugRom:
+        debugRomOffset = Add(rom.debugRom)
+        Align(0x200)
+
+    def RemainingFileIDs():
+        for fileID in rom.sortedFileIds:
+            if fileID not in fileOffsets and fileID < len(rom.files):
+                yield fileID
+        for fileID in range(len(rom.files)):
+            if fileID not in fileOffsets:
+                yield fileID
+
+    for fileID in RemainingFileIDs():
+        AddFile(fileID)
+
+    for fileID in range(len(rom.files)):
+        struct.pack_into('<II', fat, 8 * fileID, fileOffsets[fileID], fileOffsets[fileID] + len(rom.files[fileID]))
+
+    Align(0x20, b'\0')
+    rsaSignatureOffset = Add(rom.rsaSignature)
+
+    # Saving stores the RSA signature offset at 0x1000 for compatibility with NSMBe. That
+    # is always within the post-header padding or the alignment after it.
+    offset = 0x200
+    for i, piece in enumerate(pieces):
+        if offset + len(piece) >= 0x1004:
+            piece = pieces[i] = bytearray(piece)
+            struct.pack_into('<I', piece, 0x1000 - offset, rsaSignatureOffset)
+            break
+        offset += len(piece)
+
+    if len(rom.pad088) != 0x38 or len(rom.nintendoLogo) != 0x9C or len(rom.pad16C) != 0x94:
+        raise ValueError('ROM header fields have the wrong length')
+
+    header = bytearray(0x200)
+    struct.pack_into('<12s4s2s3B', header, 0, rom.name.ljust(12, b'\0')[:12], rom.idCode, rom.developerCode,
+                     rom.unitCode, rom.encryptionSeedSelect, rom.deviceCapacity)
+    struct.pack_into('<11B', header, 0x15, rom.pad015, rom.pad016, rom.pad017, rom.pad018, rom.pad019,
+                     rom.pad01A, rom.pad01B, rom.pad01C, rom.region, rom.version, rom.autostart)
+    struct.pack_into('<16I', header, 0x20,
+                     arm9Offset, rom.arm9EntryAddress, rom.arm9RamAddress, len(rom.arm9),
+                     arm7Offset, rom.arm7EntryAddress, rom.arm7RamAddress, len(rom.arm7),
+                     fntOffset, len(fnt), fatOffset, len(fat),
+                     arm9OvTOffset, len(rom.arm9OverlayTable), arm7OvTOffset, len(rom.arm7OverlayTable))
+    struct.pack_into('<3I2H2I8s2I', header, 0x60,
+                     rom.normalCardControlRegisterSettings, rom.secureCardControlRegisterSettings, iconBannerOffset,
+                     rom.secureAreaChecksum, rom.secureTransferDelay,
+                     rom.arm9CodeSettingsPointerAddress, rom.arm7CodeSettingsPointerAddress,
+                     rom.secureAreaDisable.ljust(8, b'\0')[:8], rsaSignatureOffset, 0x4000)
+    header[0x88 : 0x15C] = rom.pad088 + rom.nintendoLogo
+    struct.pack_into('<H', header, 0x15C, _common.crc16(rom.nintendoLogo))
+    struct.pack_into('<H', header, 0x15E, _common.crc16(header[0 : 0x15E]))
+    struct.pack_into('<3I', header, 0x160, debugRomOffset, len(rom.debugRom), rom.debugRomAddress)
+    header[0x16C : 0x200] = rom.pad16C
+
+    return header, pieces, shared
+
+
+def WriteROM(rom, f, deduplicate=False):
+    # Pieces are written one at a time straight from where they live, so saving never
+    # holds a second copy of the ROM in memory. Returns the IDs of the files sharing data.
+    header, pieces, shared = LayOutROM(rom, deduplicate)
+    f.write(header)
+
+    for piece in pieces:
+        f.write(piece)
+
+    return shared
+
+
+def SaveROM(rom, fileName, deduplicate=False):
+    """
+    Saves the ROM, in place if it was mapped from the file and nothing grew too much; a
+    save in place that's interrupted, unlike a full rewrite, leaves a damaged file.
+    Deduplicating always rewrites the ROM, with files that have the same data pointing
+    at one copy of it. Returns the IDs of the files that share another's data.
+    """
+    if not deduplicate and LazyROM.PatchROM(rom, fileName):
+        return []
+
+    # The ROM is written next to its destination and renamed over it, so a failed save never
+    # leaves a half-written file behind, and the unchanged files of a lazily loaded ROM, which
+    # are still views of the old image, stay valid throughout.
+    tempName = fileName + '.tmp'
+    with open(tempName, 'wb') as f:
+        try:
+            shared = WriteROM(rom, f, deduplicate)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(tempName)
+            raise
+
+    if not LazyROM.IsLazy(rom):
+        os.replace(tempName, fileName)
+        return shared
+
+    try:
+        os.replace(tempName, fileName)
+    except PermissionError:
+        # Windows refuses to replace a file that is still mapped.
+        rom.files.Detach()
+        os.replace(tempName, fileName)
+
+    rom.files.Remap(fileName)
+    rom.sortedFileIds = sorted(range(len(rom.files)), key=lambda i: rom.files.entries[i][0])
+
+    return shared
@@ -0,0 +1,133 @@
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from ExtractionEngine import ExtractionManifest, HashData, MainCodeFileName, OverlayFileName
+
+class ReplacementCancelled(Exception):
+    pass
+
+
+class ReplacementPlan:
+
+    # The files a replace will look for on disk, each with the data currently in the ROM and
+    # where new data goes: a file ID, the name of a ROM attribute for the main code files, or
+    # an overlay, whose decoded data is replaced.
+
+    def __init__(self, root):
+        self.root = root
+        self.files = []
+
+    def AddFile(self, path, data, fileID=None, attribute=None, overlay=None):
+        self.files.append((path, data, fileID, attribute, overlay))
+
+    def AddFolder(self, rom, folder, dirPath):
+        for i, fileName in enumerate(folder.files):
+            fileID = folder.firstID + i
+            self.AddFile(os.path.join(dirPath, fileName), rom.files[fileID], fileID)
+
+        for folderName, childFolder in folder.folders:
+            self.AddFolder(rom, childFolder, os.path.join(dirPath, folderName))
+
+    def AddCodeFolder(self, rom, processor, overlays, dirPath):
+        attribute = 'arm' + str(int(processor))
+        self.AddFile(os.path.join(dirPath, MainCodeFileName(processor)), getattr(rom, attribute), attribute=attribute)
+
+        for i, ov in overlays.items():
+            # Compared against the overlay data, since that is what extraction writes out.
+            self.AddFile(os.path.join(dirPath, OverlayFileName(processor, i)), ov.data, overlay=ov)
+
+
+class ReplacementEngine:
+
+    def __init__(self, plan, reporter=None, maxWorkers=None):
+        self.plan = plan
+        self.reporter = reporter
+        self.maxWorkers = maxWorkers or min(32, (os.cpu_count() or 1) * 4)
+        self.manifest = None
+        self.cancelEvent = threading.Event()
+        self.lock = threading.Lock()
+        self.changes = []
+        self.unchangedCount = 0
+        self.missingCount = 0
+
+    def Cancel(self):
+        self.cancelEvent.set()
+
+    def ReadIfChanged(self, path, data):
+        # Returns the file's content if it differs from the ROM data, or None if it does not.
+        # Files extracted by an incremental extraction and left untouched since are recognised
+        # from the manifest without being read.
+        st = os.stat(path)
+
+        if st.st_size == len(data):
+            entry = self.manifest.Get(path)
+            if entry is not None and entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime_ns:
+                if entry.get('hash') == HashData(data):
+                    return None
+
+        with open(path, 'rb') as f:
+            fileData = f.read()
+
+        if len(fileData) == len(data) and fileData == data:
+            return None
+
+        return fileData
+
+    def CheckFile(self, entry):
+        if self.cancelEvent.is_set():
+            return
+
+        path, data, fileID, attribute, overlay = entry
+
+        try:
+            fileData = self.ReadIfChanged(path, data)
+        except FileNotFoundError:
+            with self.lock:
+                self.missingCount += 1
+        else:
+            with self.lock:
+                if fileData is None:
+                    self.unchangedCount += 1
+                else:
+                    self.changes.append((fileID, attribute, overlay, fileData))
+
+        if self.reporter is not None:
+            self.reporter.Advance(1)
+
+    def Run(self):
+        self.manifest = ExtractionManifest.Load(self.plan.root)
+
+        with ThreadPoolExecutor(self.maxWorkers) as pool:
+            for future in [pool.submit(self.CheckFile, entry) for entry in self.plan.files]:
+                future.result()
+
+        if self.cancelEvent.is_set():
+            raise ReplacementCancelled
+
+    def Apply(self, rom, replaceFile, replaceOverlay):
+        # Files get their new data through replaceFile(fileID, data) and overlays through
+        # replaceOverlay(overlay, data).
+        for fileID, attribute, overlay, fileData in self.changes:
+            if overlay is not None:
+                replaceOverlay(overlay, fileData)
+            elif attribute is None:
+                replaceFile(fileID, fileData)
+            else:
+                setattr(rom, attribute, fileData)
+
+        return len(self.changes)
+
+    def ChangedFileIDs(self):
+        return {fileID for fileID, _attribute, _overlay, _fileData in self.changes if fileID is not None}
+
+    def ChangedAttributes(self):
+        return {attribute for _fileID, attribute, _overlay, _fileData in self.changes if attribute is not None}
+
+    def Summary(self):
+        summary = str(len(self.changes)) + ' files changed, ' + str(self.unchangedCount) + ' unchanged'
+
+        if self.missingCount:
+            summary += ', ' + str(self.missingCount) + ' not found'
+
+        return summary + '.'